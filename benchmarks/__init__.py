@@ -0,0 +1 @@
+"""Local load-test and benchmark suite for the Photure services."""
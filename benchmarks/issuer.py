@@ -0,0 +1,35 @@
+"""Stand-in for Clerk: an RSA key pair whose JWKS auth-service loads via CLERK_JWKS_FILE."""
+
+import json
+import time
+from pathlib import Path
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+KEY_ID = "bench-key"
+TOKEN_TTL_SECONDS = 6 * 3600
+
+
+class StubIssuer:
+    def __init__(self, authorized_party: str) -> None:
+        self.authorized_party = authorized_party
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    def write_jwks(self, path: Path) -> Path:
+        jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(self.private_key.public_key()))
+        jwk.update({"kid": KEY_ID, "use": "sig", "alg": "RS256"})
+        path.write_text(json.dumps({"keys": [jwk]}))
+        return path
+
+    def mint(self, user_id: str) -> str:
+        now = int(time.time())
+        claims = {
+            "sub": user_id,
+            "sid": f"sess_{user_id}",
+            "azp": self.authorized_party,
+            "iat": now,
+            "nbf": now,
+            "exp": now + TOKEN_TTL_SECONDS,
+        }
+        return jwt.encode(claims, self.private_key, algorithm="RS256", headers={"kid": KEY_ID})
@@ -0,0 +1,97 @@
+"""Summaries, result files and baseline comparison."""
+
+import json
+import math
+from pathlib import Path
+
+# Latency changes smaller than this are noise on a local run, whatever the ratio.
+MIN_LATENCY_DELTA_MS = 1.0
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(fraction * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: list[float], statuses: list[int], duration: float, rss: dict[str, dict]) -> dict:
+    ok = sorted(latency * 1000 for latency, status in zip(latencies, statuses) if status < 400)
+    errors: dict[str, int] = {}
+    for status in statuses:
+        if status >= 400 or status == 0:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+    return {
+        "requests": len(statuses),
+        "errors": sum(errors.values()),
+        "error_statuses": errors,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(ok) / duration, 2) if duration else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(ok, 0.50), 2),
+            "p95": round(percentile(ok, 0.95), 2),
+            "p99": round(percentile(ok, 0.99), 2),
+            "mean": round(sum(ok) / len(ok), 2) if ok else 0.0,
+            "max": round(ok[-1], 2) if ok else 0.0,
+        },
+        "rss_mb": rss,
+    }
+
+
+def save(results: dict, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2) + "\n")
+
+
+def load(path: Path) -> dict:
+    return json.loads(Path(path).read_text())
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """Return one line per metric that got worse by more than `threshold` (a ratio)."""
+    regressions = []
+    for name, now in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+        if before["throughput_rps"] and now["throughput_rps"] < before["throughput_rps"] * (1 - threshold):
+            regressions.append(
+                f"{name}: throughput {before['throughput_rps']} -> {now['throughput_rps']} rps"
+            )
+        for key in ("p50", "p95", "p99"):
+            old, new = before["latency_ms"][key], now["latency_ms"][key]
+            if new - old > MIN_LATENCY_DELTA_MS and new > old * (1 + threshold):
+                regressions.append(f"{name}: {key} {old} -> {new} ms")
+        if now["errors"] > before["errors"]:
+            regressions.append(f"{name}: errors {before['errors']} -> {now['errors']}")
+        for service, usage in now.get("rss_mb", {}).items():
+            old_peak = before.get("rss_mb", {}).get(service, {}).get("peak")
+            if old_peak and usage["peak"] > old_peak * (1 + threshold):
+                regressions.append(f"{name}: {service} peak RSS {old_peak} -> {usage['peak']} MB")
+    return regressions
+
+
+def format_table(results: dict, baseline: dict | None = None) -> str:
+    header = f"{'scenario':<18}{'req':>6}{'err':>5}{'rps':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'gw MB':>8}{'media MB':>10}"
+    lines = [header, "-" * len(header)]
+    for name, stats in results["scenarios"].items():
+        latency = stats["latency_ms"]
+        rss = stats["rss_mb"]
+        lines.append(
+            f"{name:<18}{stats['requests']:>6}{stats['errors']:>5}{stats['throughput_rps']:>10}"
+            f"{latency['p50']:>9}{latency['p95']:>9}{latency['p99']:>9}"
+            f"{rss['gateway']['peak']:>8}{rss['media']['peak']:>10}"
+        )
+        before = (baseline or {}).get("scenarios", {}).get(name)
+        if before:
+            change = (
+                (stats["throughput_rps"] / before["throughput_rps"] - 1) * 100 if before["throughput_rps"] else 0.0
+            )
+            lines.append(
+                f"{'  vs baseline':<18}{'':>11}{change:>+9.1f}%"
+                f"{latency['p50'] - before['latency_ms']['p50']:>+9.1f}"
+                f"{latency['p95'] - before['latency_ms']['p95']:>+9.1f}"
+                f"{latency['p99'] - before['latency_ms']['p99']:>+9.1f}"
+            )
+    return "\n".join(lines)
@@ -0,0 +1,199 @@
+"""Run the benchmark suite against a freshly started local stack.
+
+    python -m benchmarks.run                              # all scenarios, in-memory Mongo
+    python -m benchmarks.run --mongo-url mongodb://localhost:27017 --requests 1000
+    python -m benchmarks.run --baseline benchmarks/results/main.json
+    python -m benchmarks.run --transport inprocess         # monolith mode
+    python -m benchmarks.run compare OLD.json NEW.json
+
+Results are written as JSON (benchmarks/results/<timestamp>.json by default).
+With --baseline, regressions beyond --threshold are listed and the exit code
+is 1, so the suite can gate a CI job.
+"""
+
+import argparse
+import asyncio
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+from . import report
+from .scenarios import SCENARIOS, BenchContext, Scenario, images_needed, make_image, upload_single
+from .stack import LocalStack
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+RSS_SAMPLE_INTERVAL_SECONDS = 0.1
+SAMPLED_SERVICES = ("gateway", "media")
+
+
+async def drive(ctx: BenchContext, operation, count: int, concurrency: int) -> tuple[list[float], list[int], float]:
+    """Run `count` operations with at most `concurrency` in flight; 0 marks a transport error."""
+    latencies = [0.0] * count
+    statuses = [0] * count
+    next_index = 0
+
+    async def worker() -> None:
+        nonlocal next_index
+        while next_index < count:
+            index = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                statuses[index] = await operation(ctx, index)
+            except httpx.HTTPError:
+                statuses[index] = 0
+            latencies[index] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, count))))
+    return latencies, statuses, time.perf_counter() - started
+
+
+async def sample_rss(stack: LocalStack, peaks: dict[str, int], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        for name in SAMPLED_SERVICES:
+            peaks[name] = max(peaks[name], await asyncio.to_thread(stack.rss_bytes, name))
+        try:
+            await asyncio.wait_for(stop.wait(), RSS_SAMPLE_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_scenario(stack: LocalStack, ctx: BenchContext, scenario: Scenario, args) -> dict:
+    count = max(int(args.requests * scenario.scale), 1)
+    if scenario.setup:
+        await scenario.setup(ctx, count)
+
+    peaks = {name: stack.rss_bytes(name) for name in SAMPLED_SERVICES}
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_rss(stack, peaks, stop))
+    try:
+        latencies, statuses, duration = await drive(ctx, scenario.run, count, args.concurrency)
+    finally:
+        stop.set()
+        await sampler
+
+    megabytes = 1024 * 1024
+    rss = {
+        name: {"peak": round(peaks[name] / megabytes, 1), "end": round(stack.rss_bytes(name) / megabytes, 1)}
+        for name in SAMPLED_SERVICES
+    }
+    return report.summarize(latencies, statuses, duration, rss)
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_suite(stack: LocalStack, scenarios: list[Scenario], args) -> dict:
+    tokens = [stack.issuer.mint(f"bench_user_{n}") for n in range(args.users)]
+    # Image encoding is client work; do it before anything is timed.
+    images = [make_image(args.seed * 1_000_003 + n) for n in range(images_needed(args.requests) + args.requests)]
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=stack.gateway_url, timeout=120, limits=limits) as client:
+        ctx = BenchContext(client=client, tokens=tokens, seed=args.seed, images=images)
+        if not any(scenario.name.startswith("upload") for scenario in scenarios):
+            # Read and delete scenarios need photos to work on.
+            await drive(ctx, upload_single, args.requests, args.concurrency)
+
+        results = {}
+        for scenario in scenarios:
+            results[scenario.name] = await run_scenario(stack, ctx, scenario, args)
+            print(f"  {scenario.name}: {results[scenario.name]['throughput_rps']} rps", file=sys.stderr)
+    return results
+
+
+def run(args) -> int:
+    selected = [scenario for scenario in SCENARIOS if not args.scenarios or scenario.name in args.scenarios]
+    unknown = set(args.scenarios or ()) - {scenario.name for scenario in SCENARIOS}
+    if unknown:
+        print(f"Unknown scenarios: {', '.join(sorted(unknown))}", file=sys.stderr)
+        return 2
+
+    with tempfile.TemporaryDirectory(prefix="photure-bench-") as workdir:
+        print(f"Starting services in {workdir}", file=sys.stderr)
+        with LocalStack(Path(workdir), mongo_url=args.mongo_url, transport=args.transport) as stack:
+            scenario_results = asyncio.run(run_suite(stack, selected, args))
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mongo": "mongod" if args.mongo_url else "in-memory",
+            "transport": args.transport,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "users": args.users,
+            "seed": args.seed,
+        },
+        "scenarios": scenario_results,
+    }
+    output = args.output or RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    report.save(results, Path(output))
+
+    baseline = report.load(args.baseline) if args.baseline else None
+    print(report.format_table(results, baseline))
+    print(f"\nResults written to {output}")
+    return check_regressions(baseline, results, args.threshold) if baseline else 0
+
+
+def check_regressions(baseline: dict, current: dict, threshold: float) -> int:
+    mismatched = [
+        key for key in ("mongo", "transport", "requests", "concurrency", "users")
+        if baseline["meta"].get(key) != current["meta"].get(key)
+    ]
+    if mismatched:
+        print(f"\nWarning: baseline was run with different {', '.join(mismatched)}", file=sys.stderr)
+    regressions = report.compare(baseline, current, threshold)
+    if not regressions:
+        print(f"\nNo regressions beyond {threshold:.0%} against the baseline.")
+        return 0
+    print(f"\nRegressions beyond {threshold:.0%}:")
+    for line in regressions:
+        print(f"  {line}")
+    return 1
+
+
+def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        parser = argparse.ArgumentParser(prog="benchmarks.run compare")
+        parser.add_argument("baseline", type=Path)
+        parser.add_argument("current", type=Path)
+        parser.add_argument("--threshold", type=float, default=0.10)
+        args = parser.parse_args(sys.argv[2:])
+        current = report.load(args.current)
+        baseline = report.load(args.baseline)
+        print(report.format_table(current, baseline))
+        sys.exit(check_regressions(baseline, current, args.threshold))
+
+    parser = argparse.ArgumentParser(prog="benchmarks.run")
+    parser.add_argument("--scenarios", nargs="+", help=f"subset of: {' '.join(s.name for s in SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=200, help="operations per scenario (default 200)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mongo-url", help="use a real mongod instead of the in-memory fake")
+    parser.add_argument(
+        "--transport", choices=("http", "inprocess"), default="http", help="inprocess runs all services in the gateway"
+    )
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--baseline", type=Path, help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed regression ratio (default 0.10)")
+    sys.exit(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
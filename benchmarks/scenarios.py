@@ -0,0 +1,174 @@
+"""Benchmark scenarios, each a fixed number of operations against the gateway.
+
+Scenarios run in declaration order and build on each other: uploads create the
+photos the listing, serving and delete scenarios use.
+"""
+
+import io
+import random
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+import httpx
+from PIL import Image
+
+BATCH_SIZE = 10
+PAGE_SIZE = 20
+THUMBNAIL_SIZE = 256
+
+
+def make_image(seed: int, width: int = 1280, height: int = 960) -> bytes:
+    """A deterministic, photo-sized JPEG; every seed gives distinct bytes, so nothing dedups."""
+    rng = random.Random(seed)
+    coarse = Image.frombytes("RGB", (64, 48), rng.randbytes(64 * 48 * 3))
+    image = coarse.resize((width, height), Image.Resampling.BICUBIC)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+@dataclass
+class BenchContext:
+    client: httpx.AsyncClient
+    tokens: list[str]
+    seed: int
+    photos: dict[int, list[str]] = field(default_factory=dict)
+    deep_cursors: dict[int, str] = field(default_factory=dict)
+    images: list[bytes] = field(default_factory=list)
+    next_image: int = 0
+
+    def user(self, index: int) -> int:
+        return index % len(self.tokens)
+
+    def headers(self, user: int) -> dict[str, str]:
+        return {"Authorization": f"Bearer {self.tokens[user]}"}
+
+    def take_image(self) -> bytes:
+        image = self.images[self.next_image]
+        self.next_image += 1
+        return image
+
+    def pick_photo(self, index: int) -> tuple[int, str]:
+        user = self.user(index)
+        photos = self.photos[user]
+        return user, photos[random.Random(self.seed + index).randrange(len(photos))]
+
+
+Operation = Callable[[BenchContext, int], Awaitable[int]]
+
+
+@dataclass
+class Scenario:
+    name: str
+    run: Operation
+    # Operations per run, as a fraction of --requests.
+    scale: float = 1.0
+    setup: Callable[[BenchContext, int], Awaitable[None]] | None = None
+
+
+def photo_ids(response: httpx.Response) -> list[str]:
+    if response.status_code != 200:
+        return []
+    body = response.json()
+    if "results" in body:
+        return [result["photo"]["id"] for result in body["results"] if result.get("photo")]
+    return [body["id"]]
+
+
+async def upload_single(ctx: BenchContext, index: int) -> int:
+    user = ctx.user(index)
+    response = await ctx.client.post(
+        "/api/upload",
+        headers=ctx.headers(user),
+        files={"file": (f"single-{index}.jpg", ctx.take_image(), "image/jpeg")},
+    )
+    ctx.photos.setdefault(user, []).extend(photo_ids(response))
+    return response.status_code
+
+
+async def upload_batch(ctx: BenchContext, index: int) -> int:
+    user = ctx.user(index)
+    files = [("files", (f"batch-{index}-{n}.jpg", ctx.take_image(), "image/jpeg")) for n in range(BATCH_SIZE)]
+    response = await ctx.client.post("/api/upload/batch", headers=ctx.headers(user), files=files)
+    ctx.photos.setdefault(user, []).extend(photo_ids(response))
+    return response.status_code
+
+
+async def list_shallow(ctx: BenchContext, index: int) -> int:
+    user = ctx.user(index)
+    response = await ctx.client.get("/api/photos", headers=ctx.headers(user), params={"limit": PAGE_SIZE})
+    return response.status_code
+
+
+async def list_deep_skip(ctx: BenchContext, index: int) -> int:
+    user = ctx.user(index)
+    skip = max(len(ctx.photos[user]) - PAGE_SIZE, 0)
+    response = await ctx.client.get(
+        "/api/photos", headers=ctx.headers(user), params={"limit": PAGE_SIZE, "skip": skip}
+    )
+    return response.status_code
+
+
+async def find_deep_cursors(ctx: BenchContext, requests: int) -> None:
+    """Walk every user's listing once to find the cursor for their last full page."""
+    for user in range(len(ctx.tokens)):
+        cursor = previous = None
+        while True:
+            params = {"limit": PAGE_SIZE, **({"cursor": cursor} if cursor else {})}
+            response = await ctx.client.get("/api/photos", headers=ctx.headers(user), params=params)
+            response.raise_for_status()
+            next_cursor = response.json().get("next_cursor")
+            if not next_cursor:
+                break
+            previous, cursor = cursor, next_cursor
+        if previous:
+            ctx.deep_cursors[user] = previous
+
+
+async def list_deep_cursor(ctx: BenchContext, index: int) -> int:
+    user = ctx.user(index)
+    params = {"limit": PAGE_SIZE}
+    if user in ctx.deep_cursors:
+        params["cursor"] = ctx.deep_cursors[user]
+    response = await ctx.client.get("/api/photos", headers=ctx.headers(user), params=params)
+    return response.status_code
+
+
+async def _serve(ctx: BenchContext, index: int, params: dict) -> int:
+    user, photo_id = ctx.pick_photo(index)
+    async with ctx.client.stream("GET", f"/api/serve/{photo_id}", headers=ctx.headers(user), params=params) as response:
+        async for _ in response.aiter_raw():
+            pass
+    return response.status_code
+
+
+async def serve_original(ctx: BenchContext, index: int) -> int:
+    return await _serve(ctx, index, {})
+
+
+async def serve_thumbnail(ctx: BenchContext, index: int) -> int:
+    return await _serve(ctx, index, {"size": THUMBNAIL_SIZE})
+
+
+async def delete(ctx: BenchContext, index: int) -> int:
+    user = ctx.user(index)
+    photo_id = ctx.photos[user].pop()
+    response = await ctx.client.delete(f"/api/photos/{photo_id}", headers=ctx.headers(user))
+    return response.status_code
+
+
+SCENARIOS = [
+    Scenario("upload_single", upload_single),
+    Scenario("upload_batch", upload_batch, scale=1 / BATCH_SIZE),
+    Scenario("list_shallow", list_shallow),
+    Scenario("list_deep_skip", list_deep_skip),
+    Scenario("list_deep_cursor", list_deep_cursor, setup=find_deep_cursors),
+    Scenario("serve_original", serve_original),
+    Scenario("serve_thumbnail", serve_thumbnail),
+    # Half the photos, so every user still has some left whatever --users is.
+    Scenario("delete", delete, scale=0.5),
+]
+
+
+def images_needed(requests: int) -> int:
+    return requests + max(int(requests / BATCH_SIZE), 1) * BATCH_SIZE
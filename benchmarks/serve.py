@@ -0,0 +1,36 @@
+"""Run one service under uvicorn for the benchmark stack.
+
+    python -m benchmarks.serve services.gallery_service.app.main:app --port 8020 [--memory-mongo]
+
+With --memory-mongo the shared Motor client is replaced by mongomock before the
+app starts. Each process gets its own in-memory database, which works because
+media-service and gallery-service never read each other's collections.
+"""
+
+import argparse
+import importlib
+
+import uvicorn
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("app")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--memory-mongo", action="store_true")
+    args = parser.parse_args()
+
+    if args.memory_mongo:
+        from mongomock_motor import AsyncMongoMockClient
+
+        import services.common.mongo as mongo
+
+        mongo._client = AsyncMongoMockClient()
+
+    module_name, _, attribute = args.app.partition(":")
+    app = getattr(importlib.import_module(module_name), attribute)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Start all four services as local processes wired to each other."""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import httpx
+import psutil
+
+from .issuer import StubIssuer
+
+AUTHORIZED_PARTY = "http://localhost"
+SERVICES = {
+    "auth": "services.auth_service.app.main:app",
+    "gallery": "services.gallery_service.app.main:app",
+    "media": "services.media_service.app.main:app",
+    "gateway": "services.api_gateway.app.main:app",
+}
+STARTUP_TIMEOUT_SECONDS = 60
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@dataclass
+class LocalStack:
+    workdir: Path
+    mongo_url: str | None = None
+    env_overrides: dict[str, str] = field(default_factory=dict)
+    # "inprocess" starts only the gateway, which then hosts the other services.
+    transport: str = "http"
+    issuer: StubIssuer = field(default_factory=lambda: StubIssuer(AUTHORIZED_PARTY))
+    ports: dict[str, int] = field(default_factory=dict)
+    processes: dict[str, subprocess.Popen] = field(default_factory=dict)
+
+    @property
+    def services(self) -> dict[str, str]:
+        if self.transport == "inprocess":
+            return {"gateway": SERVICES["gateway"]}
+        return SERVICES
+
+    @property
+    def gateway_url(self) -> str:
+        return f"http://127.0.0.1:{self.ports['gateway']}"
+
+    def environment(self) -> dict[str, str]:
+        env = {
+            **os.environ,
+            "PYTHONPATH": str(Path(__file__).resolve().parent.parent),
+            "ENVIRONMENT": "benchmark",
+            "LOG_LEVEL": "WARNING",
+            "CLERK_SECRET_KEY": "",
+            "CLERK_JWKS_FILE": str(self.issuer.write_jwks(self.workdir / "jwks.json")),
+            "AUTHORIZED_PARTY": AUTHORIZED_PARTY,
+            "UPLOAD_DIR": str(self.workdir / "uploads"),
+            "DATABASE_NAME": "photure_bench",
+            "AUTH_SERVICE_URL": f"http://127.0.0.1:{self.ports['auth']}",
+            "GALLERY_SERVICE_URL": f"http://127.0.0.1:{self.ports['gallery']}",
+            "MEDIA_SERVICE_URL": f"http://127.0.0.1:{self.ports['media']}",
+            "UPSTREAM_TRANSPORT": self.transport,
+            "TRACE_EXPORTER": "none",
+            # Measure capacity, not the per-user rate limits; concurrency caps stay on.
+            "UPLOAD_RATE_PER_SECOND": "0",
+            "SERVE_RATE_PER_SECOND": "0",
+            # Eager variants render in media-service, as they did before the job queue.
+            "JOB_WORKER_EMBEDDED": "true",
+            "JOB_POLL_SECONDS": "0.2",
+        }
+        env.pop("CLERK_JWT_KEY", None)
+        env.pop("CLERK_JWKS", None)
+        env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+        if self.mongo_url:
+            env["MONGODB_URL"] = self.mongo_url
+        env.update(self.env_overrides)
+        return env
+
+    def start(self) -> None:
+        self.ports = {name: free_port() for name in SERVICES}
+        env = self.environment()
+        logs = self.workdir / "logs"
+        logs.mkdir(parents=True, exist_ok=True)
+        for name, target in self.services.items():
+            command = [sys.executable, "-m", "benchmarks.serve", target, "--port", str(self.ports[name])]
+            if not self.mongo_url:
+                command.append("--memory-mongo")
+            self.processes[name] = subprocess.Popen(
+                command,
+                env=env,
+                cwd=env["PYTHONPATH"],
+                stdout=open(logs / f"{name}.log", "wb"),
+                stderr=subprocess.STDOUT,
+            )
+        self.wait_ready()
+
+    def wait_ready(self) -> None:
+        deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+        pending = set(self.services)
+        with httpx.Client(timeout=2) as client:
+            while pending:
+                for name in sorted(pending):
+                    if self.processes[name].poll() is not None:
+                        raise RuntimeError(f"{name} exited during startup; see {self.workdir / 'logs' / name}.log")
+                    try:
+                        if client.get(f"http://127.0.0.1:{self.ports[name]}/health").status_code == 200:
+                            pending.discard(name)
+                    except httpx.TransportError:
+                        pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Services not ready after {STARTUP_TIMEOUT_SECONDS}s: {sorted(pending)}")
+                time.sleep(0.2)
+
+    def rss_bytes(self, name: str) -> int:
+        """Resident memory of a service including its children (media's variant workers)."""
+        if name not in self.processes:
+            return 0
+        try:
+            process = psutil.Process(self.processes[name].pid)
+            return sum(proc.memory_info().rss for proc in [process, *process.children(recursive=True)])
+        except psutil.Error:
+            return 0
+
+    def stop(self) -> None:
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def __enter__(self) -> "LocalStack":
+        try:
+            self.start()
+        except BaseException:
+            self.stop()
+            raise
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
@@ -10,7 +10,7 @@ import { usePhoto } from '@/hooks/usePhoto';
 import { useSidebar } from '@/components/ui/sidebar';
 
 export function SidebarUpload() {
-  const { uploadPhoto } = usePhoto();
+  const { uploadPhotos } = usePhoto();
   const { state } = useSidebar();
   const isCollapsed = state === "collapsed";
 
@@ -22,13 +22,19 @@ export function SidebarUpload() {
       onError: (file: File, error: Error) => void;
     }
   ) => {
-    for (const file of files) {
-      try {
-        await uploadPhoto(file);
-        options.onSuccess(file);
-      } catch (error) {
-        options.onError(file, error as Error);
-      }
+    try {
+      const results = await uploadPhotos(files, (progress) => {
+        files.forEach((file) => options.onProgress(file, progress));
+      });
+      results.forEach((result, index) => {
+        if (result.photo) {
+          options.onSuccess(files[index]);
+        } else {
+          options.onError(files[index], new Error(result.detail ?? 'Upload failed'));
+        }
+      });
+    } catch (error) {
+      files.forEach((file) => options.onError(file, error as Error));
     }
   };
 
@@ -22,8 +22,15 @@ export function PhotoCard({ photo, onClick, onDelete }: PhotoCardProps) {
 
   useEffect(() => {
     const loadImage = async () => {
+      const signedSrc = photoService.resolveSignedUrl(photo.thumbnail_url);
+      if (signedSrc) {
+        setImageSrc(signedSrc);
+        setIsLoading(false);
+        return;
+      }
+
       try {
-        const src = await photoService.createAuthenticatedImageSrc(photo.id, getToken);
+        const src = await photoService.createAuthenticatedImageSrc(photo.id, getToken, false, 256);
         setImageSrc(src);
         setIsLoading(false);
       } catch (err) {
@@ -41,7 +48,7 @@ export function PhotoCard({ photo, onClick, onDelete }: PhotoCardProps) {
         URL.revokeObjectURL(imageSrc);
       }
     };
-  }, [photo.id, getToken]);
+  }, [photo.id, photo.thumbnail_url, getToken]);
 
   const handleDownload = async (e: React.MouseEvent) => {
     e.stopPropagation();
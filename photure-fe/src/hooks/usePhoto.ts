@@ -2,7 +2,7 @@ import { useCallback } from 'react';
 import { useAuth } from '@clerk/clerk-react';
 import { usePhotoStore } from '@/stores/photoStore';
 import { photoService } from '@/services/photoService';
-import type { Photo } from '@/services/photoService';
+import type { BatchUploadResult, Photo } from '@/services/photoService';
 
 export function usePhoto() {
   const { getToken, isSignedIn } = useAuth();
@@ -66,6 +66,29 @@ export function usePhoto() {
     }
   }, [isSignedIn, getToken, addPhoto]);
 
+  // Upload several photos in one request and add the stored ones to the store
+  const uploadPhotos = useCallback(async (
+    files: File[],
+    onProgress?: (progress: number) => void
+  ): Promise<BatchUploadResult[]> => {
+    if (!isSignedIn) {
+      throw new Error('User not authenticated');
+    }
+
+    try {
+      const response = await photoService.uploadPhotos(files, getToken, onProgress);
+      response.results.forEach((result) => {
+        if (result.photo) {
+          addPhoto(result.photo);
+        }
+      });
+      return response.results;
+    } catch (error) {
+      console.error('Failed to upload photos:', error);
+      throw error;
+    }
+  }, [isSignedIn, getToken, addPhoto]);
+
   // Delete photo
   const deletePhoto = useCallback(async (photoId: string): Promise<void> => {
     if (!isSignedIn) {
@@ -120,6 +143,7 @@ export function usePhoto() {
     loadInitialPhotos,
     loadMorePhotos,
     uploadPhoto,
+    uploadPhotos,
     deletePhoto,
     downloadPhoto,
     updatePhoto,
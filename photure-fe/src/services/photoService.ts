@@ -12,11 +12,13 @@ export interface Photo {
   user_id: string;
   upload_date: string;
   url: string;
+  thumbnail_url?: string | null;
 }
 
 export interface PhotoListResponse {
   photos: Photo[];
   total: number;
+  next_cursor?: string | null;
 }
 
 export interface UploadResponse {
@@ -30,6 +32,19 @@ export interface UploadResponse {
   url: string;
 }
 
+export interface BatchUploadResult {
+  filename: string | null;
+  status_code: number;
+  photo: Photo | null;
+  detail: string | null;
+}
+
+export interface BatchUploadResponse {
+  results: BatchUploadResult[];
+  uploaded: number;
+  failed: number;
+}
+
 // Photo service functions that work with Clerk's getToken
 export const photoService = {
   /**
@@ -76,6 +91,34 @@ export const photoService = {
     }
   },
 
+  /**
+   * Upload several photo files in one request; results come back per file, in order
+   */
+  async uploadPhotos(
+    files: File[],
+    getToken: () => Promise<string | null>,
+    onProgress?: (progress: number) => void
+  ): Promise<BatchUploadResponse> {
+    return makeAuthenticatedRequest(
+      getToken,
+      async (api: AxiosInstance) => {
+        const formData = new FormData();
+        files.forEach((file) => formData.append('files', file));
+
+        return api.post('/api/upload/batch', formData, {
+          headers: {
+            'Content-Type': 'multipart/form-data',
+          },
+          onUploadProgress: (progressEvent) => {
+            if (progressEvent.total && onProgress) {
+              onProgress(Math.round((progressEvent.loaded * 100) / progressEvent.total));
+            }
+          },
+        });
+      }
+    );
+  },
+
   /**
    * Get list of photos for the authenticated user
    */
@@ -83,7 +126,8 @@ export const photoService = {
     getToken: () => Promise<string | null>,
     skip: number = 0, 
     limit: number = 20,
-    showToasts: boolean = true
+    showToasts: boolean = true,
+    cursor?: string | null
   ): Promise<PhotoListResponse> {
     let loadingToast: Id | null = null;
     
@@ -96,7 +140,8 @@ export const photoService = {
         getToken,
         async (api: AxiosInstance) => {
           return api.get('/api/photos', {
-            params: { skip, limit },
+            // Cursor pagination stays fast on deep pages; skip is only used without one.
+            params: cursor ? { cursor, limit } : { skip, limit },
           });
         }
       );
@@ -126,6 +171,19 @@ export const photoService = {
     return `${baseURL}/api/serve/${photoId}`;
   },
 
+  /**
+   * Resolve a signed media URL returned by the API into an absolute URL.
+   * Signed URLs need no Authorization header, so they can be used directly
+   * as an image source and cached by the browser.
+   */
+  resolveSignedUrl(url: string | null | undefined): string | null {
+    if (!url || !url.includes('sig=')) {
+      return null;
+    }
+    const baseURL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
+    return `${baseURL}${url}`;
+  },
+
   /**
    * Download photo file
    */
@@ -194,12 +252,14 @@ export const photoService = {
 
   /**
    * Create an authenticated image element for displaying photos
-   * This is a helper for rendering images that require authentication
+   * This is a helper for rendering images that require authentication.
+   * Pass `size` to fetch a downscaled variant instead of the original.
    */
   async createAuthenticatedImageSrc(
     photoId: string,
     getToken: () => Promise<string | null>,
-    showErrorToast: boolean = false
+    showErrorToast: boolean = false,
+    size?: number
   ): Promise<string> {
     try {
       const token = await getToken();
@@ -214,6 +274,7 @@ export const photoService = {
       const api = createAuthenticatedApi(token);
       const response = await api.get(`/api/serve/${photoId}`, {
         responseType: 'blob',
+        params: size ? { size } : undefined,
       });
 
       const blob = new Blob([response.data]);
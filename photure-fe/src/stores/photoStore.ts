@@ -10,6 +10,7 @@ interface PhotoState {
   error: string;
   hasMore: boolean;
   currentPage: number;
+  nextCursor: string | null;
   totalCount: number;
   
   // Actions
@@ -33,6 +34,7 @@ export const usePhotoStore = create<PhotoState>((set, get) => ({
   error: '',
   hasMore: true,
   currentPage: 0,
+  nextCursor: null,
   totalCount: 0,
 
   // Load photos with pagination
@@ -48,13 +50,15 @@ export const usePhotoStore = create<PhotoState>((set, get) => ({
         getToken,
         page * PHOTOS_PER_PAGE,
         PHOTOS_PER_PAGE,
-        !append // Show toasts only for initial load
+        !append, // Show toasts only for initial load
+        append ? get().nextCursor : null
       );
 
       set((state) => ({
         photos: append ? [...state.photos, ...response.photos] : response.photos,
-        hasMore: response.photos.length === PHOTOS_PER_PAGE,
+        hasMore: Boolean(response.next_cursor),
         currentPage: page,
+        nextCursor: response.next_cursor ?? null,
         totalCount: response.total,
         isLoading: false,
         isLoadingMore: false,
@@ -98,7 +102,7 @@ export const usePhotoStore = create<PhotoState>((set, get) => ({
   // Refresh photos (reload from beginning)
   refreshPhotos: async (getToken) => {
     const { loadPhotos } = get();
-    set({ currentPage: 0, hasMore: true });
+    set({ currentPage: 0, nextCursor: null, hasMore: true });
     await loadPhotos(getToken, 0, false);
   },
 
@@ -111,6 +115,7 @@ export const usePhotoStore = create<PhotoState>((set, get) => ({
       error: '',
       hasMore: true,
       currentPage: 0,
+      nextCursor: null,
       totalCount: 0
     });
   },
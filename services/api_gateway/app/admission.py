@@ -0,0 +1,378 @@
+"""Per-user admission control for uploads and media serving.
+
+Each request kind ("upload", "serve") has a per-user token bucket (requests per
+second with a burst) and global and per-user concurrency caps. A request that
+is over a limit waits, up to ADMISSION_MAX_WAIT_SECONDS and in a queue of at
+most ADMISSION_MAX_QUEUE, and is then turned away with 429 and Retry-After.
+
+Buckets live in memory by default; ADMISSION_STORE=redis shares them across
+gateway replicas. Concurrency caps are per gateway process: they protect that
+process's event loop and, scaled by the replica count, media-service's disks.
+"""
+
+import asyncio
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable
+
+from fastapi import HTTPException
+from starlette.background import BackgroundTasks
+from starlette.responses import Response, StreamingResponse
+
+from services.common.config import Settings
+from services.common.metrics import ADMISSION_ACTIVE, ADMISSION_QUEUED, ADMISSION_REJECTED
+
+
+class BucketStore(ABC):
+    """Token buckets keyed by an opaque string."""
+
+    @abstractmethod
+    async def reserve(
+        self, key: str, rate: float, burst: int, max_delay: float, cost: int = 1
+    ) -> tuple[bool, float]:
+        """Take `cost` tokens, borrowing against refills up to `max_delay` seconds ahead.
+
+        Returns (True, delay) when the caller may go ahead after sleeping
+        `delay`, or (False, retry_after) when it would have to wait longer;
+        a refused request takes nothing. An infinite `max_delay` always takes.
+        """
+
+    async def close(self) -> None:
+        pass
+
+
+def _take(tokens: float, rate: float, max_delay: float, cost: int = 1) -> tuple[bool, float, float]:
+    remaining = tokens - cost
+    delay = -remaining / rate if remaining < 0 else 0.0
+    if delay > max_delay:
+        return False, delay, tokens
+    return True, delay, remaining
+
+
+class MemoryBucketStore(BucketStore):
+    def __init__(self, max_entries: int = 100_000) -> None:
+        self.max_entries = max_entries
+        # key -> (tokens, last refill); LRU-bounded, an evicted user just starts full.
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def reserve(
+        self, key: str, rate: float, burst: int, max_delay: float, cost: int = 1
+    ) -> tuple[bool, float]:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        allowed, delay, tokens = _take(tokens, rate, max_delay, cost)
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_entries:
+            self._buckets.popitem(last=False)
+        return allowed, delay
+
+
+# Same arithmetic as _take, atomically on the Redis server's clock.
+RESERVE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local max_delay = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(now - updated, 0) * rate)
+local remaining = tokens - cost
+local delay = 0
+if remaining < 0 then delay = -remaining / rate end
+if max_delay >= 0 and delay > max_delay then
+    return {0, tostring(delay)}
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(remaining), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil((burst - remaining) / rate) + 1)
+return {1, tostring(delay)}
+"""
+
+
+class RedisBucketStore(BucketStore):
+    def __init__(self, url: str, prefix: str = "photure:admission:") -> None:
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+        self._script = self.client.register_script(RESERVE_SCRIPT)
+
+    async def reserve(
+        self, key: str, rate: float, burst: int, max_delay: float, cost: int = 1
+    ) -> tuple[bool, float]:
+        # The script reads a negative max_delay as unbounded.
+        max_delay = -1 if math.isinf(max_delay) else max_delay
+        allowed, delay = await self._script(keys=[self.prefix + key], args=[rate, burst, max_delay, cost])
+        return bool(allowed), float(delay)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def create_bucket_store(settings: Settings) -> BucketStore:
+    if settings.admission_store == "memory":
+        return MemoryBucketStore()
+    if settings.admission_store == "redis":
+        return RedisBucketStore(settings.admission_redis_url)
+    raise ValueError(f"Unknown ADMISSION_STORE {settings.admission_store!r}")
+
+
+def too_many_requests(detail: str, retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(max(math.ceil(retry_after), 1))},
+    )
+
+
+@dataclass
+class _Waiter:
+    user_id: str
+    future: asyncio.Future
+
+
+class ConcurrencyLimiter:
+    """Global and per-user caps on requests in progress, with a bounded FIFO queue.
+
+    A waiter whose user is at their own cap is skipped rather than blocking the
+    queue, so one heavy user cannot hold up everybody queued behind them.
+    """
+
+    def __init__(self, kind: str, max_active: int, max_active_per_user: int, max_queue: int) -> None:
+        self.kind = kind
+        self.max_active = max_active
+        self.max_active_per_user = max_active_per_user
+        self.max_queue = max_queue
+        self.active = 0
+        self._per_user: dict[str, int] = {}
+        self._waiters: deque[_Waiter] = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+
+    def _has_room(self, user_id: str) -> bool:
+        if self.max_active and self.active >= self.max_active:
+            return False
+        return not self.max_active_per_user or self._per_user.get(user_id, 0) < self.max_active_per_user
+
+    def _grant(self, user_id: str) -> None:
+        self.active += 1
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        self.admitted += 1
+        ADMISSION_ACTIVE.labels(self.kind).set(self.active)
+
+    async def acquire(self, user_id: str, timeout: float) -> None:
+        # Waiters left in the queue cannot use a free slot, so this does not jump ahead of them.
+        if self._has_room(user_id):
+            self._grant(user_id)
+            return
+        if len(self._waiters) >= self.max_queue or timeout <= 0:
+            self._reject("queue_full" if timeout > 0 else "concurrency")
+            raise too_many_requests(f"Too many concurrent {self.kind} requests", timeout)
+
+        waiter = _Waiter(user_id, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        self.queued += 1
+        ADMISSION_QUEUED.labels(self.kind).set(len(self._waiters))
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted just as we gave up: hand the slot on.
+                self.release(user_id)
+            else:
+                waiter.future.cancel()
+                self._waiters.remove(waiter)
+            ADMISSION_QUEUED.labels(self.kind).set(len(self._waiters))
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+            self._reject("concurrency")
+            raise too_many_requests(f"Too many concurrent {self.kind} requests", timeout) from None
+
+    def release(self, user_id: str) -> None:
+        self.active -= 1
+        remaining = self._per_user[user_id] - 1
+        if remaining:
+            self._per_user[user_id] = remaining
+        else:
+            del self._per_user[user_id]
+        self._wake()
+        ADMISSION_ACTIVE.labels(self.kind).set(self.active)
+
+    def _wake(self) -> None:
+        for waiter in list(self._waiters):
+            if self.max_active and self.active >= self.max_active:
+                break
+            if self._has_room(waiter.user_id):
+                self._waiters.remove(waiter)
+                self._grant(waiter.user_id)
+                waiter.future.set_result(None)
+        ADMISSION_QUEUED.labels(self.kind).set(len(self._waiters))
+
+    def _reject(self, reason: str) -> None:
+        self.rejected += 1
+        ADMISSION_REJECTED.labels(self.kind, reason).inc()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "max_active": self.max_active,
+            "max_active_per_user": self.max_active_per_user,
+            "active_users": len(self._per_user),
+            "queue_depth": len(self._waiters),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+        }
+
+
+@dataclass
+class RateLimit:
+    rate: float
+    burst: int
+
+
+class Lease:
+    """A held concurrency slot; release() may be called more than once."""
+
+    def __init__(self, limiter: ConcurrencyLimiter, user_id: str) -> None:
+        self.limiter = limiter
+        self.user_id = user_id
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.limiter.release(self.user_id)
+
+    def hold(self, response: Response) -> Response:
+        """Keep the slot until a streamed body has been sent, or release it now."""
+        if not isinstance(response, StreamingResponse):
+            self.release()
+            return response
+
+        body = response.body_iterator
+
+        async def body_then_release() -> AsyncIterator[bytes]:
+            try:
+                async for chunk in body:
+                    yield chunk
+            finally:
+                self.release()
+
+        # The background task covers a body that was never started.
+        tasks = BackgroundTasks()
+        if response.background is not None:
+            tasks.add_task(response.background)
+        tasks.add_task(self.release)
+        response.body_iterator = body_then_release()
+        response.background = tasks
+        return response
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        store: BucketStore,
+        rate_limits: dict[str, RateLimit],
+        limiters: dict[str, ConcurrencyLimiter],
+        max_wait: float,
+    ) -> None:
+        self.store = store
+        self.rate_limits = rate_limits
+        self.limiters = limiters
+        self.max_wait = max_wait
+        self.throttled = {kind: 0 for kind in rate_limits}
+        self.delayed = {kind: 0 for kind in rate_limits}
+
+    async def acquire(self, kind: str, user_id: str) -> Lease:
+        """Wait for the user's rate limit and a concurrency slot, or raise 429."""
+        deadline = time.monotonic() + self.max_wait
+        limit = self.rate_limits[kind]
+        if limit.rate > 0:
+            allowed, delay = await self.store.reserve(f"{kind}:{user_id}", limit.rate, limit.burst, self.max_wait)
+            if not allowed:
+                self.throttled[kind] += 1
+                ADMISSION_REJECTED.labels(kind, "rate").inc()
+                raise too_many_requests(f"{kind.capitalize()} rate limit exceeded", delay)
+            if delay > 0:
+                self.delayed[kind] += 1
+                await asyncio.sleep(delay)
+
+        limiter = self.limiters[kind]
+        await limiter.acquire(user_id, deadline - time.monotonic())
+        return Lease(limiter, user_id)
+
+    async def charge(self, kind: str, user_id: str, count: int) -> None:
+        """Take `count` more tokens for work already admitted (the rest of a
+        batch, say). Never waits or refuses; the user's next requests do."""
+        limit = self.rate_limits[kind]
+        if limit.rate > 0 and count > 0:
+            await self.store.reserve(f"{kind}:{user_id}", limit.rate, limit.burst, math.inf, cost=count)
+
+    @asynccontextmanager
+    async def admit(self, kind: str, user_id: str) -> AsyncIterator[None]:
+        lease = await self.acquire(kind, user_id)
+        try:
+            yield
+        finally:
+            lease.release()
+
+    async def respond(self, kind: str, user_id: str, respond: Callable[[], Awaitable[Response]]) -> Response:
+        """Admit, build the response, and hold the slot until its body is sent."""
+        lease = await self.acquire(kind, user_id)
+        try:
+            response = await respond()
+        except BaseException:
+            lease.release()
+            raise
+        return lease.hold(response)
+
+    def stats(self) -> dict:
+        return {
+            kind: {
+                "rate_per_second": self.rate_limits[kind].rate,
+                "burst": self.rate_limits[kind].burst,
+                "throttled": self.throttled[kind],
+                "delayed": self.delayed[kind],
+                **limiter.stats(),
+            }
+            for kind, limiter in self.limiters.items()
+        }
+
+    async def close(self) -> None:
+        await self.store.close()
+
+
+def create_admission(settings: Settings) -> AdmissionController:
+    return AdmissionController(
+        create_bucket_store(settings),
+        rate_limits={
+            "upload": RateLimit(settings.upload_rate_per_second, settings.upload_burst),
+            "serve": RateLimit(settings.serve_rate_per_second, settings.serve_burst),
+        },
+        limiters={
+            "upload": ConcurrencyLimiter(
+                "upload",
+                settings.upload_max_concurrency,
+                settings.upload_max_concurrency_per_user,
+                settings.admission_max_queue,
+            ),
+            "serve": ConcurrencyLimiter(
+                "serve",
+                settings.serve_max_concurrency,
+                settings.serve_max_concurrency_per_user,
+                settings.admission_max_queue,
+            ),
+        },
+        max_wait=settings.admission_max_wait_seconds,
+    )
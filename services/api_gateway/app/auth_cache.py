@@ -0,0 +1,158 @@
+import asyncio
+import base64
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from fastapi import HTTPException
+
+from services.common.schemas import VerifyResponse
+
+
+# Only client-side rejections are cached; 5xx from auth-service must be retried.
+CACHEABLE_REJECTIONS = {401, 403}
+# Entries expire this many seconds before the token's own `exp`.
+EXPIRY_SKEW_SECONDS = 5
+
+
+@dataclass
+class _Entry:
+    expires_at: float
+    user: VerifyResponse | None = None
+    status_code: int | None = None
+    detail: str | None = None
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def token_expiry(token: str) -> float | None:
+    """Read the unverified `exp` claim of a bearer JWT, if there is one."""
+    raw = token.removeprefix("Bearer ").strip()
+    parts = raw.split(".")
+    if len(parts) != 3:
+        return None
+    try:
+        padded = parts[1] + "=" * (-len(parts[1]) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(padded))
+        exp = claims.get("exp")
+    except (ValueError, AttributeError):
+        return None
+    return float(exp) if isinstance(exp, (int, float)) else None
+
+
+class TokenVerificationCache:
+    def __init__(self, max_entries: int, ttl: float, negative_ttl: float) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    async def verify(
+        self,
+        token: str,
+        fetch: Callable[[], Awaitable[VerifyResponse]],
+    ) -> VerifyResponse:
+        key = hash_token(token)
+        entry = self._lookup(key)
+        if entry is not None:
+            self.hits += 1
+            return self._unwrap(entry)
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # The leading request was cancelled, not us: verify on our own.
+                if not pending.cancelled():
+                    raise
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            user = await fetch()
+        except HTTPException as exc:
+            if exc.status_code in CACHEABLE_REJECTIONS:
+                self._store(key, _Entry(
+                    expires_at=time.monotonic() + self.negative_ttl,
+                    status_code=exc.status_code,
+                    detail=exc.detail,
+                ))
+            future.set_exception(exc)
+            raise
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            lifetime = self.ttl
+            exp = token_expiry(token)
+            if exp is not None:
+                lifetime = min(lifetime, exp - time.time() - EXPIRY_SKEW_SECONDS)
+            if lifetime > 0:
+                self._store(key, _Entry(expires_at=time.monotonic() + lifetime, user=user))
+            future.set_result(user)
+            return user
+        finally:
+            self._inflight.pop(key, None)
+            # Mark the exception as retrieved when nobody else was waiting on it.
+            if future.done() and not future.cancelled():
+                future.exception()
+
+    def invalidate(self, token: str) -> None:
+        self._entries.pop(hash_token(token), None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "inflight": len(self._inflight),
+            "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
+
+    def _lookup(self, key: str) -> _Entry | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: str, entry: _Entry) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    @staticmethod
+    def _unwrap(entry: _Entry) -> VerifyResponse:
+        if entry.user is None:
+            raise HTTPException(status_code=entry.status_code or 401, detail=entry.detail)
+        return entry.user
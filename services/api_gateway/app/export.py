@@ -0,0 +1,297 @@
+"""Streaming ZIP archives of a user's photos.
+
+The archive is written as it goes: each entry's local header is sent before
+its bytes are known, and its CRC and sizes follow in a data descriptor, so
+nothing is buffered beyond the prefetch window. Photos are already compressed,
+so entries are stored rather than deflated; ZIP64 records are added only where
+an offset, a size or the entry count outgrows the classic format.
+"""
+
+import asyncio
+import struct
+import zlib
+from collections import deque
+from contextlib import aclosing
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable
+
+from services.common.schemas import ExportedPhoto
+
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+STORED = 0
+DEFLATED = 8
+# Bit 3: CRC and sizes follow the data; bit 11: names are UTF-8.
+FLAGS = 0x0808
+VERSION = 20
+VERSION_ZIP64 = 45
+# Made by Unix, so the external attributes below are read as a file mode.
+MADE_BY = (3 << 8) | VERSION_ZIP64
+FILE_MODE = 0o100644 << 16
+# Formats that store pixels uncompressed; everything else is sent as is.
+DEFLATE_TYPES = {"image/bmp", "image/x-ms-bmp", "image/tiff", "image/svg+xml", "image/x-icon"}
+
+
+def _dos_datetime(moment: datetime) -> tuple[int, int]:
+    if moment.year < 1980:
+        return 0, (1 << 5) | 1
+    return (
+        (moment.hour << 11) | (moment.minute << 5) | (moment.second // 2),
+        ((moment.year - 1980) << 9) | (moment.month << 5) | moment.day,
+    )
+
+
+@dataclass
+class _Entry:
+    name: bytes
+    offset: int
+    method: int
+    time: int
+    date: int
+    zip64: bool
+    crc: int = 0
+    compressed_size: int = 0
+    size: int = 0
+
+
+class ZipStream:
+    """Incremental ZIP writer; every method returns the bytes to send next.
+
+    Per entry only the central directory record (name, CRC, sizes, offset) is
+    kept until close().
+    """
+
+    def __init__(self) -> None:
+        self.offset = 0
+        self.entries: list[_Entry] = []
+        self._names: set[str] = set()
+        self._current: _Entry | None = None
+        self._compressor = None
+
+    def _emit(self, data: bytes) -> bytes:
+        self.offset += len(data)
+        return data
+
+    def unique_name(self, name: str) -> str:
+        # Original names are user input: keep the last path component only, and
+        # number repeats the way file managers do ("IMG_1.jpg", "IMG_1 (2).jpg").
+        name = name.replace("\\", "/").rsplit("/", 1)[-1].strip() or "photo"
+        if name in (".", ".."):
+            name = "photo"
+        stem, dot, extension = name.rpartition(".")
+        if not stem:
+            stem, dot, extension = name, "", ""
+        candidate, number = name, 1
+        while candidate in self._names:
+            number += 1
+            candidate = f"{stem} ({number}){dot}{extension}"
+        self._names.add(candidate)
+        return candidate
+
+    def start(self, name: str, modified: datetime, content_type: str, size_hint: int) -> bytes:
+        method = DEFLATED if content_type in DEFLATE_TYPES else STORED
+        time, date = _dos_datetime(modified)
+        # Deflate can outgrow its input slightly, so leave headroom before the limit.
+        zip64 = size_hint + (size_hint >> 8) + 64 >= ZIP64_LIMIT
+        entry = _Entry(self.unique_name(name).encode("utf-8"), self.offset, method, time, date, zip64)
+        self._current = entry
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, -15) if method == DEFLATED else None
+
+        extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0) if zip64 else b""
+        header = struct.pack(
+            "<IHHHHHIIIHH",
+            0x04034B50,
+            VERSION_ZIP64 if zip64 else VERSION,
+            FLAGS,
+            method,
+            time,
+            date,
+            0,
+            ZIP64_LIMIT if zip64 else 0,
+            ZIP64_LIMIT if zip64 else 0,
+            len(entry.name),
+            len(extra),
+        )
+        return self._emit(header + entry.name + extra)
+
+    def write(self, chunk: bytes) -> bytes:
+        entry = self._current
+        entry.crc = zlib.crc32(chunk, entry.crc)
+        entry.size += len(chunk)
+        if self._compressor is not None:
+            chunk = self._compressor.compress(chunk)
+        entry.compressed_size += len(chunk)
+        return self._emit(chunk)
+
+    def finish(self) -> bytes:
+        entry = self._current
+        tail = b""
+        if self._compressor is not None:
+            tail = self._compressor.flush()
+            entry.compressed_size += len(tail)
+        if not entry.zip64 and max(entry.size, entry.compressed_size) >= ZIP64_LIMIT:
+            raise ValueError(f"{entry.name!r} outgrew its size hint; the archive cannot describe it")
+        size_format = "<IIQQ" if entry.zip64 else "<IIII"
+        descriptor = struct.pack(size_format, 0x08074B50, entry.crc, entry.compressed_size, entry.size)
+        self.entries.append(entry)
+        self._current = self._compressor = None
+        return self._emit(tail + descriptor)
+
+    def close(self) -> bytes:
+        directory_offset = self.offset
+        records = []
+        for entry in self.entries:
+            wide = [
+                value
+                for value in (entry.size, entry.compressed_size, entry.offset)
+                if value >= ZIP64_LIMIT
+            ]
+            extra = struct.pack(f"<HH{len(wide)}Q", 0x0001, 8 * len(wide), *wide) if wide else b""
+            records.append(
+                struct.pack(
+                    "<IHHHHHHIIIHHHHHII",
+                    0x02014B50,
+                    MADE_BY,
+                    VERSION_ZIP64 if entry.zip64 or wide else VERSION,
+                    FLAGS,
+                    entry.method,
+                    entry.time,
+                    entry.date,
+                    entry.crc,
+                    min(entry.compressed_size, ZIP64_LIMIT),
+                    min(entry.size, ZIP64_LIMIT),
+                    len(entry.name),
+                    len(extra),
+                    0,
+                    0,
+                    0,
+                    FILE_MODE,
+                    min(entry.offset, ZIP64_LIMIT),
+                )
+                + entry.name
+                + extra
+            )
+        directory = b"".join(records)
+        count = len(self.entries)
+
+        end = b""
+        if count >= ZIP64_COUNT_LIMIT or directory_offset >= ZIP64_LIMIT or len(directory) >= ZIP64_LIMIT:
+            end_offset = directory_offset + len(directory)
+            end += struct.pack(
+                "<IQHHIIQQQQ",
+                0x06064B50,
+                44,
+                MADE_BY,
+                VERSION_ZIP64,
+                0,
+                0,
+                count,
+                count,
+                len(directory),
+                directory_offset,
+            )
+            end += struct.pack("<IIQI", 0x07064B50, 0, end_offset, 1)
+        end += struct.pack(
+            "<IHHHHIIH",
+            0x06054B50,
+            0,
+            0,
+            min(count, ZIP64_COUNT_LIMIT),
+            min(count, ZIP64_COUNT_LIMIT),
+            min(len(directory), ZIP64_LIMIT),
+            min(directory_offset, ZIP64_LIMIT),
+            0,
+        )
+        return self._emit(directory + end)
+
+
+class MediaUnavailable(LookupError):
+    """The photo's media is gone (deleted since it was listed); its entry is skipped."""
+
+
+# Puts the photo's bytes on the queue chunk by chunk.
+Fetch = Callable[[ExportedPhoto, asyncio.Queue], Awaitable[None]]
+
+
+async def _download(fetch: Fetch, photo: ExportedPhoto, queue: asyncio.Queue) -> None:
+    try:
+        await fetch(photo, queue)
+    except Exception as exc:
+        await queue.put(exc)
+    else:
+        await queue.put(None)
+
+
+async def _chunks(queue: asyncio.Queue) -> AsyncIterator[bytes]:
+    while (item := await queue.get()) is not None:
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+async def prefetched(
+    photos: AsyncIterator[ExportedPhoto],
+    fetch: Fetch,
+    window: int,
+    buffered_chunks: int,
+) -> AsyncIterator[tuple[ExportedPhoto, AsyncIterator[bytes]]]:
+    """Yield photos in order, with up to `window` of them downloading ahead.
+
+    A download parks once `buffered_chunks` chunks are waiting, so memory is
+    bounded by window * buffered_chunks chunks however large the export is.
+    Downloads still running when the consumer stops are cancelled.
+    """
+    pending: deque[tuple[ExportedPhoto, asyncio.Task, asyncio.Queue]] = deque()
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < window:
+                try:
+                    photo = await anext(photos)
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                queue: asyncio.Queue = asyncio.Queue(maxsize=buffered_chunks)
+                pending.append((photo, asyncio.create_task(_download(fetch, photo, queue)), queue))
+            if not pending:
+                return
+            photo, _, queue = pending[0]
+            # Stays in `pending` while it is consumed, so the finally below covers it.
+            yield photo, _chunks(queue)
+            pending.popleft()
+    finally:
+        tasks = [task for _, task, _ in pending]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def zip_photos(
+    photos: AsyncIterator[ExportedPhoto],
+    fetch: Fetch,
+    window: int,
+    buffered_chunks: int,
+    on_skip: Callable[[ExportedPhoto], None] | None = None,
+) -> AsyncIterator[bytes]:
+    """The ZIP archive of `photos`, in order, as a stream of byte strings."""
+    archive = ZipStream()
+    # aclosing: closing this stream must cancel the downloads right away, not
+    # whenever the inner generator happens to be finalized.
+    async with aclosing(prefetched(photos, fetch, window, buffered_chunks)) as entries:
+        async for photo, chunks in entries:
+            try:
+                # Wait for the first chunk before committing to the entry.
+                first = await anext(chunks, b"")
+            except MediaUnavailable:
+                if on_skip is not None:
+                    on_skip(photo)
+                continue
+            yield archive.start(photo.original_name, photo.upload_date, photo.content_type, photo.size)
+            if first:
+                yield archive.write(first)
+            async for chunk in chunks:
+                yield archive.write(chunk)
+            yield archive.finish()
+    yield archive.close()
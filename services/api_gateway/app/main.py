@@ -1,19 +1,92 @@
 import asyncio
-from typing import Any
+import time
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+from datetime import datetime
+from functools import partial
+from typing import Any, AsyncIterator, Iterator, Literal
+from urllib.parse import quote
 
 import httpx
-from fastapi import Depends, FastAPI, File, HTTPException, Query, Request, UploadFile
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 
 from services.common.config import get_settings
+from services.common.inprocess import start_services
 from services.common.logging import configure_logger
-from services.common.schemas import PhotoListResponse, PhotoResponse, ServiceHealth, VerifyResponse
+from services.common.metrics import instrument_app
+from services.common.schemas import (
+    BatchUploadResponse,
+    BatchUploadResult,
+    BulkDeleteResponse,
+    CreatePhotoRequest,
+    CreatePhotoResult,
+    CreatePhotosRequest,
+    CreatePhotosResponse,
+    DeletePhotosRequest,
+    DeletePhotosResult,
+    ExportedPhoto,
+    ExportPhotosRequest,
+    ImageInfo,
+    MediaBatchUploadResponse,
+    MediaDeleteResponse,
+    MediaLocation,
+    PhotoCluster,
+    PhotoClusterList,
+    PhotoListResponse,
+    PhotoResponse,
+    ServiceHealth,
+    Timeline,
+    UserStats,
+    VerifyResponse,
+)
+from services.common.tracing import trace_app
+from services.common.upstream import UpstreamClient, create_upstream
+
+from .admission import create_admission
+from .auth_cache import TokenVerificationCache
+from .export import MediaUnavailable, zip_photos
+from .photo_cache import PhotoMetadataCache
+from .signing import signed_media_url, verify_media_signature
 
 
 settings = get_settings()
 logger = configure_logger("api-gateway")
 
+PASSTHROUGH_MEDIA_HEADERS = (
+    "content-length",
+    "content-encoding",
+    "content-range",
+    "accept-ranges",
+    "cache-control",
+    "etag",
+    "last-modified",
+)
+# Width requested for grid thumbnails in signed thumbnail URLs.
+THUMBNAIL_SIZE = 256
+# Multipart framing around the file part, allowed on top of quota pre-checks.
+MULTIPART_SLACK_BYTES = 64 * 1024
+FORWARDED_CONDITIONAL_HEADERS = ("range", "if-range", "if-none-match", "if-modified-since")
+MEDIA_RELEASE_ATTEMPTS = 3
+# Keys per media-service batch delete call.
+MEDIA_DELETE_CHUNK = 1000
+# Read size for media copied into export archives.
+EXPORT_CHUNK_BYTES = 64 * 1024
+# Apps started inside the gateway when UPSTREAM_TRANSPORT=inprocess.
+SERVICE_APPS = {
+    "auth": "services.auth_service.app.main:app",
+    "media": "services.media_service.app.main:app",
+    "gallery": "services.gallery_service.app.main:app",
+}
+# Relayed uploads read the client's body as they go, so allow slow senders.
+UPLOAD_TIMEOUT = httpx.Timeout(
+    settings.upload_timeout_seconds,
+    connect=settings.upstream_connect_timeout_seconds,
+    pool=settings.upstream_pool_timeout_seconds,
+)
+
 app = FastAPI(title="Photure API Gateway", version="0.1.0")
 
 # Add CORS middleware
@@ -26,33 +99,91 @@ app.add_middleware(
 )
 
 app = FastAPI(title="Photure API Gateway", version="0.1.0")
+instrument_app(app)
+trace_app(app, "api-gateway")
+
+auth_cache = TokenVerificationCache(
+    max_entries=settings.auth_cache_max_entries,
+    ttl=settings.auth_cache_ttl_seconds,
+    negative_ttl=settings.auth_cache_negative_ttl_seconds,
+)
+photo_cache = PhotoMetadataCache(
+    max_entries=settings.photo_cache_max_entries,
+    ttl=settings.photo_cache_ttl_seconds,
+)
+admission = create_admission(settings)
+
+
+@dataclass
+class Upstreams:
+    auth: UpstreamClient
+    media: UpstreamClient
+    gallery: UpstreamClient
+
+    def __iter__(self) -> Iterator[UpstreamClient]:
+        return iter((self.auth, self.media, self.gallery))
+
+
+def create_upstreams(transports: dict[str, httpx.AsyncBaseTransport] | None = None) -> Upstreams:
+    transports = transports or {}
+    # Separate pools so a slow upstream cannot starve calls to the others.
+    return Upstreams(
+        auth=create_upstream(
+            "auth",
+            settings.auth_service_url,
+            read_timeout=settings.auth_read_timeout_seconds,
+            transport=transports.get("auth"),
+        ),
+        media=create_upstream(
+            "media",
+            settings.media_service_url,
+            read_timeout=settings.media_read_timeout_seconds,
+            transport=transports.get("media"),
+        ),
+        gallery=create_upstream("gallery", settings.gallery_service_url, transport=transports.get("gallery")),
+    )
 
 
 @app.on_event("startup")
 async def startup():
-    app.state.http_client = httpx.AsyncClient(timeout=30)
+    app.state.services = AsyncExitStack()
+    transports = {}
+    if settings.upstream_transport == "inprocess":
+        # Monolith mode: the other apps live in this process and every call
+        # below goes to them without touching the network.
+        transports = await start_services(app.state.services, SERVICE_APPS)
+    app.state.upstreams = create_upstreams(transports)
 
 
 @app.on_event("shutdown")
 async def shutdown():
-    client: httpx.AsyncClient = app.state.http_client
-    await client.aclose()
+    upstreams: Upstreams = app.state.upstreams
+    for upstream in upstreams:
+        await upstream.aclose()
+    await app.state.services.aclose()
+    await admission.close()
 
 
-def get_http_client() -> httpx.AsyncClient:
-    client: httpx.AsyncClient = app.state.http_client
-    return client
+def get_upstreams() -> Upstreams:
+    upstreams: Upstreams = app.state.upstreams
+    return upstreams
 
 
-async def verify_user(request: Request, client: httpx.AsyncClient) -> VerifyResponse:
+async def verify_user(request: Request, upstreams: Upstreams) -> VerifyResponse:
     token = request.headers.get("Authorization")
     if not token:
         raise HTTPException(status_code=401, detail="Missing Authorization header")
 
+    return await auth_cache.verify(token, lambda: fetch_verification(token, upstreams))
+
+
+async def fetch_verification(token: str, upstreams: Upstreams) -> VerifyResponse:
     try:
-        response = await client.post(
-            f"{settings.auth_service_url}/verify",
+        response = await upstreams.auth.post(
+            "/verify",
             headers={"Authorization": token},
+            # Verification has no side effects, so it is safe to retry.
+            idempotent=True,
         )
     except httpx.RequestError as exc:
         logger.exception("Auth service unreachable")
@@ -65,11 +196,182 @@ async def verify_user(request: Request, client: httpx.AsyncClient) -> VerifyResp
     return VerifyResponse(**data)
 
 
+async def relay_body(response: httpx.Response) -> AsyncIterator[bytes]:
+    try:
+        async for chunk in response.aiter_raw():
+            yield chunk
+    finally:
+        await response.aclose()
+
+
+async def fetch_photo(user: VerifyResponse, photo_id: str, upstreams: Upstreams) -> dict:
+    try:
+        meta_resp = await upstreams.gallery.get(
+            f"/gallery/photos/{photo_id}",
+            headers={"X-User-Id": user.user_id},
+        )
+    except httpx.RequestError as exc:
+        logger.exception("Gallery service unreachable")
+        raise HTTPException(status_code=503, detail="Gallery service unavailable") from exc
+
+    if meta_resp.status_code != 200:
+        raise HTTPException(status_code=meta_resp.status_code, detail=meta_resp.json().get("detail"))
+    return meta_resp.json()
+
+
+async def fetch_user_stats(user: VerifyResponse, upstreams: Upstreams) -> UserStats:
+    try:
+        stats_resp = await upstreams.gallery.get(
+            "/gallery/stats",
+            headers={"X-User-Id": user.user_id},
+        )
+    except httpx.RequestError as exc:
+        logger.exception("Gallery service unreachable")
+        raise HTTPException(status_code=503, detail="Gallery service unavailable") from exc
+
+    if stats_resp.status_code != 200:
+        raise HTTPException(status_code=stats_resp.status_code, detail=stats_resp.json().get("detail"))
+    return UserStats(**stats_resp.json())
+
+
+async def fetch_photo_list(user: VerifyResponse, path: str, params: dict, upstreams: Upstreams) -> PhotoListResponse:
+    try:
+        gallery_resp = await upstreams.gallery.get(
+            path,
+            params=params,
+            headers={"X-User-Id": user.user_id},
+        )
+    except httpx.RequestError as exc:
+        logger.exception("Gallery service unreachable")
+        raise HTTPException(status_code=503, detail="Gallery service unavailable") from exc
+
+    if gallery_resp.status_code != 200:
+        raise HTTPException(status_code=gallery_resp.status_code, detail=gallery_resp.json().get("detail"))
+
+    payload = gallery_resp.json()
+    for photo in payload["photos"]:
+        photo_cache.put(photo)
+    photos = [hydrate_photo(photo) for photo in payload["photos"]]
+
+    return PhotoListResponse(photos=photos, total=payload.get("total"), next_cursor=payload.get("next_cursor"))
+
+
+async def proxy_media(
+    request: Request,
+    photo: dict,
+    size: int | None,
+    upstreams: Upstreams,
+) -> Response:
+    params = {
+        "download_name": photo["original_name"],
+        "content_type": photo["content_type"],
+    }
+    if size is not None:
+        params["size"] = size
+        params["format"] = negotiate_format(request.headers.get("accept"))
+
+    forwarded = {
+        name: request.headers[name]
+        for name in FORWARDED_CONDITIONAL_HEADERS
+        if name in request.headers
+    }
+    upstream_request = upstreams.media.build_request(
+        "GET",
+        f"/media/{photo['storage_key']}",
+        params=params,
+        headers=forwarded,
+    )
+    try:
+        media_resp = await upstreams.media.send(upstream_request, stream=True)
+    except httpx.RequestError as exc:
+        logger.exception("Media service unreachable")
+        raise HTTPException(status_code=503, detail="Media service unavailable") from exc
+
+    headers = {
+        name: media_resp.headers[name]
+        for name in PASSTHROUGH_MEDIA_HEADERS
+        if name in media_resp.headers
+    }
+
+    if media_resp.status_code == 304:
+        await media_resp.aclose()
+        return Response(status_code=304, headers=headers)
+
+    if media_resp.status_code not in (200, 206):
+        await media_resp.aread()
+        await media_resp.aclose()
+        raise HTTPException(
+            status_code=media_resp.status_code,
+            detail=media_resp.json().get("detail"),
+            headers=headers or None,
+        )
+
+    headers["Content-Disposition"] = f'inline; filename="{photo["original_name"]}"'
+    if size is not None:
+        headers["Vary"] = "Accept"
+    # Variants and multi-range responses carry their own content type.
+    media_type = media_resp.headers.get("content-type", photo["content_type"])
+
+    # Closing the upstream response in the background task also covers the case
+    # where the client disconnects and the body iterator is abandoned mid-stream.
+    return StreamingResponse(
+        relay_body(media_resp),
+        status_code=media_resp.status_code,
+        media_type=media_type,
+        headers=headers,
+        background=BackgroundTask(media_resp.aclose),
+    )
+
+
+async def accel_redirect(
+    request: Request,
+    photo: dict,
+    size: int | None,
+    upstreams: Upstreams,
+) -> Response:
+    """Authorize only; nginx serves the bytes from the shared upload volume."""
+    headers = {"Content-Disposition": f'inline; filename="{photo["original_name"]}"'}
+    params = {}
+    if size is not None:
+        headers["Vary"] = "Accept"
+        params = {"size": size, "format": negotiate_format(request.headers.get("accept"))}
+
+    # Objects are sharded by content hash, so ask media-service where they live.
+    try:
+        locate_resp = await upstreams.media.get(
+            f"/media/{photo['storage_key']}/locate",
+            params=params,
+        )
+    except httpx.RequestError as exc:
+        logger.exception("Media service unreachable")
+        raise HTTPException(status_code=503, detail="Media service unavailable") from exc
+
+    if locate_resp.status_code != 200:
+        raise HTTPException(status_code=locate_resp.status_code, detail=locate_resp.json().get("detail"))
+    located = MediaLocation(**locate_resp.json())
+    location = located.path
+    media_type = located.content_type or photo["content_type"]
+
+    headers["X-Accel-Redirect"] = f"{settings.accel_redirect_prefix}/{quote(location)}"
+    return Response(status_code=200, media_type=media_type, headers=headers)
+
+
+def negotiate_format(accept: str | None) -> str:
+    return "webp" if accept and "image/webp" in accept else "jpeg"
+
+
 def hydrate_photo(photo: dict) -> PhotoResponse:
-    return PhotoResponse(
-        **photo,
-        url=f"/api/serve/{photo['id']}",
+    if not settings.media_url_signing_key:
+        return PhotoResponse(**photo, url=f"/api/serve/{photo['id']}")
+
+    sign = partial(
+        signed_media_url,
+        settings.media_url_signing_key,
+        photo["user_id"],
+        photo["id"],
+        settings.signed_url_ttl_seconds,
     )
+    return PhotoResponse(**photo, url=sign(), thumbnail_url=sign(size=THUMBNAIL_SIZE))
 
 
 @app.get("/health", response_model=ServiceHealth)
@@ -81,71 +383,345 @@ async def health() -> ServiceHealth:
     )
 
 
+@app.get("/internal/auth-cache")
+async def auth_cache_stats() -> dict:
+    return auth_cache.stats()
+
+
+@app.get("/internal/photo-cache")
+async def photo_cache_stats() -> dict:
+    return photo_cache.stats()
+
+
+@app.get("/internal/admission")
+async def admission_stats() -> dict:
+    return admission.stats()
+
+
+@app.get("/internal/upstreams")
+async def upstream_stats(upstreams: Upstreams = Depends(get_upstreams)) -> dict:
+    return {upstream.name: upstream.stats() for upstream in upstreams}
+
+
+async def upload_headers(request: Request, user: VerifyResponse, upstreams: Upstreams) -> dict:
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith("multipart/form-data"):
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data upload")
+
+    content_length = request.headers.get("content-length")
+    if settings.user_quota_bytes and content_length:
+        # Cheap pre-check against the materialized counters so an over-quota
+        # upload is refused before its body is streamed anywhere.
+        stats = await fetch_user_stats(user, upstreams)
+        if stats.total_bytes + int(content_length) > settings.user_quota_bytes + MULTIPART_SLACK_BYTES:
+            raise HTTPException(status_code=413, detail="Storage quota exceeded")
+
+    headers = {"Content-Type": content_type}
+    if content_length:
+        headers["Content-Length"] = content_length
+    return headers
+
+
+async def release_media(upstreams: Upstreams, storage_keys: list[str]) -> int:
+    """Release storage keys through media-service's batch delete.
+
+    Returns how many could not be released. Only connection failures are
+    retried: once a request has reached media-service, repeating it could drop
+    a reference twice.
+    """
+    failed = 0
+    for start in range(0, len(storage_keys), MEDIA_DELETE_CHUNK):
+        chunk = storage_keys[start:start + MEDIA_DELETE_CHUNK]
+        response = None
+        for attempt in range(MEDIA_RELEASE_ATTEMPTS):
+            try:
+                response = await upstreams.media.post(
+                    "/media/delete",
+                    json={"storage_keys": chunk},
+                )
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+                await asyncio.sleep(0.2 * 2**attempt)
+                continue
+            except httpx.RequestError:
+                logger.exception("Media service failed during batch delete")
+            break
+
+        if response is not None and response.status_code == 200:
+            failed += len(MediaDeleteResponse(**response.json()).failed)
+        else:
+            failed += len(chunk)
+
+    if failed:
+        logger.error("Failed to release %d media objects; they are no longer referenced", failed)
+    return failed
+
+
 @app.post("/api/upload")
 async def upload_photo(
     request: Request,
-    file: UploadFile = File(...),
-    client: httpx.AsyncClient = Depends(get_http_client),
+    upstreams: Upstreams = Depends(get_upstreams),
 ):
-    user = await verify_user(request, client)
+    user = await verify_user(request, upstreams)
+    async with admission.admit("upload", user.user_id):
+        headers = await upload_headers(request, user, upstreams)
+
+        # Relay the multipart body chunk by chunk; media-service parses it and
+        # enforces the size limit, so the gateway never holds the whole file.
+        try:
+            media_resp = await upstreams.media.post(
+                "/media/upload",
+                content=request.stream(),
+                headers=headers,
+                timeout=UPLOAD_TIMEOUT,
+            )
+        except httpx.RequestError as exc:
+            logger.exception("Media service unreachable")
+            raise HTTPException(status_code=503, detail="Media service unavailable") from exc
+
+        if media_resp.status_code != 200:
+            raise HTTPException(status_code=media_resp.status_code, detail=media_resp.json().get("detail"))
+
+        media_data = media_resp.json()
+
+        gallery_payload = {
+            "storage_key": media_data["storage_key"],
+            "filename": media_data["filename"],
+            "original_name": media_data["filename"],
+            "content_type": media_data["content_type"],
+            "size": media_data["size"],
+            "user_id": user.user_id,
+            **{name: media_data.get(name) for name in ImageInfo.model_fields},
+        }
+
+        try:
+            gallery_resp = await upstreams.gallery.post(
+                "/gallery/photos",
+                json=gallery_payload,
+            )
+        except httpx.RequestError as exc:
+            logger.exception("Gallery service unreachable")
+            await release_media(upstreams, [media_data["storage_key"]])
+            raise HTTPException(status_code=503, detail="Gallery service unavailable") from exc
+
+        if gallery_resp.status_code != 200:
+            await release_media(upstreams, [media_data["storage_key"]])
+            raise HTTPException(status_code=gallery_resp.status_code, detail=gallery_resp.json().get("detail"))
+
+        photo = gallery_resp.json()
+        photo_cache.put(photo)
+        hydrated = hydrate_photo(photo)
+        return hydrated
+
+
+@app.post("/api/upload/batch", response_model=BatchUploadResponse)
+async def upload_photos(
+    request: Request,
+    upstreams: Upstreams = Depends(get_upstreams),
+) -> BatchUploadResponse:
+    """Upload many `files` parts at once: one admission check, one media-service
+    call (which stores files concurrently) and one bulk metadata insert. Every
+    file counts against the user's upload rate."""
+    user = await verify_user(request, upstreams)
+    async with admission.admit("upload", user.user_id):
+        headers = await upload_headers(request, user, upstreams)
+
+        try:
+            media_resp = await upstreams.media.post(
+                "/media/upload/batch",
+                content=request.stream(),
+                headers=headers,
+                timeout=UPLOAD_TIMEOUT,
+            )
+        except httpx.RequestError as exc:
+            logger.exception("Media service unreachable")
+            raise HTTPException(status_code=503, detail="Media service unavailable") from exc
+
+        if media_resp.status_code != 200:
+            raise HTTPException(status_code=media_resp.status_code, detail=media_resp.json().get("detail"))
+
+        media_results = MediaBatchUploadResponse(**media_resp.json()).results
+        # Admission took one token; the file count is only known now.
+        await admission.charge("upload", user.user_id, len(media_results) - 1)
+        stored = [result.media for result in media_results if result.media is not None]
+        photos: list[CreatePhotoResult] = []
+
+        if stored:
+            bulk_payload = CreatePhotosRequest(photos=[
+                CreatePhotoRequest(
+                    storage_key=media.storage_key,
+                    filename=media.filename,
+                    original_name=media.filename,
+                    content_type=media.content_type,
+                    size=media.size,
+                    user_id=user.user_id,
+                    **{name: getattr(media, name) for name in ImageInfo.model_fields},
+                )
+                for media in stored
+            ])
+            try:
+                gallery_resp = await upstreams.gallery.post(
+                    "/gallery/photos/bulk",
+                    json=bulk_payload.model_dump(mode="json"),
+                )
+            except httpx.RequestError as exc:
+                logger.exception("Gallery service unreachable")
+                await release_media(upstreams, [media.storage_key for media in stored])
+                raise HTTPException(status_code=503, detail="Gallery service unavailable") from exc
+
+            if gallery_resp.status_code != 200:
+                await release_media(upstreams, [media.storage_key for media in stored])
+                raise HTTPException(status_code=gallery_resp.status_code, detail=gallery_resp.json().get("detail"))
+            photos = CreatePhotosResponse(**gallery_resp.json()).results
+
+        rejected = [media.storage_key for media, photo in zip(stored, photos) if photo.photo is None]
+        if rejected:
+            await release_media(upstreams, rejected)
+
+        results = []
+        created = iter(photos)
+        for media_result in media_results:
+            if media_result.media is None:
+                results.append(BatchUploadResult(
+                    filename=media_result.filename,
+                    status_code=media_result.status_code,
+                    detail=media_result.detail,
+                ))
+                continue
+            created_photo = next(created)
+            if created_photo.photo is None:
+                results.append(BatchUploadResult(
+                    filename=media_result.filename,
+                    status_code=created_photo.status_code,
+                    detail=created_photo.detail,
+                ))
+                continue
+            photo = created_photo.photo.model_dump()
+            photo_cache.put(photo)
+            results.append(BatchUploadResult(
+                filename=media_result.filename,
+                status_code=200,
+                photo=hydrate_photo(photo),
+            ))
+
+        uploaded = sum(1 for result in results if result.photo is not None)
+        return BatchUploadResponse(results=results, uploaded=uploaded, failed=len(results) - uploaded)
+
+
+@app.get("/api/stats", response_model=UserStats)
+async def user_stats(
+    request: Request,
+    upstreams: Upstreams = Depends(get_upstreams),
+) -> UserStats:
+    user = await verify_user(request, upstreams)
+    return await fetch_user_stats(user, upstreams)
 
-    file_bytes = await file.read()
-    files = {"file": (file.filename, file_bytes, file.content_type)}
 
-    try:
-        media_resp = await client.post(f"{settings.media_service_url}/media/upload", files=files)
-    except httpx.RequestError as exc:
-        logger.exception("Media service unreachable")
-        raise HTTPException(status_code=503, detail="Media service unavailable") from exc
+@app.get("/api/photos", response_model=PhotoListResponse)
+async def list_photos(
+    request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = Query(default=None),
+    upstreams: Upstreams = Depends(get_upstreams),
+):
+    user = await verify_user(request, upstreams)
 
-    if media_resp.status_code != 200:
-        raise HTTPException(status_code=media_resp.status_code, detail=media_resp.json().get("detail"))
+    params = {"skip": skip, "limit": limit}
+    if cursor:
+        params["cursor"] = cursor
+    return await fetch_photo_list(user, "/gallery/photos", params, upstreams)
 
-    media_data = media_resp.json()
 
-    gallery_payload = {
-        "storage_key": media_data["storage_key"],
-        "filename": media_data["filename"],
-        "original_name": file.filename or media_data["filename"],
-        "content_type": media_data["content_type"],
-        "size": media_data["size"],
-        "user_id": user.user_id,
+@app.get("/api/photos/search", response_model=PhotoListResponse)
+async def search_photos(
+    request: Request,
+    uploaded_after: datetime | None = Query(default=None),
+    uploaded_before: datetime | None = Query(default=None),
+    content_type: list[str] | None = Query(default=None),
+    min_size: int | None = Query(default=None, ge=0),
+    max_size: int | None = Query(default=None, ge=0),
+    q: str | None = Query(default=None, min_length=1, max_length=200),
+    sort: Literal["date", "size"] = Query("date"),
+    order: Literal["asc", "desc"] = Query("desc"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = Query(default=None),
+    upstreams: Upstreams = Depends(get_upstreams),
+):
+    user = await verify_user(request, upstreams)
+
+    params = {
+        "uploaded_after": uploaded_after.isoformat() if uploaded_after else None,
+        "uploaded_before": uploaded_before.isoformat() if uploaded_before else None,
+        "content_type": content_type,
+        "min_size": min_size,
+        "max_size": max_size,
+        "q": q,
+        "sort": sort,
+        "order": order,
+        "limit": limit,
+        "cursor": cursor,
     }
+    params = {name: value for name, value in params.items() if value is not None}
+    return await fetch_photo_list(user, "/gallery/search", params, upstreams)
+
+
+@app.get("/api/photos/similar", response_model=PhotoClusterList)
+async def similar_photos(
+    request: Request,
+    threshold: int = Query(5, ge=0, le=7),
+    limit: int = Query(50, ge=1, le=200),
+    upstreams: Upstreams = Depends(get_upstreams),
+) -> PhotoClusterList:
+    user = await verify_user(request, upstreams)
 
     try:
-        gallery_resp = await client.post(
-            f"{settings.gallery_service_url}/gallery/photos",
-            json=gallery_payload,
+        gallery_resp = await upstreams.gallery.get(
+            "/gallery/similar",
+            params={"threshold": threshold, "limit": limit},
+            headers={"X-User-Id": user.user_id},
         )
     except httpx.RequestError as exc:
         logger.exception("Gallery service unreachable")
         raise HTTPException(status_code=503, detail="Gallery service unavailable") from exc
 
     if gallery_resp.status_code != 200:
-        # roll back media upload asynchronously
-        asyncio.create_task(
-            client.delete(f"{settings.media_service_url}/media/{media_data['storage_key']}")
-        )
         raise HTTPException(status_code=gallery_resp.status_code, detail=gallery_resp.json().get("detail"))
 
-    photo = gallery_resp.json()
-    hydrated = hydrate_photo(photo)
-    return hydrated
+    payload = gallery_resp.json()
+    clusters = []
+    for cluster in payload["clusters"]:
+        for photo in cluster["photos"]:
+            photo_cache.put(photo)
+        clusters.append(PhotoCluster(photos=[hydrate_photo(photo) for photo in cluster["photos"]]))
+    return PhotoClusterList(
+        clusters=clusters,
+        total=payload["total"],
+        threshold=payload["threshold"],
+        pending=payload["pending"],
+    )
 
 
-@app.get("/api/photos", response_model=PhotoListResponse)
-async def list_photos(
+@app.get("/api/timeline", response_model=Timeline)
+async def timeline(
     request: Request,
-    skip: int = Query(0, ge=0),
-    limit: int = Query(20, ge=1, le=100),
-    client: httpx.AsyncClient = Depends(get_http_client),
-):
-    user = await verify_user(request, client)
-
+    granularity: Literal["day", "month", "year"] = Query("day"),
+    tz: str = Query("UTC", max_length=64),
+    uploaded_after: datetime | None = Query(default=None),
+    uploaded_before: datetime | None = Query(default=None),
+    order: Literal["asc", "desc"] = Query("desc"),
+    upstreams: Upstreams = Depends(get_upstreams),
+) -> Timeline:
+    user = await verify_user(request, upstreams)
+
+    params = {"granularity": granularity, "tz": tz, "order": order}
+    if uploaded_after:
+        params["uploaded_after"] = uploaded_after.isoformat()
+    if uploaded_before:
+        params["uploaded_before"] = uploaded_before.isoformat()
     try:
-        gallery_resp = await client.get(
-            f"{settings.gallery_service_url}/gallery/photos",
-            params={"skip": skip, "limit": limit},
+        gallery_resp = await upstreams.gallery.get(
+            "/gallery/timeline",
+            params=params,
             headers={"X-User-Id": user.user_id},
         )
     except httpx.RequestError as exc:
@@ -154,75 +730,82 @@ async def list_photos(
 
     if gallery_resp.status_code != 200:
         raise HTTPException(status_code=gallery_resp.status_code, detail=gallery_resp.json().get("detail"))
-
-    payload = gallery_resp.json()
-    photos = [hydrate_photo(photo) for photo in payload["photos"]]
-
-    return PhotoListResponse(photos=photos, total=payload["total"])
+    return Timeline(**gallery_resp.json())
 
 
 @app.get("/api/serve/{photo_id}")
 async def serve_photo(
     photo_id: str,
     request: Request,
-    client: httpx.AsyncClient = Depends(get_http_client),
+    size: int | None = Query(default=None, ge=1, le=4096),
+    upstreams: Upstreams = Depends(get_upstreams),
 ) -> Any:
-    user = await verify_user(request, client)
+    user = await verify_user(request, upstreams)
 
-    try:
-        meta_resp = await client.get(
-            f"{settings.gallery_service_url}/gallery/photos/{photo_id}",
-            headers={"X-User-Id": user.user_id},
-        )
-    except httpx.RequestError as exc:
-        logger.exception("Gallery service unreachable")
-        raise HTTPException(status_code=503, detail="Gallery service unavailable") from exc
-
-    if meta_resp.status_code != 200:
-        raise HTTPException(status_code=meta_resp.status_code, detail=meta_resp.json().get("detail"))
-
-    photo = meta_resp.json()
+    photo = await photo_cache.get(
+        user.user_id,
+        photo_id,
+        lambda: fetch_photo(user, photo_id, upstreams),
+    )
 
-    media_url = f"{settings.media_service_url}/media/{photo['storage_key']}"
-    params = {
-        "download_name": photo["original_name"],
-        "content_type": photo["content_type"],
-    }
+    return await admission.respond(
+        "serve",
+        user.user_id,
+        lambda: proxy_media(request, photo, size, upstreams),
+    )
 
-    try:
-        media_resp = await client.get(media_url, params=params)
-    except httpx.RequestError as exc:
-        logger.exception("Media service unreachable")
-        raise HTTPException(status_code=503, detail="Media service unavailable") from exc
 
-    if media_resp.status_code != 200:
-        raise HTTPException(status_code=media_resp.status_code, detail=media_resp.json().get("detail"))
+@app.get("/api/media/{photo_id}")
+async def signed_media(
+    photo_id: str,
+    request: Request,
+    u: str = Query(...),
+    exp: int = Query(...),
+    sig: str = Query(...),
+    size: int | None = Query(default=None, ge=1, le=4096),
+    upstreams: Upstreams = Depends(get_upstreams),
+) -> Any:
+    if not settings.media_url_signing_key:
+        raise HTTPException(status_code=404, detail="Signed media URLs are disabled")
+    if not verify_media_signature(settings.media_url_signing_key, u, photo_id, exp, size, sig):
+        raise HTTPException(status_code=403, detail="Invalid or expired signature")
+
+    user = VerifyResponse(user_id=u)
+    photo = await photo_cache.get(
+        user.user_id,
+        photo_id,
+        lambda: fetch_photo(user, photo_id, upstreams),
+    )
 
-    disposition = f'inline; filename="{photo["original_name"]}"'
-    return StreamingResponse(
-        iter([media_resp.content]),
-        media_type=photo["content_type"],
-        headers={"Content-Disposition": disposition},
+    deliver = accel_redirect if settings.media_delivery == "accel" else proxy_media
+    response = await admission.respond(
+        "serve",
+        user.user_id,
+        lambda: deliver(request, photo, size, upstreams),
     )
+    # The signature is the credential, so the URL can be cached by browsers and CDNs until it expires.
+    response.headers["Cache-Control"] = f"public, max-age={max(exp - int(time.time()), 0)}, immutable"
+    return response
 
 
 @app.delete("/api/photos/{photo_id}")
 async def delete_photo(
     photo_id: str,
     request: Request,
-    client: httpx.AsyncClient = Depends(get_http_client),
+    upstreams: Upstreams = Depends(get_upstreams),
 ) -> JSONResponse:
-    user = await verify_user(request, client)
+    user = await verify_user(request, upstreams)
 
     try:
-        gallery_resp = await client.delete(
-            f"{settings.gallery_service_url}/gallery/photos/{photo_id}",
+        gallery_resp = await upstreams.gallery.delete(
+            f"/gallery/photos/{photo_id}",
             headers={"X-User-Id": user.user_id},
         )
     except httpx.RequestError as exc:
         logger.exception("Gallery service unreachable")
         raise HTTPException(status_code=503, detail="Gallery service unavailable") from exc
 
+    photo_cache.invalidate(user.user_id, photo_id)
     if gallery_resp.status_code != 200:
         raise HTTPException(status_code=gallery_resp.status_code, detail=gallery_resp.json().get("detail"))
 
@@ -230,9 +813,128 @@ async def delete_photo(
     storage_key = delete_payload["storage_key"]
 
     try:
-        await client.delete(f"{settings.media_service_url}/media/{storage_key}")
+        await upstreams.media.delete(f"/media/{storage_key}")
     except httpx.RequestError:
         logger.warning("Failed to delete media %s after metadata removal", storage_key)
 
     return JSONResponse({"message": "Photo deleted successfully"})
 
+
+
+@app.post("/api/photos/bulk-delete", response_model=BulkDeleteResponse)
+async def delete_photos(
+    payload: DeletePhotosRequest,
+    request: Request,
+    upstreams: Upstreams = Depends(get_upstreams),
+) -> BulkDeleteResponse:
+    """Delete photos by id and/or upload-date range in a handful of upstream calls."""
+    user = await verify_user(request, upstreams)
+
+    try:
+        gallery_resp = await upstreams.gallery.post(
+            "/gallery/photos/bulk-delete",
+            json=payload.model_dump(mode="json", exclude_none=True),
+            headers={"X-User-Id": user.user_id},
+        )
+    except httpx.RequestError as exc:
+        logger.exception("Gallery service unreachable")
+        raise HTTPException(status_code=503, detail="Gallery service unavailable") from exc
+
+    if gallery_resp.status_code != 200:
+        raise HTTPException(status_code=gallery_resp.status_code, detail=gallery_resp.json().get("detail"))
+
+    result = DeletePhotosResult(**gallery_resp.json())
+    for photo in result.deleted:
+        photo_cache.invalidate(user.user_id, photo.id)
+
+    media_failed = 0
+    if result.deleted:
+        media_failed = await release_media(upstreams, [photo.storage_key for photo in result.deleted])
+
+    return BulkDeleteResponse(
+        deleted=len(result.deleted),
+        not_found=len(result.not_found),
+        media_failed=media_failed,
+    )
+
+
+async def fetch_export_media(upstreams: Upstreams, photo: ExportedPhoto, queue: asyncio.Queue) -> None:
+    media_resp = await upstreams.media.send(
+        upstreams.media.build_request("GET", f"/media/{photo.storage_key}"),
+        stream=True,
+    )
+    try:
+        if media_resp.status_code == 404:
+            raise MediaUnavailable(photo.storage_key)
+        media_resp.raise_for_status()
+        async for chunk in media_resp.aiter_raw(EXPORT_CHUNK_BYTES):
+            await queue.put(chunk)
+    finally:
+        await media_resp.aclose()
+
+
+async def stream_export(user: VerifyResponse, payload: ExportPhotosRequest, upstreams: Upstreams) -> StreamingResponse:
+    try:
+        gallery_resp = await upstreams.gallery.send(
+            upstreams.gallery.build_request(
+                "POST",
+                "/gallery/photos/export",
+                json=payload.model_dump(mode="json", exclude_none=True),
+                headers={"X-User-Id": user.user_id},
+            ),
+            stream=True,
+            idempotent=True,
+        )
+    except httpx.RequestError as exc:
+        logger.exception("Gallery service unreachable")
+        raise HTTPException(status_code=503, detail="Gallery service unavailable") from exc
+
+    if gallery_resp.status_code != 200:
+        await gallery_resp.aread()
+        await gallery_resp.aclose()
+        raise HTTPException(status_code=gallery_resp.status_code, detail=gallery_resp.json().get("detail"))
+
+    async def photos() -> AsyncIterator[ExportedPhoto]:
+        async for line in gallery_resp.aiter_lines():
+            if line:
+                yield ExportedPhoto.model_validate_json(line)
+
+    def skipped(photo: ExportedPhoto) -> None:
+        logger.warning("Export for %s skipped photo %s: media is gone", user.user_id, photo.id)
+
+    body = zip_photos(
+        photos(),
+        partial(fetch_export_media, upstreams),
+        window=settings.export_prefetch,
+        buffered_chunks=max(1, settings.export_buffer_bytes // EXPORT_CHUNK_BYTES),
+        on_skip=skipped,
+    )
+
+    async def close() -> None:
+        # Also runs when the client disconnects mid-archive: stop the downloads.
+        await body.aclose()
+        await gallery_resp.aclose()
+
+    filename = f"photure-export-{datetime.utcnow():%Y%m%d-%H%M%S}.zip"
+    return StreamingResponse(
+        body,
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        background=BackgroundTask(close),
+    )
+
+
+@app.post("/api/photos/export")
+async def export_photos(
+    payload: ExportPhotosRequest,
+    request: Request,
+    upstreams: Upstreams = Depends(get_upstreams),
+) -> StreamingResponse:
+    """Download photos by id, by upload-date range or `all` of them as one ZIP,
+    built while it is sent."""
+    user = await verify_user(request, upstreams)
+    return await admission.respond(
+        "serve",
+        user.user_id,
+        lambda: stream_export(user, payload, upstreams),
+    )
@@ -0,0 +1,49 @@
+import base64
+import hashlib
+import hmac
+import math
+import time
+from urllib.parse import urlencode
+
+
+def _signature(key: bytes, user_id: str, photo_id: str, expires: int, size: int | None) -> str:
+    message = f"{user_id}\n{photo_id}\n{expires}\n{size or ''}".encode("utf-8")
+    digest = hmac.new(key, message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode("ascii").rstrip("=")
+
+
+def signed_media_url(
+    key: str,
+    user_id: str,
+    photo_id: str,
+    ttl: int,
+    size: int | None = None,
+    now: float | None = None,
+) -> str:
+    """Build a short-lived, HMAC-signed URL for /api/media/{photo_id}.
+
+    Expiry is rounded up to a multiple of `ttl` so every listing inside the same
+    window hands out the same URL, which keeps browser and CDN caches effective.
+    URLs therefore stay valid for between `ttl` and `2 * ttl` seconds.
+    """
+    now = time.time() if now is None else now
+    expires = int(math.ceil((now + ttl) / ttl) * ttl)
+    params = {"u": user_id, "exp": expires}
+    if size is not None:
+        params["size"] = size
+    params["sig"] = _signature(key.encode("utf-8"), user_id, photo_id, expires, size)
+    return f"/api/media/{photo_id}?{urlencode(params)}"
+
+
+def verify_media_signature(
+    key: str,
+    user_id: str,
+    photo_id: str,
+    expires: int,
+    size: int | None,
+    signature: str,
+) -> bool:
+    if expires < time.time():
+        return False
+    expected = _signature(key.encode("utf-8"), user_id, photo_id, expires, size)
+    return hmac.compare_digest(expected, signature)
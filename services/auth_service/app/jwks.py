@@ -0,0 +1,138 @@
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Any
+
+import httpx
+import jwt
+
+from services.common.config import Settings
+from services.common.logging import configure_logger
+
+
+logger = configure_logger("auth-service.jwks")
+
+ALLOWED_ALGORITHMS = ["RS256"]
+# Minimum spacing between refreshes triggered by an unknown `kid`.
+UNKNOWN_KID_REFRESH_INTERVAL = 60
+
+
+class TokenVerificationError(Exception):
+    pass
+
+
+def parse_jwks(jwks: dict) -> dict[str, Any]:
+    return {
+        jwk.key_id: jwk.key
+        for jwk in jwt.PyJWKSet.from_dict(jwks).keys
+        if jwk.key_id
+    }
+
+
+class JWKSStore:
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+        self._static_keys: dict[str, Any] = {}
+        self._remote_keys: dict[str, Any] = {}
+        self._fallback_key: Any | None = None
+        self._last_refresh = 0.0
+        self._refresh_lock = asyncio.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._static_keys or self._remote_keys) or self._fallback_key is not None
+
+    def key_for(self, kid: str | None) -> Any | None:
+        if kid is not None:
+            key = self._remote_keys.get(kid) or self._static_keys.get(kid)
+            if key is not None:
+                return key
+        return self._fallback_key
+
+    def load_static(self) -> None:
+        """Load keys configured for offline use: a JWKS file, inline JWKS or a PEM key."""
+        if self.settings.clerk_jwks_file:
+            path = Path(self.settings.clerk_jwks_file)
+            if path.exists():
+                self._static_keys.update(parse_jwks(json.loads(path.read_text())))
+                logger.info("Loaded signing keys from %s", path)
+            else:
+                logger.warning("CLERK_JWKS_FILE %s does not exist", path)
+        if self.settings.clerk_jwks:
+            self._static_keys.update(parse_jwks(json.loads(self.settings.clerk_jwks)))
+            logger.info("Loaded signing keys from CLERK_JWKS")
+        if self.settings.clerk_jwt_key:
+            # Env files usually carry the PEM on one line with escaped newlines.
+            self._fallback_key = self.settings.clerk_jwt_key.replace("\\n", "\n")
+            logger.info("Loaded PEM signing key from CLERK_JWT_KEY")
+
+    def _knows(self, kid: str) -> bool:
+        return kid in self._remote_keys or kid in self._static_keys
+
+    async def refresh(self, client: httpx.AsyncClient, kid: str | None = None, min_interval: float = 0) -> bool:
+        """Fetch the JWKS. With `kid`/`min_interval`, skip it if, once the lock is
+        held, the key is known or a refresh happened too recently: callers that
+        queued behind one fetch must not each do another."""
+        if not self.settings.clerk_secret_key:
+            return False
+
+        async with self._refresh_lock:
+            if kid is not None and self._knows(kid):
+                return True
+            if min_interval and time.monotonic() - self._last_refresh < min_interval:
+                return False
+            try:
+                response = await client.get(
+                    self.settings.clerk_jwks_url,
+                    headers={"Authorization": f"Bearer {self.settings.clerk_secret_key}"},
+                )
+                response.raise_for_status()
+                self._remote_keys = parse_jwks(response.json())
+            except (httpx.HTTPError, ValueError, jwt.PyJWKError, jwt.PyJWKSetError):
+                logger.exception("Failed to refresh JWKS from %s", self.settings.clerk_jwks_url)
+                return False
+            finally:
+                self._last_refresh = time.monotonic()
+
+        logger.info("Refreshed JWKS (%d keys)", len(self._remote_keys))
+        return True
+
+    async def refresh_forever(self, client: httpx.AsyncClient) -> None:
+        while True:
+            await asyncio.sleep(self.settings.jwks_refresh_seconds)
+            await self.refresh(client)
+
+    async def ensure_key(self, token: str, client: httpx.AsyncClient) -> None:
+        """Refresh once if the token is signed by a key we have not seen (key rotation)."""
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+        except jwt.InvalidTokenError:
+            return
+        if kid is None or self._knows(kid):
+            return
+        if time.monotonic() - self._last_refresh < UNKNOWN_KID_REFRESH_INTERVAL:
+            return
+        await self.refresh(client, kid=kid, min_interval=UNKNOWN_KID_REFRESH_INTERVAL)
+
+    def decode(self, token: str) -> dict:
+        """Verify signature and claims. CPU-bound; callers run it in an executor."""
+        try:
+            header = jwt.get_unverified_header(token)
+            key = self.key_for(header.get("kid"))
+            if key is None:
+                raise TokenVerificationError("Unknown signing key")
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=ALLOWED_ALGORITHMS,
+                leeway=self.settings.jwt_leeway_seconds,
+                options={"require": ["exp", "sub"], "verify_aud": False},
+            )
+        except jwt.InvalidTokenError as exc:
+            raise TokenVerificationError(str(exc)) from exc
+
+        azp = claims.get("azp")
+        if azp and azp.rstrip("/") != self.settings.authorized_party:
+            raise TokenVerificationError("Invalid authorized party")
+        return claims
@@ -1,3 +1,6 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
 import httpx
 from clerk_backend_api import Clerk
 from clerk_backend_api.security.types import AuthenticateRequestOptions
@@ -5,19 +8,52 @@ from fastapi import FastAPI, Header, HTTPException
 
 from services.common.config import get_settings
 from services.common.logging import configure_logger
-from services.common.schemas import ServiceHealth, VerifyResponse
+from services.common.metrics import instrument_app
+from services.common.schemas import (
+    BatchVerifyRequest,
+    BatchVerifyResponse,
+    BatchVerifyResult,
+    ServiceHealth,
+    VerifyResponse,
+)
+from services.common.tracing import trace_app
+
+from .jwks import JWKSStore, TokenVerificationError
 
 
 settings = get_settings()
 logger = configure_logger("auth-service")
 
 if not settings.clerk_secret_key:
-    logger.warning("CLERK_SECRET_KEY is not configured; all requests will fail.")
+    logger.warning("CLERK_SECRET_KEY is not configured; only offline JWKS verification is available.")
     clerk_sdk: Clerk | None = None
 else:
     clerk_sdk = Clerk(bearer_auth=settings.clerk_secret_key)
 
+jwks_store = JWKSStore(settings)
+verify_executor = ThreadPoolExecutor(
+    max_workers=settings.auth_verify_workers,
+    thread_name_prefix="jwt-verify",
+)
+
 app = FastAPI(title="Photure Auth Service", version="0.1.0")
+instrument_app(app)
+trace_app(app, "auth-service")
+
+
+@app.on_event("startup")
+async def startup():
+    app.state.http_client = httpx.AsyncClient(timeout=10)
+    jwks_store.load_static()
+    await jwks_store.refresh(app.state.http_client)
+    app.state.jwks_refresher = asyncio.create_task(jwks_store.refresh_forever(app.state.http_client))
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.jwks_refresher.cancel()
+    await app.state.http_client.aclose()
+    verify_executor.shutdown(wait=False)
 
 
 @app.get("/health", response_model=ServiceHealth)
@@ -29,18 +65,17 @@ async def health() -> ServiceHealth:
     )
 
 
-@app.post("/verify", response_model=VerifyResponse)
-async def verify_token(authorization: str = Header(None, alias="Authorization")) -> VerifyResponse:
+def extract_token(authorization: str | None) -> str:
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing Authorization header")
 
-    if not clerk_sdk:
-        raise HTTPException(status_code=500, detail="Authentication not configured")
-
     token = authorization.replace("Bearer ", "").strip()
     if not token:
         raise HTTPException(status_code=401, detail="Invalid Authorization header")
+    return token
+
 
+def authenticate_with_clerk(token: str) -> dict:
     headers = {"Authorization": f"Bearer {token}"}
     mock_request = httpx.Request("GET", settings.authorized_party, headers=headers)
 
@@ -57,12 +92,45 @@ async def verify_token(authorization: str = Header(None, alias="Authorization"))
 
     if not request_state.is_signed_in or not request_state.payload:
         raise HTTPException(status_code=401, detail="User not signed in")
+    return request_state.payload
+
+
+async def verify(token: str) -> VerifyResponse:
+    loop = asyncio.get_running_loop()
+
+    if jwks_store.ready:
+        await jwks_store.ensure_key(token, app.state.http_client)
+        try:
+            claims = await loop.run_in_executor(verify_executor, jwks_store.decode, token)
+        except TokenVerificationError as exc:
+            raise HTTPException(status_code=401, detail=f"Authentication failed: {exc}") from exc
+    elif clerk_sdk:
+        # No signing keys available yet: let the Clerk SDK verify, off the event loop.
+        claims = await loop.run_in_executor(verify_executor, authenticate_with_clerk, token)
+    else:
+        raise HTTPException(status_code=500, detail="Authentication not configured")
 
-    user_id = request_state.payload.get("sub")
-    session_id = request_state.payload.get("sid")
-
+    user_id = claims.get("sub")
     if not user_id:
         raise HTTPException(status_code=401, detail="User ID missing in token")
 
-    return VerifyResponse(user_id=user_id, session_id=session_id)
+    return VerifyResponse(user_id=user_id, session_id=claims.get("sid"))
+
+
+@app.post("/verify", response_model=VerifyResponse)
+async def verify_token(authorization: str = Header(None, alias="Authorization")) -> VerifyResponse:
+    token = extract_token(authorization)
+    return await verify(token)
+
+
+@app.post("/verify/batch", response_model=BatchVerifyResponse)
+async def verify_tokens(payload: BatchVerifyRequest) -> BatchVerifyResponse:
+    async def verify_one(raw: str) -> BatchVerifyResult:
+        try:
+            user = await verify(extract_token(raw))
+        except HTTPException as exc:
+            return BatchVerifyResult(status_code=exc.status_code, detail=exc.detail)
+        return BatchVerifyResult(status_code=200, user_id=user.user_id, session_id=user.session_id)
 
+    results = await asyncio.gather(*(verify_one(token) for token in payload.tokens))
+    return BatchVerifyResponse(results=list(results))
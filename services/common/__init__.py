@@ -2,14 +2,41 @@
 
 from .config import get_settings  # noqa: F401
 from .schemas import (  # noqa: F401
+    BatchUploadResponse,
+    BatchUploadResult,
+    BatchVerifyRequest,
+    BatchVerifyResponse,
+    BatchVerifyResult,
+    BulkDeleteResponse,
     CreatePhotoRequest,
+    CreatePhotoResult,
+    CreatePhotosRequest,
+    CreatePhotosResponse,
+    DeletedPhoto,
     DeletePhotoResult,
+    DeletePhotosRequest,
+    DeletePhotosResult,
+    ExportedPhoto,
+    ExportPhotosRequest,
+    ImageInfo,
+    MediaBatchUploadResponse,
+    MediaBatchUploadResult,
+    MediaDeleteRequest,
+    MediaDeleteResponse,
+    MediaLocation,
     MediaUploadResponse,
+    PhotoCluster,
+    PhotoClusterList,
+    PhotoClusterMetadata,
+    PhotoClusterMetadataList,
     PhotoListResponse,
     PhotoMetadata,
     PhotoMetadataList,
     PhotoResponse,
     ServiceHealth,
+    Timeline,
+    TimelineBucket,
+    UserStats,
     VerifyResponse,
 )
 
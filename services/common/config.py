@@ -6,15 +6,103 @@ import os
 class Settings(BaseModel):
     environment: str = Field(default=os.getenv("ENVIRONMENT", "development"))
     log_level: str = Field(default=os.getenv("LOG_LEVEL", "INFO"))
+    log_format: str = Field(default=os.getenv("LOG_FORMAT", "json"))
+    trace_sample_ratio: float = Field(default=float(os.getenv("TRACE_SAMPLE_RATIO", 0.1)))
+    trace_exporter: str = Field(default=os.getenv("TRACE_EXPORTER", "none"))
+    trace_file: str = Field(default=os.getenv("TRACE_FILE", "/tmp/photure-spans.jsonl"))
+    otlp_endpoint: str = Field(default=os.getenv("OTLP_ENDPOINT", "http://otel-collector:4318/v1/traces"))
     clerk_secret_key: str | None = Field(default=os.getenv("CLERK_SECRET_KEY"))
+    clerk_jwks_url: str = Field(default=os.getenv("CLERK_JWKS_URL", "https://api.clerk.com/v1/jwks"))
+    clerk_jwks_file: str | None = Field(default=os.getenv("CLERK_JWKS_FILE"))
+    clerk_jwks: str | None = Field(default=os.getenv("CLERK_JWKS"))
+    clerk_jwt_key: str | None = Field(default=os.getenv("CLERK_JWT_KEY"))
+    jwks_refresh_seconds: float = Field(default=float(os.getenv("JWKS_REFRESH_SECONDS", 3600)))
+    jwt_leeway_seconds: float = Field(default=float(os.getenv("JWT_LEEWAY_SECONDS", 5)))
+    auth_verify_workers: int = Field(default=int(os.getenv("AUTH_VERIFY_WORKERS", 4)))
     authorized_party: str = Field(default=os.getenv("AUTHORIZED_PARTY", "http://localhost").rstrip("/"))
     mongodb_url: str = Field(default=os.getenv("MONGODB_URL", "mongodb://mongodb:27017"))
     database_name: str = Field(default=os.getenv("DATABASE_NAME", "photure"))
     upload_dir: str = Field(default=os.getenv("UPLOAD_DIR", "/app/uploads"))
+    storage_backend: str = Field(default=os.getenv("STORAGE_BACKEND", "local"))
+    s3_bucket: str = Field(default=os.getenv("S3_BUCKET", "photure-media"))
+    s3_prefix: str = Field(default=os.getenv("S3_PREFIX", ""))
+    s3_endpoint_url: str | None = Field(default=os.getenv("S3_ENDPOINT_URL") or None)
+    s3_region: str | None = Field(default=os.getenv("S3_REGION") or None)
+    s3_access_key_id: str | None = Field(default=os.getenv("S3_ACCESS_KEY_ID") or None)
+    s3_secret_access_key: str | None = Field(default=os.getenv("S3_SECRET_ACCESS_KEY") or None)
+    s3_multipart_threshold: int = Field(default=int(os.getenv("S3_MULTIPART_THRESHOLD", 8 * 1024 * 1024)))
+    s3_part_size: int = Field(default=int(os.getenv("S3_PART_SIZE", 8 * 1024 * 1024)))
+    s3_max_concurrency: int = Field(default=int(os.getenv("S3_MAX_CONCURRENCY", 8)))
+    s3_max_pool_connections: int = Field(default=int(os.getenv("S3_MAX_POOL_CONNECTIONS", 32)))
     auth_service_url: str = Field(default=os.getenv("AUTH_SERVICE_URL", "http://auth-service:8010"))
     media_service_url: str = Field(default=os.getenv("MEDIA_SERVICE_URL", "http://media-service:8030"))
     gallery_service_url: str = Field(default=os.getenv("GALLERY_SERVICE_URL", "http://gallery-service:8020"))
+    upstream_transport: str = Field(default=os.getenv("UPSTREAM_TRANSPORT", "http"))
+    upstream_max_connections: int = Field(default=int(os.getenv("UPSTREAM_MAX_CONNECTIONS", 100)))
+    upstream_max_keepalive_connections: int = Field(default=int(os.getenv("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS", 20)))
+    upstream_keepalive_expiry_seconds: float = Field(default=float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY_SECONDS", 30)))
+    upstream_connect_timeout_seconds: float = Field(default=float(os.getenv("UPSTREAM_CONNECT_TIMEOUT_SECONDS", 2)))
+    upstream_read_timeout_seconds: float = Field(default=float(os.getenv("UPSTREAM_READ_TIMEOUT_SECONDS", 10)))
+    upstream_pool_timeout_seconds: float = Field(default=float(os.getenv("UPSTREAM_POOL_TIMEOUT_SECONDS", 5)))
+    auth_read_timeout_seconds: float = Field(default=float(os.getenv("AUTH_READ_TIMEOUT_SECONDS", 3)))
+    media_read_timeout_seconds: float = Field(default=float(os.getenv("MEDIA_READ_TIMEOUT_SECONDS", 30)))
+    upload_timeout_seconds: float = Field(default=float(os.getenv("UPLOAD_TIMEOUT_SECONDS", 120)))
+    upstream_http2: bool = Field(default=os.getenv("UPSTREAM_HTTP2", "false").lower() in ("1", "true", "yes"))
+    upstream_retries: int = Field(default=int(os.getenv("UPSTREAM_RETRIES", 2)))
+    upstream_retry_backoff_seconds: float = Field(default=float(os.getenv("UPSTREAM_RETRY_BACKOFF_SECONDS", 0.05)))
+    breaker_failure_threshold: int = Field(default=int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5)))
+    breaker_reset_seconds: float = Field(default=float(os.getenv("BREAKER_RESET_SECONDS", 10)))
     max_upload_bytes: int = Field(default=int(os.getenv("MAX_UPLOAD_BYTES", 20 * 1024 * 1024)))
+    max_batch_files: int = Field(default=int(os.getenv("MAX_BATCH_FILES", 50)))
+    upload_batch_concurrency: int = Field(default=int(os.getenv("UPLOAD_BATCH_CONCURRENCY", 4)))
+    media_delete_concurrency: int = Field(default=int(os.getenv("MEDIA_DELETE_CONCURRENCY", 16)))
+    user_quota_bytes: int = Field(default=int(os.getenv("USER_QUOTA_BYTES", 0)))
+    variant_sizes: list[int] = Field(
+        default=[int(size) for size in os.getenv("VARIANT_SIZES", "256,1024,2048").split(",") if size]
+    )
+    eager_variant_sizes: list[int] = Field(
+        default=[int(size) for size in os.getenv("EAGER_VARIANT_SIZES", "256").split(",") if size]
+    )
+    variant_cache_bytes: int = Field(default=int(os.getenv("VARIANT_CACHE_BYTES", 2 * 1024 * 1024 * 1024)))
+    variant_workers: int = Field(default=int(os.getenv("VARIANT_WORKERS", 2)))
+    media_delivery: str = Field(default=os.getenv("MEDIA_DELIVERY", "proxy"))
+    media_url_signing_key: str | None = Field(default=os.getenv("MEDIA_URL_SIGNING_KEY") or None)
+    signed_url_ttl_seconds: int = Field(default=int(os.getenv("SIGNED_URL_TTL_SECONDS", 3600)))
+    accel_redirect_prefix: str = Field(default=os.getenv("ACCEL_REDIRECT_PREFIX", "/_protected_media"))
+    photo_cache_max_entries: int = Field(default=int(os.getenv("PHOTO_CACHE_MAX_ENTRIES", 50_000)))
+    photo_cache_ttl_seconds: float = Field(default=float(os.getenv("PHOTO_CACHE_TTL_SECONDS", 600)))
+    auth_cache_max_entries: int = Field(default=int(os.getenv("AUTH_CACHE_MAX_ENTRIES", 10_000)))
+    auth_cache_ttl_seconds: float = Field(default=float(os.getenv("AUTH_CACHE_TTL_SECONDS", 60)))
+    auth_cache_negative_ttl_seconds: float = Field(default=float(os.getenv("AUTH_CACHE_NEGATIVE_TTL_SECONDS", 5)))
+    job_executor: str = Field(default=os.getenv("JOB_EXECUTOR", "process"))
+    job_workers: int = Field(default=int(os.getenv("JOB_WORKERS", 2)))
+    job_concurrency: int = Field(default=int(os.getenv("JOB_CONCURRENCY", 4)))
+    job_lease_seconds: float = Field(default=float(os.getenv("JOB_LEASE_SECONDS", 60)))
+    job_max_attempts: int = Field(default=int(os.getenv("JOB_MAX_ATTEMPTS", 5)))
+    job_backoff_seconds: float = Field(default=float(os.getenv("JOB_BACKOFF_SECONDS", 5)))
+    job_max_backoff_seconds: float = Field(default=float(os.getenv("JOB_MAX_BACKOFF_SECONDS", 600)))
+    job_poll_seconds: float = Field(default=float(os.getenv("JOB_POLL_SECONDS", 1)))
+    job_retention_seconds: float = Field(default=float(os.getenv("JOB_RETENTION_SECONDS", 86400)))
+    job_worker_embedded: bool = Field(
+        default=os.getenv("JOB_WORKER_EMBEDDED", "false").lower() in ("1", "true", "yes")
+    )
+    job_metrics_port: int = Field(default=int(os.getenv("JOB_METRICS_PORT", 9105)))
+    export_prefetch: int = Field(default=int(os.getenv("EXPORT_PREFETCH", 4)))
+    export_buffer_bytes: int = Field(default=int(os.getenv("EXPORT_BUFFER_BYTES", 1024 * 1024)))
+    similar_index_max_users: int = Field(default=int(os.getenv("SIMILAR_INDEX_MAX_USERS", 64)))
+    similar_index_ttl_seconds: float = Field(default=float(os.getenv("SIMILAR_INDEX_TTL_SECONDS", 300)))
+    admission_store: str = Field(default=os.getenv("ADMISSION_STORE", "memory"))
+    admission_redis_url: str = Field(default=os.getenv("ADMISSION_REDIS_URL", "redis://redis:6379/0"))
+    admission_max_wait_seconds: float = Field(default=float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", 5)))
+    admission_max_queue: int = Field(default=int(os.getenv("ADMISSION_MAX_QUEUE", 256)))
+    upload_rate_per_second: float = Field(default=float(os.getenv("UPLOAD_RATE_PER_SECOND", 2)))
+    upload_burst: int = Field(default=int(os.getenv("UPLOAD_BURST", 20)))
+    upload_max_concurrency: int = Field(default=int(os.getenv("UPLOAD_MAX_CONCURRENCY", 32)))
+    upload_max_concurrency_per_user: int = Field(default=int(os.getenv("UPLOAD_MAX_CONCURRENCY_PER_USER", 4)))
+    serve_rate_per_second: float = Field(default=float(os.getenv("SERVE_RATE_PER_SECOND", 50)))
+    serve_burst: int = Field(default=int(os.getenv("SERVE_BURST", 200)))
+    serve_max_concurrency: int = Field(default=int(os.getenv("SERVE_MAX_CONCURRENCY", 256)))
+    serve_max_concurrency_per_user: int = Field(default=int(os.getenv("SERVE_MAX_CONCURRENCY_PER_USER", 32)))
 
 
 @lru_cache
@@ -0,0 +1,185 @@
+"""Run Photure services inside the gateway process ("monolith mode").
+
+With UPSTREAM_TRANSPORT=inprocess the gateway imports the auth, media and
+gallery apps, runs their lifespans next to its own and gives each
+UpstreamClient an InProcessTransport instead of a connection pool. Calls still
+pass through the service's full ASGI stack (routing, validation, middleware),
+so both deployments behave the same; only sockets, HTTP parsing and the pool
+are gone.
+"""
+
+import asyncio
+import importlib
+from contextlib import AsyncExitStack
+from typing import Any, AsyncIterator
+
+import httpx
+from fastapi import FastAPI
+from starlette.types import ASGIApp, Message
+
+from .logging import configure_logger
+
+
+logger = configure_logger("inprocess")
+
+# Body chunks the app may produce ahead of the reader; keeps relays constant-memory.
+RESPONSE_BUFFER_CHUNKS = 1
+
+
+class InProcessStream(httpx.AsyncByteStream):
+    def __init__(self, exchange: "_Exchange") -> None:
+        self.exchange = exchange
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        while not self.exchange.complete:
+            message = await self.exchange.next_message()
+            if message is None:
+                break
+            self.exchange.complete = not message.get("more_body", False)
+            body = message.get("body", b"")
+            if body and self.exchange.scope["method"] != "HEAD":
+                # Servers accept any buffer (media sends memoryviews); callers expect bytes.
+                yield bytes(body)
+
+    async def aclose(self) -> None:
+        await self.exchange.close()
+
+
+class _Exchange:
+    """One request/response between the caller and an app task."""
+
+    def __init__(self, app: ASGIApp, request: httpx.Request, scope: dict[str, Any]) -> None:
+        self.app = app
+        self.request = request
+        self.scope = scope
+        self.read_timeout = request.extensions.get("timeout", {}).get("read")
+        self.chunks = request.stream.__aiter__()
+        self.request_complete = False
+        self.body_error: Exception | None = None
+        self.complete = False
+        self.disconnected = asyncio.Event()
+        self.messages: asyncio.Queue[Message | None] = asyncio.Queue(RESPONSE_BUFFER_CHUNKS)
+        self.task: asyncio.Task | None = None
+
+    async def receive(self) -> Message:
+        if self.request_complete:
+            await self.disconnected.wait()
+            return {"type": "http.disconnect"}
+        try:
+            body = await self.chunks.__anext__()
+        except StopAsyncIteration:
+            self.request_complete = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        except Exception as exc:
+            # The caller's body failed (e.g. its own client went away); to the app
+            # that looks like a disconnect, and the caller gets the error back.
+            self.request_complete = True
+            self.body_error = exc
+            return {"type": "http.disconnect"}
+        return {"type": "http.request", "body": bytes(body), "more_body": True}
+
+    async def send(self, message: Message) -> None:
+        if not self.disconnected.is_set():
+            await self.messages.put(message)
+
+    async def run(self) -> None:
+        try:
+            await self.app(self.scope, self.receive, self.send)
+        except Exception:
+            logger.exception("Exception in in-process %s %s", self.scope["method"], self.scope["path"])
+        finally:
+            if not self.disconnected.is_set():
+                await self.messages.put(None)
+
+    async def next_message(self) -> Message | None:
+        while True:
+            try:
+                message = await asyncio.wait_for(self.messages.get(), self.read_timeout)
+            except asyncio.TimeoutError:
+                # Like a socket read timeout, the clock only runs once the request is sent.
+                if not self.request_complete:
+                    continue
+                await self.close()
+                raise httpx.ReadTimeout("In-process read timed out", request=self.request) from None
+            if self.body_error is not None:
+                await self.close()
+                raise self.body_error
+            return message
+
+    async def close(self) -> None:
+        if self.disconnected.is_set():
+            return
+        self.disconnected.set()
+        # Unblock an app waiting to hand over a chunk nobody will read.
+        while not self.messages.empty():
+            self.messages.get_nowait()
+        # A finished response may still be running background tasks; let those be.
+        if not self.complete and self.task is not None and not self.task.done():
+            self.task.cancel()
+
+
+class InProcessTransport(httpx.AsyncBaseTransport):
+    """Hands httpx requests to an ASGI app running in this process.
+
+    Unlike httpx.ASGITransport, the response body is streamed: the app runs in
+    its own task and each chunk waits for the caller to read the previous one,
+    so relaying a large original never buffers it whole.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self._exchanges: set[_Exchange] = set()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": request.method,
+            "headers": [(name.lower(), value) for name, value in request.headers.raw],
+            "scheme": request.url.scheme,
+            "path": request.url.path,
+            "raw_path": request.url.raw_path.split(b"?")[0],
+            "query_string": request.url.query,
+            "server": (request.url.host, request.url.port),
+            "client": ("127.0.0.1", 0),
+            "root_path": "",
+        }
+        exchange = _Exchange(self.app, request, scope)
+        exchange.task = asyncio.create_task(exchange.run())
+        self._exchanges.add(exchange)
+        exchange.task.add_done_callback(lambda _: self._exchanges.discard(exchange))
+
+        message = await exchange.next_message()
+        if message is None:
+            # The app failed before starting a response; a server would answer 500.
+            exchange.complete = True
+            return httpx.Response(500, stream=InProcessStream(exchange))
+        return httpx.Response(
+            message["status"],
+            headers=message.get("headers", []),
+            stream=InProcessStream(exchange),
+        )
+
+    async def aclose(self) -> None:
+        tasks = [exchange.task for exchange in self._exchanges]
+        for exchange in list(self._exchanges):
+            exchange.complete = False
+            await exchange.close()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def load_app(target: str) -> FastAPI:
+    module_name, _, attribute = target.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+async def start_services(stack: AsyncExitStack, targets: dict[str, str]) -> dict[str, InProcessTransport]:
+    """Import each `module:app` target, enter its lifespan on `stack` and return its transport."""
+    transports = {}
+    for name, target in targets.items():
+        service = load_app(target)
+        await stack.enter_async_context(service.router.lifespan_context(service))
+        transports[name] = InProcessTransport(service)
+        logger.info("Started %s in-process", name)
+    return transports
@@ -0,0 +1,409 @@
+"""Durable background jobs stored in MongoDB.
+
+Producers `enqueue` a job, optionally under an idempotency key so a retried
+request does not queue the same work twice. Workers `claim` jobs one at a time
+with find_one_and_update, which atomically marks a job running under a lease.
+A worker keeps renewing the lease while the handler runs; if the worker dies,
+the job becomes claimable again once the lease expires (the visibility
+timeout). Failed attempts are retried with jittered exponential backoff until
+JOB_MAX_ATTEMPTS, after which the job is kept as `failed` for
+JOB_RETENTION_SECONDS; enqueueing its idempotency key again requeues it.
+
+Handlers take the job's payload dict. Coroutine functions run on the worker's
+event loop; plain functions run on its thread or process pool (JOB_EXECUTOR),
+so with the process pool they must be importable module-level functions.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import random
+import secrets
+import socket
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable
+
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from .config import Settings, get_settings
+from .logging import configure_logger
+from .metrics import JOB_DURATION, JOB_OUTCOMES, JOB_QUEUE_DEPTH, JOB_WAIT
+from .mongo import get_database
+
+
+logger = configure_logger("jobs")
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+STATUSES = (QUEUED, RUNNING, DONE, FAILED)
+
+Handler = Callable[[dict], Any]
+
+
+@dataclass
+class Job:
+    id: ObjectId
+    kind: str
+    payload: dict
+    attempts: int
+    attempts_left: int
+    lease_id: str
+    run_at: datetime
+    created_at: datetime
+
+    @classmethod
+    def from_document(cls, doc: dict) -> "Job":
+        return cls(
+            id=doc["_id"],
+            kind=doc["kind"],
+            payload=doc["payload"],
+            attempts=doc["attempts"],
+            attempts_left=doc["attempts_left"],
+            lease_id=doc["lease_id"],
+            run_at=doc["run_at"],
+            created_at=doc["created_at"],
+        )
+
+
+class JobQueue:
+    def __init__(
+        self,
+        *,
+        lease_seconds: float = 60,
+        max_attempts: int = 5,
+        backoff_seconds: float = 5,
+        max_backoff_seconds: float = 600,
+        retention_seconds: float = 86400,
+    ) -> None:
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.retention_seconds = retention_seconds
+
+    @property
+    def collection(self):
+        return get_database().jobs
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index(
+            [("status", ASCENDING), ("kind", ASCENDING), ("run_at", ASCENDING)],
+            name="claim",
+        )
+        await self.collection.create_index(
+            [("status", ASCENDING), ("lease_until", ASCENDING)],
+            name="expired_leases",
+        )
+        await self.collection.create_index("idempotency_key", name="idempotency_key", unique=True, sparse=True)
+        # Finished jobs are kept for inspection, then dropped by Mongo's TTL monitor.
+        await self.collection.create_index("expire_at", name="expire_at", expireAfterSeconds=0)
+
+    async def enqueue(
+        self,
+        kind: str,
+        payload: dict,
+        *,
+        idempotency_key: str | None = None,
+        delay: float = 0.0,
+        max_attempts: int | None = None,
+    ) -> ObjectId:
+        """Queue a job and return its id.
+
+        With an idempotency key, a job already stored under that key (queued,
+        running or done within JOB_RETENTION_SECONDS) is returned instead; a
+        failed one is reset and queued again under the same id.
+        """
+        now = datetime.utcnow()
+        attempts = max_attempts or self.max_attempts
+        doc = {
+            "kind": kind,
+            "payload": payload,
+            "status": QUEUED,
+            "attempts": 0,
+            "attempts_left": attempts,
+            "max_attempts": attempts,
+            "run_at": now + timedelta(seconds=delay),
+            "created_at": now,
+        }
+        if idempotency_key is None:
+            result = await self.collection.insert_one(doc)
+            return result.inserted_id
+
+        doc["idempotency_key"] = idempotency_key
+        retried = await self.collection.find_one_and_update(
+            {"idempotency_key": idempotency_key, "status": FAILED},
+            {"$set": doc, "$unset": {"expire_at": "", "finished_at": "", "error": ""}},
+        )
+        if retried is not None:
+            return retried["_id"]
+        try:
+            stored = await self.collection.find_one_and_update(
+                {"idempotency_key": idempotency_key},
+                {"$setOnInsert": doc},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Lost an upsert race on the unique index; the winner's job is the one.
+            stored = await self.collection.find_one({"idempotency_key": idempotency_key})
+        return stored["_id"]
+
+    async def claim(self, kinds: list[str], worker_id: str) -> Job | None:
+        now = datetime.utcnow()
+        doc = await self.collection.find_one_and_update(
+            {
+                "kind": {"$in": kinds},
+                "attempts_left": {"$gt": 0},
+                "$or": [
+                    {"status": QUEUED, "run_at": {"$lte": now}},
+                    {"status": RUNNING, "lease_until": {"$lte": now}},
+                ],
+            },
+            {
+                "$set": {
+                    "status": RUNNING,
+                    "worker": worker_id,
+                    "lease_id": secrets.token_hex(8),
+                    "lease_until": now + timedelta(seconds=self.lease_seconds),
+                    "started_at": now,
+                },
+                "$inc": {"attempts": 1, "attempts_left": -1},
+            },
+            sort=[("run_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+        return Job.from_document(doc) if doc is not None else None
+
+    async def heartbeat(self, job: Job) -> bool:
+        """Extend the lease; False means it was lost and another worker may have the job."""
+        result = await self.collection.update_one(
+            {"_id": job.id, "lease_id": job.lease_id, "status": RUNNING},
+            {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=self.lease_seconds)}},
+        )
+        return result.modified_count == 1
+
+    async def complete(self, job: Job) -> bool:
+        now = datetime.utcnow()
+        result = await self.collection.update_one(
+            {"_id": job.id, "lease_id": job.lease_id, "status": RUNNING},
+            {
+                "$set": {
+                    "status": DONE,
+                    "finished_at": now,
+                    "expire_at": now + timedelta(seconds=self.retention_seconds),
+                },
+                "$unset": {"lease_until": "", "error": ""},
+            },
+        )
+        return result.modified_count == 1
+
+    async def fail(self, job: Job, error: str) -> bool:
+        """Record a failed attempt; returns True if the job will be retried."""
+        now = datetime.utcnow()
+        retry = job.attempts_left > 0
+        if retry:
+            # Full jitter, as for upstream retries, so a burst of failures spreads out.
+            backoff = random.uniform(0, min(self.backoff_seconds * 2 ** (job.attempts - 1), self.max_backoff_seconds))
+            update = {"status": QUEUED, "run_at": now + timedelta(seconds=backoff), "error": error}
+        else:
+            update = {
+                "status": FAILED,
+                "finished_at": now,
+                "error": error,
+                "expire_at": now + timedelta(seconds=self.retention_seconds),
+            }
+        await self.collection.update_one(
+            {"_id": job.id, "lease_id": job.lease_id, "status": RUNNING},
+            {"$set": update, "$unset": {"lease_until": ""}},
+        )
+        return retry
+
+    async def reap(self) -> int:
+        """Fail jobs whose last attempt's lease expired; nothing else would claim them."""
+        now = datetime.utcnow()
+        result = await self.collection.update_many(
+            {"status": RUNNING, "lease_until": {"$lte": now}, "attempts_left": {"$lte": 0}},
+            {
+                "$set": {
+                    "status": FAILED,
+                    "finished_at": now,
+                    "error": "Lease expired on the last attempt",
+                    "expire_at": now + timedelta(seconds=self.retention_seconds),
+                },
+                "$unset": {"lease_until": ""},
+            },
+        )
+        return result.modified_count
+
+    async def stats(self) -> dict:
+        """Job counts by kind and status, plus the age of the oldest runnable job."""
+        counts: dict[str, dict[str, int]] = {}
+        async for row in self.collection.aggregate([
+            {"$group": {"_id": {"kind": "$kind", "status": "$status"}, "count": {"$sum": 1}}},
+        ]):
+            counts.setdefault(row["_id"]["kind"], dict.fromkeys(STATUSES, 0))[row["_id"]["status"]] = row["count"]
+
+        oldest = await self.collection.find_one(
+            {"status": QUEUED, "run_at": {"$lte": datetime.utcnow()}},
+            sort=[("run_at", ASCENDING)],
+            projection={"run_at": 1},
+        )
+        lag = (datetime.utcnow() - oldest["run_at"]).total_seconds() if oldest else 0.0
+        for kind, by_status in counts.items():
+            for status in (QUEUED, RUNNING, FAILED):
+                JOB_QUEUE_DEPTH.labels(kind, status).set(by_status[status])
+        return {"kinds": counts, "oldest_queued_seconds": round(lag, 3)}
+
+
+def create_job_queue(settings: Settings | None = None) -> JobQueue:
+    settings = settings or get_settings()
+    return JobQueue(
+        lease_seconds=settings.job_lease_seconds,
+        max_attempts=settings.job_max_attempts,
+        backoff_seconds=settings.job_backoff_seconds,
+        max_backoff_seconds=settings.job_max_backoff_seconds,
+        retention_seconds=settings.job_retention_seconds,
+    )
+
+
+def create_executor(settings: Settings | None = None) -> Executor:
+    settings = settings or get_settings()
+    if settings.job_executor == "thread":
+        return ThreadPoolExecutor(max_workers=settings.job_workers, thread_name_prefix="job")
+    if settings.job_executor == "process":
+        # Spawned workers keep the pool independent of the event loop's threads.
+        return ProcessPoolExecutor(
+            max_workers=settings.job_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    raise ValueError(f"Unknown JOB_EXECUTOR {settings.job_executor!r}")
+
+
+class Worker:
+    """Claims and runs jobs, up to `concurrency` at a time."""
+
+    # Seconds between sweeps for abandoned last attempts and queue-depth refreshes.
+    MAINTENANCE_INTERVAL = 30
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handlers: dict[str, Handler],
+        *,
+        executor: Executor | None = None,
+        concurrency: int = 4,
+        poll_interval: float = 1.0,
+        worker_id: str | None = None,
+    ) -> None:
+        self.queue = queue
+        self.handlers = handlers
+        self.executor = executor
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+
+    async def run(self, stop: asyncio.Event) -> None:
+        logger.info("Worker %s handling %s", self.worker_id, ", ".join(sorted(self.handlers)))
+        slots = [asyncio.create_task(self._slot(stop)) for _ in range(self.concurrency)]
+        slots.append(asyncio.create_task(self._maintain(stop)))
+        try:
+            await asyncio.gather(*slots)
+        finally:
+            for slot in slots:
+                slot.cancel()
+            await asyncio.gather(*slots, return_exceptions=True)
+
+    async def _slot(self, stop: asyncio.Event) -> None:
+        kinds = list(self.handlers)
+        while not stop.is_set():
+            try:
+                job = await self.queue.claim(kinds, self.worker_id)
+            except PyMongoError:
+                logger.warning("Could not claim a job", exc_info=True)
+                job = None
+            if job is None:
+                # Jitter keeps idle slots from polling in lockstep.
+                await self._sleep(stop, self.poll_interval * random.uniform(0.5, 1.5))
+                continue
+            await self._execute(job)
+
+    async def _execute(self, job: Job) -> None:
+        handler = self.handlers[job.kind]
+        JOB_WAIT.labels(job.kind).observe(max((datetime.utcnow() - job.run_at).total_seconds(), 0.0))
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        self.running += 1
+        started = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(handler):
+                await handler(job.payload)
+            else:
+                await asyncio.get_running_loop().run_in_executor(self.executor, handler, job.payload)
+        except Exception as exc:
+            JOB_DURATION.labels(job.kind, "error").observe(time.perf_counter() - started)
+            retry = await self.queue.fail(job, f"{type(exc).__name__}: {exc}")
+            JOB_OUTCOMES.labels(job.kind, "retry" if retry else "failed").inc()
+            self.failed += 1
+            logger.warning(
+                "Job %s (%s) failed on attempt %d%s",
+                job.id,
+                job.kind,
+                job.attempts,
+                "; will retry" if retry else "; giving up",
+                exc_info=True,
+            )
+        else:
+            JOB_DURATION.labels(job.kind, "ok").observe(time.perf_counter() - started)
+            if not await self.queue.complete(job):
+                logger.warning("Job %s (%s) finished after its lease was lost", job.id, job.kind)
+            JOB_OUTCOMES.labels(job.kind, "done").inc()
+            self.completed += 1
+        finally:
+            self.running -= 1
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job: Job) -> None:
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            try:
+                if not await self.queue.heartbeat(job):
+                    logger.warning("Lost the lease on job %s (%s)", job.id, job.kind)
+                    return
+            except PyMongoError:
+                logger.warning("Could not renew the lease on job %s", job.id, exc_info=True)
+
+    async def _maintain(self, stop: asyncio.Event) -> None:
+        while not stop.is_set():
+            try:
+                reaped = await self.queue.reap()
+                if reaped:
+                    logger.warning("Marked %d abandoned jobs as failed", reaped)
+                await self.queue.stats()
+            except PyMongoError:
+                logger.warning("Job queue maintenance failed", exc_info=True)
+            await self._sleep(stop, self.MAINTENANCE_INTERVAL)
+
+    @staticmethod
+    async def _sleep(stop: asyncio.Event, seconds: float) -> None:
+        try:
+            await asyncio.wait_for(stop.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "concurrency": self.concurrency,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
@@ -1,7 +1,56 @@
+import atexit
+import json
 import logging
+import queue
 import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
 
 from .config import get_settings
+from .tracing import current_span
+
+
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_listener: QueueListener | None = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+            entry["span_id"] = record.span_id
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TraceQueueHandler(QueueHandler):
+    """Hands records to the listener thread; only cheap work runs on the caller's thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        span = current_span()
+        record.trace_id = span.trace_id if span else None
+        record.span_id = span.span_id if span else None
+        # Freeze the message now; its arguments may change before the listener runs.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def _start_listener(formatter: logging.Formatter) -> None:
+    global _listener
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(formatter)
+    _listener = QueueListener(_log_queue, handler, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
 
 
 def configure_logger(name: str) -> logging.Logger:
@@ -9,18 +58,20 @@ def configure_logger(name: str) -> logging.Logger:
     if logger.handlers:
         return logger
 
-    handler = logging.StreamHandler(sys.stdout)
-    formatter = logging.Formatter(
-        "%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-    )
-    handler.setFormatter(formatter)
+    settings = get_settings()
+    if _listener is None:
+        if settings.log_format == "json":
+            formatter = JsonFormatter()
+        else:
+            formatter = logging.Formatter(
+                "%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+                datefmt="%Y-%m-%d %H:%M:%S",
+            )
+        _start_listener(formatter)
 
-    logger.addHandler(handler)
+    logger.addHandler(TraceQueueHandler(_log_queue))
 
-    settings = get_settings()
     level = getattr(logging, settings.log_level.upper(), logging.INFO)
     logger.setLevel(level)
     logger.propagate = False
     return logger
-
@@ -0,0 +1,170 @@
+"""Prometheus metrics shared by the Photure services.
+
+`instrument_app` adds request timing and a `/metrics` endpoint to a FastAPI app.
+Metrics live in the process-wide default registry; a service running several
+uvicorn workers sets PROMETHEUS_MULTIPROC_DIR so a scrape sees all of them.
+"""
+
+import asyncio
+import os
+import time
+
+from fastapi import FastAPI
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = tuple(16 * 1024 * 4**power for power in range(8))  # 16 KiB .. 256 MiB
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+LAG_INTERVAL_SECONDS = 0.5
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time to fully answer an HTTP request, by route template.",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_duration_seconds",
+    "Latency of calls to other Photure services, per attempt.",
+    ["upstream", "method", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+MONGO_LATENCY = Histogram(
+    "mongodb_command_duration_seconds",
+    "Server round-trip time of MongoDB commands.",
+    ["command", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+UPLOAD_SIZE = Histogram(
+    "upload_size_bytes",
+    "Size of stored uploads.",
+    buckets=SIZE_BUCKETS,
+)
+BYTES_SERVED = Counter(
+    "media_bytes_served_total",
+    "Media body bytes handed to the server for sending.",
+    ["source"],
+)
+SPANS_DROPPED = Counter(
+    "trace_spans_dropped_total",
+    "Sampled spans lost to a full export queue or a failed export.",
+)
+ADMISSION_ACTIVE = Gauge(
+    "admission_active_requests",
+    "Admitted requests in progress, by kind.",
+    ["kind"],
+)
+ADMISSION_QUEUED = Gauge(
+    "admission_queue_depth",
+    "Requests waiting for a concurrency slot, by kind.",
+    ["kind"],
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total",
+    "Requests turned away with 429, by kind and reason.",
+    ["kind", "reason"],
+)
+JOB_WAIT = Histogram(
+    "job_wait_seconds",
+    "Time a background job was runnable before a worker claimed it.",
+    ["kind"],
+    buckets=JOB_BUCKETS,
+)
+JOB_DURATION = Histogram(
+    "job_duration_seconds",
+    "Time spent running one attempt of a background job.",
+    ["kind", "outcome"],
+    buckets=JOB_BUCKETS,
+)
+JOB_OUTCOMES = Counter(
+    "job_attempts_total",
+    "Finished job attempts: done, retry (failed, will run again) or failed (gave up).",
+    ["kind", "outcome"],
+)
+JOB_QUEUE_DEPTH = Gauge(
+    "job_queue_depth",
+    "Jobs per kind and status, as of the last queue scan.",
+    ["kind", "status"],
+)
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop woke a periodic timer.",
+    buckets=LAG_BUCKETS,
+)
+
+
+async def monitor_event_loop(interval: float = LAG_INTERVAL_SECONDS) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(loop.time() - started - interval, 0.0))
+
+
+class MetricsMiddleware:
+    """Times each request until its last body chunk is sent.
+
+    Plain ASGI rather than BaseHTTPMiddleware, so streamed responses pass
+    through untouched and the per-request cost stays at two clock reads.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            monitor = asyncio.create_task(monitor_event_loop())
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                monitor.cancel()
+            return
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Label by route template, not raw path, to keep cardinality bounded.
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                str(status),
+            ).observe(time.perf_counter() - started)
+
+
+def metrics_response() -> Response:
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def instrument_app(app: FastAPI) -> None:
+    app.add_middleware(MetricsMiddleware)
+    app.add_api_route("/metrics", metrics_response, methods=["GET"], include_in_schema=False)
@@ -1,17 +1,52 @@
+import time
 from typing import AsyncIterator
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 from contextlib import asynccontextmanager
+from pymongo import monitoring
 
 from .config import get_settings
+from .metrics import MONGO_LATENCY
+from .tracing import current_span, finish, new_span
 
 _client: AsyncIOMotorClient | None = None
 
 
+class CommandTimer(monitoring.CommandListener):
+    """Records driver-measured command durations; runs inline, so it stays tiny."""
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        MONGO_LATENCY.labels(event.command_name, "ok").observe(event.duration_micros / 1_000_000)
+        self._record_span(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        MONGO_LATENCY.labels(event.command_name, "error").observe(event.duration_micros / 1_000_000)
+        self._record_span(event, error=str(event.failure.get("errmsg", "command failed")))
+
+    @staticmethod
+    def _record_span(event: monitoring.CommandSucceededEvent | monitoring.CommandFailedEvent, error: str | None = None) -> None:
+        # Motor runs commands on its executor with the caller's context copied,
+        # so the request's span is current here.
+        if current_span() is None:
+            return
+        span = new_span(
+            f"mongodb {event.command_name}",
+            kind="client",
+            attributes={"db.system": "mongodb", "db.name": event.database_name, "db.operation": event.command_name},
+        )
+        end_ns = time.time_ns()
+        span.start_ns = end_ns - event.duration_micros * 1000
+        span.error = error
+        finish(span, end_ns)
+
+
 def get_client() -> AsyncIOMotorClient:
     global _client
     if _client is None:
         settings = get_settings()
-        _client = AsyncIOMotorClient(settings.mongodb_url)
+        _client = AsyncIOMotorClient(settings.mongodb_url, event_listeners=[CommandTimer()])
     return _client
 
 
@@ -15,14 +15,56 @@ class VerifyResponse(BaseModel):
     session_id: Optional[str] = None
 
 
-class MediaUploadResponse(BaseModel):
+class BatchVerifyRequest(BaseModel):
+    tokens: List[str] = Field(..., min_length=1, max_length=100)
+
+
+class BatchVerifyResult(BaseModel):
+    status_code: int
+    user_id: Optional[str] = None
+    session_id: Optional[str] = None
+    detail: Optional[str] = None
+
+
+class BatchVerifyResponse(BaseModel):
+    results: List[BatchVerifyResult]
+
+
+class ImageInfo(BaseModel):
+    # Display size (EXIF orientation applied); None when the file is not a readable image.
+    width: Optional[int] = None
+    height: Optional[int] = None
+    orientation: Optional[int] = None
+    captured_at: Optional[datetime] = None
+    blurhash: Optional[str] = None
+
+
+class MediaUploadResponse(ImageInfo):
     storage_key: str
     filename: str
     content_type: str
     size: int
+    checksum: Optional[str] = None
 
 
-class PhotoMetadata(BaseModel):
+class MediaBatchUploadResult(BaseModel):
+    filename: Optional[str] = None
+    status_code: int
+    media: Optional[MediaUploadResponse] = None
+    detail: Optional[str] = None
+
+
+class MediaBatchUploadResponse(BaseModel):
+    results: List[MediaBatchUploadResult]
+
+
+class MediaLocation(BaseModel):
+    path: str
+    content_type: Optional[str] = None
+    size: int
+
+
+class PhotoMetadata(ImageInfo):
     id: str
     filename: str
     original_name: str
@@ -31,19 +73,81 @@ class PhotoMetadata(BaseModel):
     user_id: str
     upload_date: datetime
     storage_key: str
+    # Hex dHash once computed in the background; "" if the file is not an image.
+    phash: Optional[str] = None
 
 
 class PhotoResponse(PhotoMetadata):
     url: str
+    thumbnail_url: Optional[str] = None
+
+
+class BatchUploadResult(BaseModel):
+    filename: Optional[str] = None
+    status_code: int
+    photo: Optional[PhotoResponse] = None
+    detail: Optional[str] = None
+
+
+class BatchUploadResponse(BaseModel):
+    results: List[BatchUploadResult]
+    uploaded: int
+    failed: int
 
 
 class PhotoListResponse(BaseModel):
     photos: List[PhotoResponse]
-    total: int
+    # Only on the first page of a search; later pages leave it out.
+    total: Optional[int] = None
+    next_cursor: Optional[str] = None
 
 
 class PhotoMetadataList(BaseModel):
     photos: List[PhotoMetadata]
+    total: Optional[int] = None
+    next_cursor: Optional[str] = None
+
+
+class UserStats(BaseModel):
+    user_id: str
+    photo_count: int = 0
+    total_bytes: int = 0
+    first_upload: Optional[datetime] = None
+    last_upload: Optional[datetime] = None
+
+
+class PhotoClusterMetadata(BaseModel):
+    photos: List[PhotoMetadata]
+
+
+class PhotoClusterMetadataList(BaseModel):
+    clusters: List[PhotoClusterMetadata]
+    total: int
+    threshold: int
+    pending: int = 0
+
+
+class PhotoCluster(BaseModel):
+    photos: List[PhotoResponse]
+
+
+class PhotoClusterList(BaseModel):
+    clusters: List[PhotoCluster]
+    total: int
+    threshold: int
+    pending: int = 0
+
+
+class TimelineBucket(BaseModel):
+    period: str
+    start: datetime
+    count: int
+
+
+class Timeline(BaseModel):
+    granularity: str
+    timezone: str
+    buckets: List[TimelineBucket]
     total: int
 
 
@@ -52,7 +156,56 @@ class DeletePhotoResult(BaseModel):
     deleted: bool = True
 
 
-class CreatePhotoRequest(BaseModel):
+class DeletePhotosRequest(BaseModel):
+    ids: Optional[List[str]] = Field(default=None, max_length=10_000)
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+
+
+class ExportPhotosRequest(BaseModel):
+    ids: Optional[List[str]] = Field(default=None, max_length=10_000)
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+    # The whole library; ids and the date range are ignored.
+    all: bool = False
+
+
+class ExportedPhoto(BaseModel):
+    id: str
+    original_name: str
+    content_type: str
+    size: int
+    upload_date: datetime
+    storage_key: str
+
+
+class DeletedPhoto(BaseModel):
+    id: str
+    storage_key: str
+
+
+class DeletePhotosResult(BaseModel):
+    deleted: List[DeletedPhoto]
+    not_found: List[str] = Field(default_factory=list)
+
+
+class MediaDeleteRequest(BaseModel):
+    storage_keys: List[str] = Field(..., min_length=1, max_length=1000)
+
+
+class MediaDeleteResponse(BaseModel):
+    deleted: int
+    not_found: int
+    failed: List[str] = Field(default_factory=list)
+
+
+class BulkDeleteResponse(BaseModel):
+    deleted: int
+    not_found: int
+    media_failed: int
+
+
+class CreatePhotoRequest(ImageInfo):
     storage_key: str
     filename: str
     original_name: str
@@ -60,3 +213,16 @@ class CreatePhotoRequest(BaseModel):
     size: int
     user_id: str
 
+
+class CreatePhotosRequest(BaseModel):
+    photos: List[CreatePhotoRequest] = Field(..., min_length=1)
+
+
+class CreatePhotoResult(BaseModel):
+    status_code: int
+    photo: Optional[PhotoMetadata] = None
+    detail: Optional[str] = None
+
+
+class CreatePhotosResponse(BaseModel):
+    results: List[CreatePhotoResult]
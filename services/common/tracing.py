@@ -0,0 +1,334 @@
+"""Request tracing with W3C trace context.
+
+`trace_app` wraps every request in a server span that continues an incoming
+`traceparent` (or starts a new trace), UpstreamClient forwards the context on
+each call, and the Mongo command listener records a span per command. Sampled
+spans are queued and exported by a background thread, as JSON lines to
+TRACE_FILE or as OTLP/HTTP JSON to a local collector, so tracing never blocks
+a request.
+"""
+
+import atexit
+import json
+import queue
+import random
+import secrets
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+from fastapi import FastAPI
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import get_settings
+from .metrics import SPANS_DROPPED
+
+
+TRACEPARENT = "traceparent"
+EXPORT_BATCH_SIZE = 512
+EXPORT_INTERVAL_SECONDS = 1.0
+MAX_QUEUED_SPANS = 10_000
+HEX_DIGITS = frozenset("0123456789abcdef")
+OTLP_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+
+@dataclass(slots=True)
+class Span:
+    name: str
+    service: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None
+    sampled: bool
+    kind: str = "internal"
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: int = 0
+    attributes: dict[str, Any] = field(default_factory=dict)
+    error: str | None = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set_error(self, exc: BaseException) -> None:
+        self.error = f"{type(exc).__name__}: {exc}"
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "service": self.service,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1_000_000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+_current: ContextVar[Span | None] = ContextVar("current_span", default=None)
+_default_service = "photure"
+
+
+def current_span() -> Span | None:
+    return _current.get()
+
+
+def _is_hex_id(value: str, length: int) -> bool:
+    return len(value) == length and set(value) <= HEX_DIGITS and value != "0" * length
+
+
+def parse_traceparent(value: str) -> tuple[str, str, bool] | None:
+    """Return (trace_id, parent_span_id, sampled) from a traceparent header."""
+    parts = value.strip().lower().split("-")
+    if len(parts) < 4 or parts[0] == "ff":
+        return None
+    _, trace_id, parent_id, flags = parts[:4]
+    if not (_is_hex_id(trace_id, 32) and _is_hex_id(parent_id, 16)):
+        return None
+    if len(flags) != 2 or not set(flags) <= HEX_DIGITS:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+def new_span(
+    name: str,
+    *,
+    kind: str = "internal",
+    remote: tuple[str, str, bool] | None = None,
+    trace_id: str | None = None,
+    service: str | None = None,
+    attributes: dict[str, Any] | None = None,
+) -> Span:
+    """Start a span under a remote parent, the current span, or as a new trace.
+
+    New traces are sampled with probability TRACE_SAMPLE_RATIO; children follow
+    their parent's decision so a trace is exported whole or not at all.
+    """
+    parent = _current.get()
+    if remote is not None:
+        trace_id, parent_id, sampled = remote
+    elif parent is not None:
+        trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+        service = service or parent.service
+    else:
+        trace_id = trace_id or secrets.token_hex(16)
+        parent_id = None
+        sampled = random.random() < get_settings().trace_sample_ratio
+    return Span(
+        name=name,
+        service=service or _default_service,
+        trace_id=trace_id,
+        span_id=secrets.token_hex(8),
+        parent_id=parent_id,
+        sampled=sampled,
+        kind=kind,
+        attributes=attributes or {},
+    )
+
+
+def finish(span: Span, end_ns: int | None = None) -> None:
+    span.end_ns = end_ns or time.time_ns()
+    if span.sampled and exporter.enabled:
+        exporter.submit(span)
+
+
+@contextmanager
+def start_span(name: str, kind: str = "internal", **attributes: Any) -> Iterator[Span]:
+    span = new_span(name, kind=kind, attributes=attributes)
+    token = _current.set(span)
+    try:
+        yield span
+    except BaseException as exc:
+        span.set_error(exc)
+        raise
+    finally:
+        _current.reset(token)
+        finish(span)
+
+
+class SpanExporter:
+    """Batches finished spans on a daemon thread; drops them rather than block when full."""
+
+    def __init__(self) -> None:
+        settings = get_settings()
+        self.mode = settings.trace_exporter
+        self.enabled = self.mode in ("file", "otlp")
+        self.file_path = settings.trace_file
+        self.endpoint = settings.otlp_endpoint
+        self.queue: queue.Queue[Span | None] = queue.Queue(maxsize=MAX_QUEUED_SPANS)
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def submit(self, span: Span) -> None:
+        if self._thread is None:
+            self._start()
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            SPANS_DROPPED.inc()
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._thread.start()
+                atexit.register(self.shutdown)
+
+    def _run(self) -> None:
+        while True:
+            span = self.queue.get()
+            if span is None:
+                return
+            batch = [span]
+            deadline = time.monotonic() + EXPORT_INTERVAL_SECONDS
+            while len(batch) < EXPORT_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    span = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if span is None:
+                    self._export(batch)
+                    return
+                batch.append(span)
+            self._export(batch)
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Export what is still queued; a None sentinel stops the thread."""
+        if self._thread is None:
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def _export(self, batch: list[Span]) -> None:
+        try:
+            if self.mode == "file":
+                with open(self.file_path, "a", encoding="utf-8") as handle:
+                    handle.writelines(json.dumps(span.to_dict(), default=str) + "\n" for span in batch)
+            else:
+                request = urllib.request.Request(
+                    self.endpoint,
+                    data=json.dumps(otlp_payload(batch), default=str).encode("utf-8"),
+                    headers={"Content-Type": "application/json"},
+                    method="POST",
+                )
+                with urllib.request.urlopen(request, timeout=5):
+                    pass
+        except Exception:
+            SPANS_DROPPED.inc(len(batch))
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_payload(spans: list[Span]) -> dict:
+    by_service: dict[str, list[dict]] = {}
+    for span in spans:
+        entry = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": OTLP_KINDS.get(span.kind, 1),
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id:
+            entry["parentSpanId"] = span.parent_id
+        by_service.setdefault(span.service, []).append(entry)
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+                "scopeSpans": [{"scope": {"name": "photure"}, "spans": entries}],
+            }
+            for service, entries in by_service.items()
+        ]
+    }
+
+
+exporter = SpanExporter()
+
+
+class TracingMiddleware:
+    """Opens the server span for each request and echoes its ID as X-Request-ID."""
+
+    def __init__(self, app: ASGIApp, service: str) -> None:
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = request_id = None
+        for name, value in scope["headers"]:
+            if name == TRACEPARENT.encode():
+                traceparent = value.decode("latin-1")
+            elif name == b"x-request-id":
+                request_id = value.decode("latin-1")
+
+        remote = parse_traceparent(traceparent) if traceparent else None
+        # At the edge, reuse a proxy-assigned request ID as the trace ID when it fits.
+        trace_id = request_id.lower() if request_id and _is_hex_id(request_id.lower(), 32) else None
+        span = new_span(
+            scope["method"],
+            kind="server",
+            remote=remote,
+            trace_id=trace_id,
+            service=self.service,
+            attributes={"http.method": scope["method"], "http.target": scope["path"]},
+        )
+        if request_id:
+            span.attributes["request.id"] = request_id
+        response_id = (request_id or span.trace_id).encode("latin-1")
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", ()), (b"x-request-id", response_id)]
+            await send(message)
+
+        token = _current.set(span)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as exc:
+            span.set_error(exc)
+            raise
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            span.name = f"{scope['method']} {route.path if route is not None else 'unmatched'}"
+            span.attributes["http.status_code"] = status
+            if status >= 500 and span.error is None:
+                span.error = f"HTTP {status}"
+            finish(span)
+
+
+def trace_app(app: FastAPI, service: str) -> None:
+    global _default_service
+    _default_service = service
+    app.add_middleware(TracingMiddleware, service=service)
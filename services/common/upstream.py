@@ -0,0 +1,337 @@
+"""HTTP clients for calling other Photure services.
+
+Each upstream gets its own connection pool, timeouts and circuit breaker, so a
+slow service only ties up its own sockets. Calls that are safe to repeat are
+retried with jittered backoff; once an upstream keeps failing its breaker opens
+and calls fail immediately with CircuitOpenError (an httpx.TransportError, so
+existing `except httpx.RequestError` handlers turn it into a 503).
+"""
+
+import asyncio
+import random
+import time
+import weakref
+from typing import Any, Iterator
+
+import httpx
+from prometheus_client import REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, Metric
+
+from .config import Settings, get_settings
+from .metrics import UPSTREAM_LATENCY
+from .tracing import TRACEPARENT, finish, new_span
+
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+RETRYABLE_STATUS = frozenset({502, 503, 504})
+
+
+class CircuitOpenError(httpx.TransportError):
+    pass
+
+
+BREAKER_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures; after `reset_timeout`
+    seconds lets `half_open_calls` probes through and closes again on success.
+
+    Probes that never report back (cancelled, say) are re-armed after another
+    `reset_timeout`, so a lost probe cannot leave the breaker half-open for good.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0, half_open_calls: int = 1) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probed_at = 0.0
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+        elif (
+            self._state == self.HALF_OPEN
+            and self._probes >= self.half_open_calls
+            and time.monotonic() - self._probed_at >= self.reset_timeout
+        ):
+            self._probes = 0
+        return self._state
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and self._probes < self.half_open_calls:
+            self._probes += 1
+            self._probed_at = time.monotonic()
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._state = self.CLOSED
+
+    def release(self) -> None:
+        """The allowed call ended without an outcome; hand back its probe slot."""
+        if self._state == self.HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                self.trips += 1
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+
+class UpstreamClient:
+    """A pooled httpx client for one upstream service, addressed by relative paths."""
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        *,
+        limits: httpx.Limits,
+        timeout: httpx.Timeout,
+        http2: bool = False,
+        retries: int = 2,
+        retry_backoff: float = 0.05,
+        breaker: CircuitBreaker | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        self.name = name
+        self.base_url = base_url
+        self.max_connections = limits.max_connections
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            limits=limits,
+            timeout=timeout,
+            http2=http2,
+            transport=transport,
+        )
+        self.in_flight = 0
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+        _clients.add(self)
+
+    def build_request(self, method: str, url: str, **kwargs: Any) -> httpx.Request:
+        return self.client.build_request(method, url, **kwargs)
+
+    async def request(self, method: str, url: str, *, idempotent: bool | None = None, **kwargs: Any) -> httpx.Response:
+        return await self.send(self.build_request(method, url, **kwargs), idempotent=idempotent)
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("DELETE", url, **kwargs)
+
+    async def send(
+        self,
+        request: httpx.Request,
+        *,
+        stream: bool = False,
+        idempotent: bool | None = None,
+    ) -> httpx.Response:
+        """Send with breaker checks and, for idempotent requests, retries.
+
+        `idempotent` defaults to the HTTP method's semantics; pass it explicitly
+        for POSTs that are safe to repeat (or DELETEs that are not). Requests
+        with a streamed body are never retried because it cannot be replayed.
+        """
+        if idempotent is None:
+            idempotent = request.method in IDEMPOTENT_METHODS
+        replayable = isinstance(request.stream, httpx.ByteStream)
+        attempts = 1 + (self.retries if idempotent and replayable else 0)
+
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"{self.name} circuit is open", request=request)
+
+            last_attempt = attempt == attempts - 1
+            self.requests += 1
+            self.in_flight += 1
+            span = new_span(
+                f"{request.method} {self.name}",
+                kind="client",
+                attributes={"peer.service": self.name, "http.method": request.method, "http.url": str(request.url)},
+            )
+            request.headers[TRACEPARENT] = span.traceparent
+            started = time.perf_counter()
+            try:
+                response = await self.client.send(request, stream=stream)
+            except httpx.TransportError as exc:
+                self._observe(request, type(exc).__name__, started)
+                span.set_error(exc)
+                finish(span)
+                self.in_flight -= 1
+                self.failures += 1
+                self.breaker.record_failure()
+                if last_attempt or self.breaker.state == CircuitBreaker.OPEN:
+                    raise
+                await self._backoff(attempt)
+                continue
+            except BaseException as exc:
+                span.set_error(exc)
+                finish(span)
+                self.in_flight -= 1
+                # Cancelled, or the relayed request body failed (the client went
+                # away): says nothing about the upstream.
+                self.breaker.release()
+                raise
+
+            # Streamed responses are timed to headers; the body is the caller's.
+            self._observe(request, str(response.status_code), started)
+            span.attributes["http.status_code"] = response.status_code
+            if response.status_code >= 500:
+                span.error = f"HTTP {response.status_code}"
+            finish(span)
+            if response.status_code in RETRYABLE_STATUS:
+                self.failures += 1
+                self.breaker.record_failure()
+                if not last_attempt and self.breaker.state != CircuitBreaker.OPEN:
+                    await response.aclose()
+                    self.in_flight -= 1
+                    await self._backoff(attempt)
+                    continue
+            else:
+                self.breaker.record_success()
+
+            if stream:
+                self._track_close(response)
+            else:
+                self.in_flight -= 1
+            return response
+        raise AssertionError("unreachable")
+
+    def _observe(self, request: httpx.Request, outcome: str, started: float) -> None:
+        UPSTREAM_LATENCY.labels(self.name, request.method, outcome).observe(time.perf_counter() - started)
+
+    def _track_close(self, response: httpx.Response) -> None:
+        # Streamed responses hold their connection until closed.
+        close = response.aclose
+        released = False
+
+        async def aclose() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self.in_flight -= 1
+            await close()
+
+        response.aclose = aclose
+
+    async def _backoff(self, attempt: int) -> None:
+        self.retried += 1
+        # Full jitter keeps retries from a burst of failures from arriving in lockstep.
+        await asyncio.sleep(random.uniform(0, self.retry_backoff * 2**attempt))
+
+    def stats(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "in_flight": self.in_flight,
+            "max_connections": self.max_connections,
+            "pool_saturation": round(min(self.in_flight / self.max_connections, 1.0), 4)
+            if self.max_connections
+            else 0.0,
+            "queued": max(self.in_flight - self.max_connections, 0) if self.max_connections else 0,
+            "requests": self.requests,
+            "retries": self.retried,
+            "failures": self.failures,
+            "breaker": self.breaker.stats(),
+        }
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+_clients: "weakref.WeakSet[UpstreamClient]" = weakref.WeakSet()
+
+
+class UpstreamCollector:
+    """Reports pool saturation and breaker state at scrape time, off the request path."""
+
+    def collect(self) -> Iterator[Metric]:
+        in_flight = GaugeMetricFamily("upstream_in_flight", "Requests in flight per upstream.", labels=["upstream"])
+        saturation = GaugeMetricFamily(
+            "upstream_pool_saturation", "In-flight requests over max connections.", labels=["upstream"]
+        )
+        breaker = GaugeMetricFamily(
+            "upstream_breaker_state", "Circuit breaker state (0 closed, 1 half-open, 2 open).", labels=["upstream"]
+        )
+        trips = CounterMetricFamily("upstream_breaker_trips", "Times the breaker has opened.", labels=["upstream"])
+        for client in list(_clients):
+            stats = client.stats()
+            in_flight.add_metric([client.name], stats["in_flight"])
+            saturation.add_metric([client.name], stats["pool_saturation"])
+            breaker.add_metric([client.name], BREAKER_STATE_VALUES[stats["breaker"]["state"]])
+            trips.add_metric([client.name], stats["breaker"]["trips"])
+        yield from (in_flight, saturation, breaker, trips)
+
+
+REGISTRY.register(UpstreamCollector())
+
+
+def create_upstream(
+    name: str,
+    base_url: str,
+    settings: Settings | None = None,
+    *,
+    read_timeout: float | None = None,
+    transport: httpx.AsyncBaseTransport | None = None,
+) -> UpstreamClient:
+    """Build an UpstreamClient from the UPSTREAM_* settings."""
+    settings = settings or get_settings()
+    return UpstreamClient(
+        name,
+        base_url,
+        limits=httpx.Limits(
+            max_connections=settings.upstream_max_connections,
+            max_keepalive_connections=settings.upstream_max_keepalive_connections,
+            keepalive_expiry=settings.upstream_keepalive_expiry_seconds,
+        ),
+        timeout=httpx.Timeout(
+            read_timeout or settings.upstream_read_timeout_seconds,
+            connect=settings.upstream_connect_timeout_seconds,
+            pool=settings.upstream_pool_timeout_seconds,
+        ),
+        http2=settings.upstream_http2,
+        retries=settings.upstream_retries,
+        retry_backoff=settings.upstream_retry_backoff_seconds,
+        breaker=CircuitBreaker(
+            failure_threshold=settings.breaker_failure_threshold,
+            reset_timeout=settings.breaker_reset_seconds,
+        ),
+        transport=transport,
+    )
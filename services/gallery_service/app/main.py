@@ -1,24 +1,64 @@
-from datetime import datetime
+import base64
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 from fastapi import Depends, FastAPI, Header, HTTPException, Query
-from typing import Annotated
+from fastapi.responses import StreamingResponse
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import BulkWriteError
+from typing import Annotated, Literal
 import uuid
 
 from services.common.config import get_settings
 from services.common.logging import configure_logger
+from services.common.metrics import instrument_app
 from services.common.mongo import lifespan, get_database
 from services.common.schemas import (
     CreatePhotoRequest,
+    CreatePhotoResult,
+    CreatePhotosRequest,
+    CreatePhotosResponse,
+    DeletedPhoto,
     DeletePhotoResult,
+    DeletePhotosRequest,
+    DeletePhotosResult,
+    ExportedPhoto,
+    ExportPhotosRequest,
+    ImageInfo,
+    PhotoClusterMetadata,
+    PhotoClusterMetadataList,
     PhotoMetadata,
     PhotoMetadataList,
     ServiceHealth,
+    Timeline,
+    UserStats,
 )
+from services.common.tracing import trace_app
+
+from .search import (
+    after_search_cursor,
+    build_search_query,
+    date_range,
+    encode_search_cursor,
+    get_timeline,
+    search_sort,
+)
+from .similar import MAX_THRESHOLD, SimilarityIndexes
+from .stats import NOT_DELETING, get_user_stats, record_delete, record_upload
 
 
 settings = get_settings()
 logger = configure_logger("gallery-service")
 
-app = FastAPI(title="Photure Gallery Service", version="0.1.0", lifespan=lifespan)
+LISTING_SORT = [("upload_date", DESCENDING), ("_id", DESCENDING)]
+# Photos claimed by a bulk delete are hidden at once; a claim older than this
+# belongs to a request that died, and the next delete that matches takes it over.
+DELETE_CLAIM_TIMEOUT = timedelta(minutes=5)
+EXPORT_SORT = [("upload_date", ASCENDING), ("_id", ASCENDING)]
+# Export rows per cursor batch and per chunk written to the response.
+EXPORT_BATCH = 500
+
+similar_indexes = SimilarityIndexes(settings.similar_index_max_users, settings.similar_index_ttl_seconds)
 
 
 def get_collection():
@@ -26,6 +66,56 @@ def get_collection():
     return db.photos
 
 
+def get_hashes_collection():
+    # Written by media-service's phash job, keyed by storage key.
+    return get_database().media_hashes
+
+
+async def ensure_indexes() -> None:
+    collection = get_collection()
+    await collection.create_index(
+        [("user_id", ASCENDING), ("upload_date", DESCENDING), ("_id", DESCENDING)],
+        name="user_upload_date",
+    )
+    # Search: content-type filters sorted by date, size ranges and size sorts,
+    # and word matches on the original filename.
+    await collection.create_index(
+        [("user_id", ASCENDING), ("content_type", ASCENDING), ("upload_date", DESCENDING), ("_id", DESCENDING)],
+        name="user_content_type_date",
+    )
+    await collection.create_index(
+        [("user_id", ASCENDING), ("size", DESCENDING), ("_id", DESCENDING)],
+        name="user_size",
+    )
+    await collection.create_index(
+        [("user_id", ASCENDING), ("original_name", TEXT)],
+        name="user_original_name_text",
+        default_language="none",
+    )
+    # Lets a user's similarity index load from the index alone.
+    await collection.create_index(
+        [("user_id", ASCENDING), ("phash", ASCENDING), ("_id", ASCENDING)],
+        name="user_phash",
+    )
+
+
+@asynccontextmanager
+async def gallery_lifespan(app):
+    async with lifespan(app):
+        await ensure_indexes()
+        yield
+
+
+app = FastAPI(title="Photure Gallery Service", version="0.1.0", lifespan=gallery_lifespan)
+instrument_app(app)
+trace_app(app, "gallery-service")
+
+
+def expired_claim(now: datetime) -> dict:
+    # Also matches claims written before claims carried a timestamp.
+    return {"deleting": {"$exists": True}, "deleting_at": {"$not": {"$gte": now - DELETE_CLAIM_TIMEOUT}}}
+
+
 async def get_user_id(x_user_id: Annotated[str | None, Header(alias="X-User-Id")] = None) -> str:
     if not x_user_id:
         raise HTTPException(status_code=401, detail="Missing user context")
@@ -51,9 +141,29 @@ def serialize_photo(doc: dict) -> PhotoMetadata:
         user_id=doc["user_id"],
         upload_date=doc["upload_date"],
         storage_key=doc["storage_key"],
+        phash=doc.get("phash"),
+        **{name: doc.get(name) for name in ImageInfo.model_fields},
     )
 
 
+async def attach_phashes(collection, docs: list[dict]) -> None:
+    """Copy hashes media-service already has onto freshly inserted photos.
+
+    Runs after the insert: a hash recorded before it is found here, and one
+    recorded after it is copied onto the photo by media-service itself.
+    """
+    keys = list({doc["storage_key"] for doc in docs})
+    hashes = {
+        doc["_id"]: doc["phash"]
+        async for doc in get_hashes_collection().find({"_id": {"$in": keys}}, {"phash": 1})
+    }
+    for key, phash in hashes.items():
+        await collection.update_many({"storage_key": key, "phash": None}, {"$set": {"phash": phash}})
+    for doc in docs:
+        doc["phash"] = hashes.get(doc["storage_key"])
+        similar_indexes.added(doc["user_id"], doc["_id"], doc["phash"])
+
+
 @app.post("/gallery/photos", response_model=PhotoMetadata)
 async def create_photo(
     payload: CreatePhotoRequest,
@@ -61,6 +171,11 @@ async def create_photo(
     logger.debug("Creating photo metadata for %s", payload.user_id)
     collection = get_collection()
 
+    if settings.user_quota_bytes:
+        stats = await get_user_stats(collection, payload.user_id)
+        if stats.total_bytes + payload.size > settings.user_quota_bytes:
+            raise HTTPException(status_code=413, detail="Storage quota exceeded")
+
     photo_doc = {
         "_id": str(uuid.uuid4()),
         "filename": payload.filename,
@@ -70,38 +185,219 @@ async def create_photo(
         "user_id": payload.user_id,
         "upload_date": datetime.utcnow(),
         "storage_key": payload.storage_key,
+        **payload.model_dump(include=set(ImageInfo.model_fields)),
     }
 
     await collection.insert_one(photo_doc)
+    await attach_phashes(collection, [photo_doc])
+    await record_upload(collection, payload.user_id, payload.size, photo_doc["upload_date"])
     return serialize_photo(photo_doc)
 
 
+@app.post("/gallery/photos/bulk", response_model=CreatePhotosResponse)
+async def create_photos(payload: CreatePhotosRequest) -> CreatePhotosResponse:
+    """Insert many photos with one insert_many; results follow the request order."""
+    collection = get_collection()
+    results: list[CreatePhotoResult | None] = [None] * len(payload.photos)
+
+    remaining: dict[str, int | None] = {}
+    if settings.user_quota_bytes:
+        for user_id in {photo.user_id for photo in payload.photos}:
+            stats = await get_user_stats(collection, user_id)
+            remaining[user_id] = settings.user_quota_bytes - stats.total_bytes
+
+    docs: list[tuple[int, dict]] = []
+    for index, photo in enumerate(payload.photos):
+        if settings.user_quota_bytes:
+            if photo.size > remaining[photo.user_id]:
+                results[index] = CreatePhotoResult(status_code=413, detail="Storage quota exceeded")
+                continue
+            remaining[photo.user_id] -= photo.size
+        docs.append((index, {
+            "_id": str(uuid.uuid4()),
+            "filename": photo.filename,
+            "original_name": photo.original_name,
+            "content_type": photo.content_type,
+            "size": photo.size,
+            "user_id": photo.user_id,
+            "upload_date": datetime.utcnow(),
+            "storage_key": photo.storage_key,
+            **photo.model_dump(include=set(ImageInfo.model_fields)),
+        }))
+
+    failed: set[int] = set()
+    if docs:
+        try:
+            await collection.insert_many([doc for _, doc in docs], ordered=False)
+        except BulkWriteError as exc:
+            failed = {error["index"] for error in exc.details.get("writeErrors", [])}
+            logger.warning("Bulk insert failed for %d of %d photos", len(failed), len(docs))
+
+    inserted: dict[str, list[dict]] = {}
+    for position, (index, doc) in enumerate(docs):
+        if position in failed:
+            results[index] = CreatePhotoResult(status_code=500, detail="Failed to store photo metadata")
+            continue
+        inserted.setdefault(doc["user_id"], []).append(doc)
+        results[index] = CreatePhotoResult(status_code=200, photo=serialize_photo(doc))
+
+    if inserted:
+        await attach_phashes(collection, [doc for user_docs in inserted.values() for doc in user_docs])
+    for user_id, user_docs in inserted.items():
+        await record_upload(
+            collection,
+            user_id,
+            sum(doc["size"] for doc in user_docs),
+            user_docs[0]["upload_date"],
+            count=len(user_docs),
+            last_upload_date=user_docs[-1]["upload_date"],
+        )
+    return CreatePhotosResponse(results=results)
+
+
+def encode_cursor(doc: dict) -> str:
+    payload = json.dumps({"d": doc["upload_date"].isoformat(), "i": doc["_id"]})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(payload["d"]), str(payload["i"])
+    except (ValueError, KeyError, TypeError) as exc:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from exc
+
+
+def after_cursor(cursor: str) -> dict:
+    upload_date, photo_id = decode_cursor(cursor)
+    return {
+        "$or": [
+            {"upload_date": {"$lt": upload_date}},
+            {"upload_date": upload_date, "_id": {"$lt": photo_id}},
+        ]
+    }
+
+
 @app.get("/gallery/photos", response_model=PhotoMetadataList)
 async def list_photos(
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = Query(default=None),
     user_id: str = Depends(get_user_id),
 ) -> PhotoMetadataList:
     collection = get_collection()
-    cursor = (
-        collection.find({"user_id": user_id})
-        .skip(skip)
-        .limit(limit)
-        .sort("upload_date", -1)
-    )
-    photos = await cursor.to_list(length=limit)
-    total = await collection.count_documents({"user_id": user_id})
+    query: dict = {"user_id": user_id, **NOT_DELETING}
+    if cursor:
+        # Keyset pagination walks the (user_id, upload_date, _id) index directly.
+        query.update(after_cursor(cursor))
+        find = collection.find(query).sort(LISTING_SORT).limit(limit + 1)
+    else:
+        find = collection.find(query).sort(LISTING_SORT).skip(skip).limit(limit + 1)
+
+    photos = await find.to_list(length=limit + 1)
+    next_cursor = encode_cursor(photos[limit - 1]) if len(photos) > limit else None
+    photos = photos[:limit]
+    stats = await get_user_stats(collection, user_id)
 
     return PhotoMetadataList(
         photos=[serialize_photo(photo) for photo in photos],
-        total=total,
+        total=stats.photo_count,
+        next_cursor=next_cursor,
+    )
+
+
+@app.get("/gallery/search", response_model=PhotoMetadataList)
+async def search_photos(
+    uploaded_after: datetime | None = Query(default=None),
+    uploaded_before: datetime | None = Query(default=None),
+    content_type: list[str] | None = Query(default=None),
+    min_size: int | None = Query(default=None, ge=0),
+    max_size: int | None = Query(default=None, ge=0),
+    q: str | None = Query(default=None, min_length=1, max_length=200),
+    sort: Literal["date", "size"] = Query("date"),
+    order: Literal["asc", "desc"] = Query("desc"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = Query(default=None),
+    user_id: str = Depends(get_user_id),
+) -> PhotoMetadataList:
+    """Filtered listing with keyset pagination; `total` counts every match, on
+    the first page only (it does not change as the caller pages on)."""
+    collection = get_collection()
+    query = build_search_query(
+        user_id,
+        uploaded_after=uploaded_after,
+        uploaded_before=uploaded_before,
+        content_types=content_type,
+        min_size=min_size,
+        max_size=max_size,
+        text=q,
     )
+    page_query = {**query, **after_search_cursor(cursor, sort, order)} if cursor else query
+    photos = await collection.find(page_query).sort(search_sort(sort, order)).limit(limit + 1).to_list(length=limit + 1)
+    next_cursor = encode_search_cursor(photos[limit - 1], sort) if len(photos) > limit else None
+
+    return PhotoMetadataList(
+        photos=[serialize_photo(photo) for photo in photos[:limit]],
+        total=None if cursor else await collection.count_documents(query),
+        next_cursor=next_cursor,
+    )
+
+
+@app.get("/gallery/timeline", response_model=Timeline)
+async def timeline(
+    granularity: Literal["day", "month", "year"] = Query("day"),
+    tz: str = Query("UTC", max_length=64),
+    uploaded_after: datetime | None = Query(default=None),
+    uploaded_before: datetime | None = Query(default=None),
+    order: Literal["asc", "desc"] = Query("desc"),
+    user_id: str = Depends(get_user_id),
+) -> Timeline:
+    """Photo counts per day, month or year of upload, in the caller's time zone."""
+    return await get_timeline(get_collection(), user_id, granularity, tz, uploaded_after, uploaded_before, order)
+
+
+@app.get("/gallery/similar", response_model=PhotoClusterMetadataList)
+async def similar_photos(
+    threshold: int = Query(5, ge=0, le=MAX_THRESHOLD),
+    limit: int = Query(50, ge=1, le=200),
+    user_id: str = Depends(get_user_id),
+) -> PhotoClusterMetadataList:
+    """Clusters of near-duplicate photos, largest first: each photo is within
+    `threshold` bits of perceptual hash of another photo in its cluster."""
+    collection = get_collection()
+    clusters, pending = await similar_indexes.clusters(collection, user_id, threshold)
+
+    page = clusters[:limit]
+    ids = [photo_id for cluster in page for photo_id in cluster]
+    # Also drops photos deleted through another replica since the index was built.
+    docs = {
+        doc["_id"]: doc
+        async for doc in collection.find({"_id": {"$in": ids}, "user_id": user_id, **NOT_DELETING})
+    }
+    results = []
+    for cluster in page:
+        photos = sorted((docs[photo_id] for photo_id in cluster if photo_id in docs), key=lambda doc: doc["upload_date"])
+        if len(photos) > 1:
+            results.append(PhotoClusterMetadata(photos=[serialize_photo(photo) for photo in photos]))
+
+    return PhotoClusterMetadataList(
+        clusters=results,
+        total=len(clusters),
+        threshold=threshold,
+        pending=pending,
+    )
+
+
+@app.get("/gallery/stats", response_model=UserStats)
+async def user_stats(user_id: str = Depends(get_user_id)) -> UserStats:
+    return await get_user_stats(get_collection(), user_id)
 
 
 @app.get("/gallery/photos/{photo_id}", response_model=PhotoMetadata)
 async def get_photo(photo_id: str, user_id: str = Depends(get_user_id)) -> PhotoMetadata:
     collection = get_collection()
-    photo = await collection.find_one({"_id": photo_id, "user_id": user_id})
+    photo = await collection.find_one({"_id": photo_id, "user_id": user_id, **NOT_DELETING})
     if not photo:
         raise HTTPException(status_code=404, detail="Photo not found")
     return serialize_photo(photo)
@@ -110,11 +406,128 @@ async def get_photo(photo_id: str, user_id: str = Depends(get_user_id)) -> Photo
 @app.delete("/gallery/photos/{photo_id}", response_model=DeletePhotoResult)
 async def delete_photo(photo_id: str, user_id: str = Depends(get_user_id)) -> DeletePhotoResult:
     collection = get_collection()
-    photo = await collection.find_one({"_id": photo_id, "user_id": user_id})
+    photo = await collection.find_one_and_delete(
+        {"_id": photo_id, "user_id": user_id, "$or": [NOT_DELETING, expired_claim(datetime.utcnow())]}
+    )
     if not photo:
         raise HTTPException(status_code=404, detail="Photo not found")
 
-    await collection.delete_one({"_id": photo_id, "user_id": user_id})
+    similar_indexes.removed(user_id, [photo_id])
+    if "uncounted" not in photo:
+        await record_delete(collection, user_id, photo["size"], photo["upload_date"])
     logger.info("Deleted photo metadata %s for %s", photo_id, user_id)
     return DeletePhotoResult(storage_key=photo["storage_key"])
 
+
+
+@app.post("/gallery/photos/bulk-delete", response_model=DeletePhotosResult)
+async def delete_photos(
+    payload: DeletePhotosRequest,
+    user_id: str = Depends(get_user_id),
+) -> DeletePhotosResult:
+    """Delete the user's photos by id and/or upload-date range in a few bulk operations."""
+    if payload.ids is None and payload.uploaded_after is None and payload.uploaded_before is None:
+        raise HTTPException(status_code=400, detail="Provide ids or an upload date range")
+
+    query: dict = {"user_id": user_id}
+    if payload.ids is not None:
+        query["_id"] = {"$in": payload.ids}
+    date_range = {}
+    if payload.uploaded_after is not None:
+        date_range["$gte"] = payload.uploaded_after
+    if payload.uploaded_before is not None:
+        date_range["$lt"] = payload.uploaded_before
+    if date_range:
+        query["upload_date"] = date_range
+
+    collection = get_collection()
+    # Claim the matching documents first so that concurrent deletes never both
+    # report (and release the media of) the same photo. Claimed photos drop out
+    # of listings at once; abandoned claims are taken over, and their photos
+    # uncounted here unless the request that claimed them got that far.
+    claim = str(uuid.uuid4())
+    taken_over = f"{claim}:taken-over"
+    now = datetime.utcnow()
+    await collection.update_many(
+        {**query, **NOT_DELETING},
+        {"$set": {"deleting": claim, "deleting_at": now}},
+    )
+    await collection.update_many(
+        {**query, **expired_claim(now)},
+        {"$set": {"deleting": taken_over, "deleting_at": now}},
+    )
+    claimed = {"user_id": user_id, "deleting": {"$in": [claim, taken_over]}}
+    photos = await collection.find(
+        claimed,
+        {"storage_key": 1, "size": 1, "upload_date": 1, "uncounted": 1},
+    ).to_list(length=None)
+
+    counted = [photo for photo in photos if "uncounted" not in photo]
+    if counted:
+        # Marked before the counters change: if we die in between, the photos
+        # stay counted until a rebuild rather than being uncounted twice.
+        await collection.update_many(
+            {"_id": {"$in": [photo["_id"] for photo in counted]}},
+            {"$set": {"uncounted": True}},
+        )
+        dates = [photo["upload_date"] for photo in counted]
+        await record_delete(
+            collection,
+            user_id,
+            sum(photo["size"] for photo in counted),
+            min(dates),
+            count=len(counted),
+            last_upload_date=max(dates),
+        )
+    await collection.delete_many(claimed)
+    similar_indexes.removed(user_id, [photo["_id"] for photo in photos])
+    logger.info("Deleted %d photos for %s", len(photos), user_id)
+
+    deleted_ids = {photo["_id"] for photo in photos}
+    return DeletePhotosResult(
+        deleted=[DeletedPhoto(id=photo["_id"], storage_key=photo["storage_key"]) for photo in photos],
+        not_found=[photo_id for photo_id in payload.ids or [] if photo_id not in deleted_ids],
+    )
+
+
+@app.post("/gallery/photos/export")
+async def export_photos(
+    payload: ExportPhotosRequest,
+    user_id: str = Depends(get_user_id),
+) -> StreamingResponse:
+    """Stream the selected photos as newline-delimited ExportedPhoto rows, oldest first.
+
+    One cursor over user_upload_date serves the whole export, however large,
+    and rows go out as the driver fetches them.
+    """
+    query: dict = {"user_id": user_id, **NOT_DELETING}
+    if not payload.all:
+        if payload.ids is None and payload.uploaded_after is None and payload.uploaded_before is None:
+            raise HTTPException(status_code=400, detail="Provide ids, an upload date range or all")
+        if payload.ids is not None:
+            query["_id"] = {"$in": payload.ids}
+        bounds = date_range(payload.uploaded_after, payload.uploaded_before)
+        if bounds:
+            query["upload_date"] = bounds
+
+    cursor = get_collection().find(
+        query,
+        {"original_name": 1, "content_type": 1, "size": 1, "upload_date": 1, "storage_key": 1},
+        sort=EXPORT_SORT,
+        batch_size=EXPORT_BATCH,
+    )
+
+    async def rows():
+        lines = []
+        try:
+            async for doc in cursor:
+                lines.append(ExportedPhoto(id=doc.pop("_id"), **doc).model_dump_json())
+                if len(lines) >= EXPORT_BATCH:
+                    yield "\n".join(lines) + "\n"
+                    lines.clear()
+            if lines:
+                yield "\n".join(lines) + "\n"
+        finally:
+            await cursor.close()
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
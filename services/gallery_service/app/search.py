@@ -0,0 +1,152 @@
+"""Timeline buckets and filtered listings over a user's photos.
+
+The timeline groups a scan of the (user_id, upload_date) index, so a year of
+photos is one cheap aggregation rather than dozens of listing pages. Searches
+pick from the compound and text indexes created in main.ensure_indexes.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+from services.common.schemas import Timeline, TimelineBucket
+
+from .stats import NOT_DELETING
+
+
+GRANULARITY_FORMATS = {"day": "%Y-%m-%d", "month": "%Y-%m", "year": "%Y"}
+SORT_FIELDS = {"date": "upload_date", "size": "size"}
+# Mongo's "unrecognized time zone identifier".
+INVALID_TIMEZONE = 40485
+
+
+def date_range(after: datetime | None, before: datetime | None) -> dict:
+    if after is not None and before is not None and after >= before:
+        raise HTTPException(status_code=400, detail="uploaded_after must be before uploaded_before")
+    bounds = {}
+    if after is not None:
+        bounds["$gte"] = after
+    if before is not None:
+        bounds["$lt"] = before
+    return bounds
+
+
+async def get_timeline(
+    photos,
+    user_id: str,
+    granularity: str,
+    timezone: str,
+    uploaded_after: datetime | None = None,
+    uploaded_before: datetime | None = None,
+    order: str = "desc",
+) -> Timeline:
+    match: dict = {"user_id": user_id, **NOT_DELETING}
+    bounds = date_range(uploaded_after, uploaded_before)
+    if bounds:
+        match["upload_date"] = bounds
+
+    pipeline = [
+        {"$match": match},
+        {"$project": {"_id": 0, "upload_date": 1}},
+        {
+            "$group": {
+                "_id": {"$dateTrunc": {"date": "$upload_date", "unit": granularity, "timezone": timezone}},
+                "count": {"$sum": 1},
+            }
+        },
+        {"$sort": {"_id": DESCENDING if order == "desc" else ASCENDING}},
+        {
+            "$project": {
+                "_id": 0,
+                "start": "$_id",
+                "count": 1,
+                "period": {
+                    "$dateToString": {
+                        "date": "$_id",
+                        "format": GRANULARITY_FORMATS[granularity],
+                        "timezone": timezone,
+                    }
+                },
+            }
+        },
+    ]
+    try:
+        buckets = [TimelineBucket(**doc) async for doc in photos.aggregate(pipeline)]
+    except OperationFailure as exc:
+        if exc.code == INVALID_TIMEZONE:
+            raise HTTPException(status_code=400, detail="Invalid timezone") from exc
+        raise
+
+    return Timeline(
+        granularity=granularity,
+        timezone=timezone,
+        buckets=buckets,
+        total=sum(bucket.count for bucket in buckets),
+    )
+
+
+def build_search_query(
+    user_id: str,
+    *,
+    uploaded_after: datetime | None = None,
+    uploaded_before: datetime | None = None,
+    content_types: list[str] | None = None,
+    min_size: int | None = None,
+    max_size: int | None = None,
+    text: str | None = None,
+) -> dict:
+    query: dict = {"user_id": user_id, **NOT_DELETING}
+    bounds = date_range(uploaded_after, uploaded_before)
+    if bounds:
+        query["upload_date"] = bounds
+    if content_types:
+        query["content_type"] = content_types[0] if len(content_types) == 1 else {"$in": content_types}
+    if min_size is not None and max_size is not None and min_size > max_size:
+        raise HTTPException(status_code=400, detail="min_size must not exceed max_size")
+    sizes = {}
+    if min_size is not None:
+        sizes["$gte"] = min_size
+    if max_size is not None:
+        sizes["$lte"] = max_size
+    if sizes:
+        query["size"] = sizes
+    if text:
+        # Matches whole words of the original filename ("IMG_2043.jpg" -> img, 2043, jpg).
+        query["$text"] = {"$search": text}
+    return query
+
+
+def search_sort(sort: str, order: str) -> list[tuple[str, int]]:
+    direction = DESCENDING if order == "desc" else ASCENDING
+    return [(SORT_FIELDS[sort], direction), ("_id", direction)]
+
+
+def encode_search_cursor(doc: dict, sort: str) -> str:
+    value = doc[SORT_FIELDS[sort]]
+    payload = json.dumps({"s": sort, "v": value.isoformat() if sort == "date" else value, "i": doc["_id"]})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def after_search_cursor(cursor: str, sort: str, order: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        if payload["s"] != sort:
+            raise ValueError("cursor is for another sort")
+        value = datetime.fromisoformat(payload["v"]) if sort == "date" else int(payload["v"])
+        photo_id = str(payload["i"])
+    except (ValueError, KeyError, TypeError) as exc:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from exc
+
+    field = SORT_FIELDS[sort]
+    beyond = "$lt" if order == "desc" else "$gt"
+    return {
+        "$or": [
+            {field: {beyond: value}},
+            {field: value, "_id": {beyond: photo_id}},
+        ]
+    }
@@ -0,0 +1,367 @@
+"""Near-duplicate clusters over perceptual hashes.
+
+Each user's 64-bit hashes are kept in a multi-index hash table: the hash is
+split into four 16-bit chunks, each with its own table. Two hashes within r
+bits of each other differ in at most r // 4 bits of some chunk, so finding
+every hash within r bits probes a few dozen buckets instead of scanning the
+library. (A BK-tree was tried first; over 64-bit hashes it visits most of its
+nodes once r reaches 8 and ends up slower than a linear scan.)
+
+Clusters are the connected components of "within `threshold` bits". They are
+built once per threshold with a bulk join over the chunk tables, then kept up
+to date: a new hash costs one lookup, and a removed one re-splits only its own
+component.
+
+A user's index is read from the photos collection on first use, updated by
+create/delete in this process, and re-read and diffed after
+SIMILAR_INDEX_TTL_SECONDS to pick up changes made through other replicas.
+Photos whose hash the media worker has not produced yet are "pending" and are
+re-checked on each request.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import combinations
+from typing import Iterator
+
+from services.common.logging import configure_logger
+
+
+logger = configure_logger("gallery-service.similar")
+
+CHUNKS = 4
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+# Up to here a lookup flips at most one bit per chunk: 17 probes per table.
+MAX_THRESHOLD = 7
+# Component sets kept per user; each costs a lookup per new hash.
+MAX_THRESHOLDS = 3
+# Below this size a split component is re-linked by comparing its members directly.
+SMALL_COMPONENT = 64
+BUCKETS_PER_YIELD = 2000
+PENDING_BATCH = 1000
+
+
+def flip_masks(bits: int) -> list[int]:
+    """Every chunk mask with at most `bits` bits set, the empty mask first."""
+    masks = [0]
+    for count in range(1, bits + 1):
+        for positions in combinations(range(CHUNK_BITS), count):
+            masks.append(sum(1 << position for position in positions))
+    return masks
+
+
+FLIPS = [flip_masks(bits) for bits in range(MAX_THRESHOLD // CHUNKS + 1)]
+
+
+class HashIndex:
+    """Multi-index hash table over distinct 64-bit hashes."""
+
+    def __init__(self) -> None:
+        self.tables: list[dict[int, set[int]]] = [{} for _ in range(CHUNKS)]
+
+    @staticmethod
+    def chunks(value: int) -> Iterator[tuple[int, int]]:
+        for table in range(CHUNKS):
+            yield table, (value >> (table * CHUNK_BITS)) & CHUNK_MASK
+
+    def add(self, value: int) -> None:
+        for table, chunk in self.chunks(value):
+            self.tables[table].setdefault(chunk, set()).add(value)
+
+    def remove(self, value: int) -> None:
+        for table, chunk in self.chunks(value):
+            bucket = self.tables[table].get(chunk)
+            if bucket is not None:
+                bucket.discard(value)
+                if not bucket:
+                    del self.tables[table][chunk]
+
+    def neighbors(self, value: int, radius: int) -> set[int]:
+        """Stored hashes other than `value` within `radius` bits of it."""
+        found = set()
+        masks = FLIPS[radius // CHUNKS]
+        for table, chunk in self.chunks(value):
+            buckets = self.tables[table]
+            for mask in masks:
+                bucket = buckets.get(chunk ^ mask)
+                if bucket:
+                    found.update(other for other in bucket if (other ^ value).bit_count() <= radius)
+        found.discard(value)
+        return found
+
+    def pairs(self, radius: int) -> Iterator[list[tuple[int, int]]]:
+        """All pairs of stored hashes within `radius` bits, one batch per bucket.
+
+        A pair close in several chunks is found once per chunk.
+        """
+        masks = FLIPS[radius // CHUNKS]
+        for buckets in self.tables:
+            for chunk in list(buckets):
+                bucket = buckets.get(chunk)
+                if not bucket:
+                    continue
+                found = []
+                for mask in masks:
+                    # Flipping is symmetric, so each pair of buckets is joined from its lower chunk.
+                    if chunk ^ mask < chunk:
+                        continue
+                    other = bucket if mask == 0 else buckets.get(chunk ^ mask)
+                    if not other:
+                        continue
+                    for a in bucket:
+                        for b in other:
+                            if (mask or a < b) and (a ^ b).bit_count() <= radius:
+                                found.append((a, b))
+                yield found
+
+
+class Components:
+    """Connected components of two or more hashes under "within `threshold` bits"."""
+
+    def __init__(self, threshold: int) -> None:
+        self.threshold = threshold
+        # Hash -> its (shared) component; hashes without neighbours are absent.
+        self.of: dict[int, set[int]] = {}
+
+    def link(self, a: int, b: int) -> None:
+        first = self.of.get(a) or {a}
+        second = self.of.get(b) or {b}
+        if first is second:
+            return
+        if len(first) < len(second):
+            first, second = second, first
+        first |= second
+        for value in second:
+            self.of[value] = first
+        self.of[a] = self.of[b] = first
+
+    def add(self, value: int, index: HashIndex) -> None:
+        for other in index.neighbors(value, self.threshold):
+            self.link(value, other)
+
+    def remove(self, value: int, index: HashIndex) -> None:
+        """Drop `value`, already gone from `index`, and split what it held together."""
+        component = self.of.pop(value, None)
+        if component is None:
+            return
+        component.discard(value)
+        remaining = set(component)
+        while remaining:
+            start = remaining.pop()
+            part = {start}
+            frontier = [start]
+            while frontier:
+                current = frontier.pop()
+                if len(remaining) < SMALL_COMPONENT:
+                    near = {other for other in remaining if (other ^ current).bit_count() <= self.threshold}
+                else:
+                    near = index.neighbors(current, self.threshold) & remaining
+                remaining -= near
+                part |= near
+                frontier.extend(near)
+            if len(part) == 1:
+                del self.of[start]
+            else:
+                for member in part:
+                    self.of[member] = part
+
+    def groups(self) -> list[set[int]]:
+        return list({id(component): component for component in self.of.values()}.values())
+
+
+class UserIndex:
+    def __init__(self, user_id: str) -> None:
+        self.user_id = user_id
+        self.hashes: dict[str, int] = {}
+        self.photos: dict[int, set[str]] = {}
+        self.pending: set[str] = set()
+        self.index = HashIndex()
+        self.components: OrderedDict[int, Components] = OrderedDict()
+        self.loaded_at: float | None = None
+        # Held by whatever awaits (load, build); creates and deletes meanwhile are deferred.
+        self.lock = asyncio.Lock()
+        self._deferred: list[tuple[str, str | None, bool]] | None = None
+        self._version = 0
+        self._clusters: dict[int, tuple[int, list[list[str]]]] = {}
+
+    def add(self, photo_id: str, phash: str | None) -> None:
+        if self._deferred is not None:
+            self._deferred.append((photo_id, phash, True))
+        else:
+            self._apply(photo_id, phash)
+
+    def remove(self, photo_id: str) -> None:
+        if self._deferred is not None:
+            self._deferred.append((photo_id, None, False))
+        else:
+            self._forget(photo_id)
+
+    @contextmanager
+    def _deferring(self) -> Iterator[None]:
+        self._deferred = []
+        try:
+            yield
+        finally:
+            deferred, self._deferred = self._deferred, None
+            for photo_id, phash, added in deferred:
+                if added:
+                    self._apply(photo_id, phash)
+                else:
+                    self._forget(photo_id)
+
+    def _holds(self, photo_id: str, phash: str | None) -> bool:
+        if phash is None:
+            return photo_id in self.pending
+        if not phash:
+            return photo_id not in self.pending and photo_id not in self.hashes
+        return self.hashes.get(photo_id) == int(phash, 16)
+
+    def _apply(self, photo_id: str, phash: str | None) -> None:
+        self._forget(photo_id)
+        if phash is None:
+            self.pending.add(photo_id)
+        elif phash:
+            self._add_hash(photo_id, int(phash, 16))
+
+    def _add_hash(self, photo_id: str, value: int) -> None:
+        self.hashes[photo_id] = value
+        photos = self.photos.get(value)
+        if photos is not None:
+            photos.add(photo_id)
+            return
+        self.photos[value] = {photo_id}
+        self.index.add(value)
+        for components in self.components.values():
+            components.add(value, self.index)
+
+    def _forget(self, photo_id: str) -> None:
+        self._version += 1
+        self.pending.discard(photo_id)
+        value = self.hashes.pop(photo_id, None)
+        if value is None:
+            return
+        photos = self.photos[value]
+        photos.discard(photo_id)
+        if photos:
+            return
+        del self.photos[value]
+        self.index.remove(value)
+        for components in self.components.values():
+            components.remove(value, self.index)
+
+    async def load(self, photos) -> None:
+        """Read the user's hashes and apply whatever differs from what is held."""
+        started = time.perf_counter()
+        with self._deferring():
+            current: dict[str, str | None] = {}
+            # Covered by the user_phash index.
+            async for doc in photos.find({"user_id": self.user_id}, {"phash": 1}):
+                current[doc["_id"]] = doc.get("phash")
+
+            for photo_id in (self.hashes.keys() | self.pending) - current.keys():
+                self._forget(photo_id)
+            for photo_id, phash in current.items():
+                if not self._holds(photo_id, phash):
+                    self._apply(photo_id, phash)
+
+        self.loaded_at = time.monotonic()
+        logger.info(
+            "Loaded similarity index for %s: %d hashes, %d pending in %.0f ms",
+            self.user_id,
+            len(self.hashes),
+            len(self.pending),
+            (time.perf_counter() - started) * 1000,
+        )
+
+    async def resolve_pending(self, photos) -> None:
+        pending = list(self.pending)
+        for start in range(0, len(pending), PENDING_BATCH):
+            async for doc in photos.find(
+                {"_id": {"$in": pending[start:start + PENDING_BATCH]}, "phash": {"$ne": None}},
+                {"phash": 1},
+            ):
+                if doc["_id"] in self.pending:
+                    self.add(doc["_id"], doc["phash"])
+
+    async def clusters(self, threshold: int) -> list[list[str]]:
+        """Groups of two or more photos linked by hashes within `threshold` bits, largest first."""
+        if threshold not in self.components:
+            await self._build(threshold)
+        self.components.move_to_end(threshold)
+
+        cached = self._clusters.get(threshold)
+        if cached is not None and cached[0] == self._version:
+            return cached[1]
+        components = self.components[threshold]
+        clusters = [
+            [photo_id for value in group for photo_id in self.photos[value]]
+            for group in components.groups()
+        ]
+        # Identical hashes (often the same bytes uploaded twice) with no other neighbour.
+        clusters.extend(
+            list(photo_ids) for value, photo_ids in self.photos.items()
+            if len(photo_ids) > 1 and value not in components.of
+        )
+        clusters.sort(key=len, reverse=True)
+        self._clusters[threshold] = (self._version, clusters)
+        return clusters
+
+    async def _build(self, threshold: int) -> None:
+        started = time.perf_counter()
+        with self._deferring():
+            components = Components(threshold)
+            for count, pairs in enumerate(self.index.pairs(threshold), 1):
+                for a, b in pairs:
+                    components.link(a, b)
+                if count % BUCKETS_PER_YIELD == 0:
+                    await asyncio.sleep(0)
+            self._version += 1
+            self.components[threshold] = components
+            while len(self.components) > MAX_THRESHOLDS:
+                self.components.popitem(last=False)
+        logger.info(
+            "Built threshold-%d clusters for %s over %d hashes in %.0f ms",
+            threshold,
+            self.user_id,
+            len(self.photos),
+            (time.perf_counter() - started) * 1000,
+        )
+
+
+class SimilarityIndexes:
+    """Per-user indexes, LRU-bounded to `max_users` and re-read after `ttl_seconds`."""
+
+    def __init__(self, max_users: int, ttl_seconds: float) -> None:
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self._indexes: OrderedDict[str, UserIndex] = OrderedDict()
+
+    async def clusters(self, photos, user_id: str, threshold: int) -> tuple[list[list[str]], int]:
+        """The user's clusters at `threshold` and how many photos are still pending a hash."""
+        index = self._indexes.get(user_id)
+        if index is None:
+            # Registered before loading so that creates and deletes during the scan reach it.
+            index = self._indexes[user_id] = UserIndex(user_id)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+        self._indexes.move_to_end(user_id)
+
+        async with index.lock:
+            if index.loaded_at is None or time.monotonic() - index.loaded_at > self.ttl_seconds:
+                await index.load(photos)
+            await index.resolve_pending(photos)
+            return await index.clusters(threshold), len(index.pending)
+
+    def added(self, user_id: str, photo_id: str, phash: str | None) -> None:
+        index = self._indexes.get(user_id)
+        if index is not None:
+            index.add(photo_id, phash)
+
+    def removed(self, user_id: str, photo_ids: list[str]) -> None:
+        index = self._indexes.get(user_id)
+        if index is not None:
+            for photo_id in photo_ids:
+                index.remove(photo_id)
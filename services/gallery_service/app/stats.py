@@ -0,0 +1,165 @@
+"""Materialized per-user photo counters.
+
+Run `python -m services.gallery_service.app.stats rebuild [--user USER_ID]` to
+recompute the counters from the photos collection.
+"""
+
+import argparse
+import asyncio
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+
+from services.common.logging import configure_logger
+from services.common.mongo import get_client, get_database
+from services.common.schemas import UserStats
+
+
+logger = configure_logger("gallery-service.stats")
+
+# Photos claimed by a bulk delete drop out of listings at once. The delete
+# marks them `uncounted` as it takes them off the counters, so whoever finishes
+# an abandoned claim knows whether that still has to happen.
+NOT_DELETING = {"deleting": {"$exists": False}}
+COUNTED = {"uncounted": {"$exists": False}}
+
+
+def get_stats_collection():
+    return get_database().user_stats
+
+
+def serialize_stats(user_id: str, doc: dict | None) -> UserStats:
+    doc = doc or {}
+    return UserStats(
+        user_id=user_id,
+        photo_count=doc.get("photo_count", 0),
+        total_bytes=doc.get("total_bytes", 0),
+        first_upload=doc.get("first_upload"),
+        last_upload=doc.get("last_upload"),
+    )
+
+
+async def record_upload(
+    photos,
+    user_id: str,
+    size: int,
+    upload_date: datetime,
+    count: int = 1,
+    last_upload_date: datetime | None = None,
+) -> None:
+    """Count `count` new photos totalling `size` bytes, uploaded between
+    `upload_date` and `last_upload_date` (defaults to `upload_date`).
+
+    Called after the photos are inserted: a user without counters yet (new, or
+    with photos from before the counters existed) gets them built from the
+    photos collection instead, which already includes the new ones.
+    """
+    result = await get_stats_collection().update_one(
+        {"_id": user_id},
+        {
+            "$inc": {"photo_count": count, "total_bytes": size},
+            "$min": {"first_upload": upload_date},
+            "$max": {"last_upload": last_upload_date or upload_date},
+        },
+    )
+    if result.matched_count == 0:
+        await rebuild_stats(photos, user_id)
+
+
+async def record_delete(
+    photos,
+    user_id: str,
+    size: int,
+    upload_date: datetime,
+    count: int = 1,
+    last_upload_date: datetime | None = None,
+) -> None:
+    """Uncount `count` deleted photos totalling `size` bytes, uploaded between
+    `upload_date` and `last_upload_date` (defaults to `upload_date`)."""
+    stats = get_stats_collection()
+    doc = await stats.find_one_and_update(
+        {"_id": user_id},
+        {"$inc": {"photo_count": -count, "total_bytes": -size}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not doc:
+        return
+
+    # The upload-date bounds can't be decremented; re-read them from the
+    # (user_id, upload_date) index when a deleted photo was one of them.
+    last_upload_date = last_upload_date or upload_date
+    if upload_date != doc.get("first_upload") and last_upload_date != doc.get("last_upload"):
+        return
+    remaining = {"user_id": user_id, **NOT_DELETING}
+    first = await photos.find_one(remaining, {"upload_date": 1}, sort=[("upload_date", ASCENDING)])
+    last = await photos.find_one(remaining, {"upload_date": 1}, sort=[("upload_date", DESCENDING)])
+    if first and last:
+        update = {"$set": {"first_upload": first["upload_date"], "last_upload": last["upload_date"]}}
+    else:
+        # Null would win every later $min, so drop the bounds instead.
+        update = {"$unset": {"first_upload": "", "last_upload": ""}}
+    await stats.update_one({"_id": user_id}, update)
+
+
+async def get_user_stats(photos, user_id: str) -> UserStats:
+    doc = await get_stats_collection().find_one({"_id": user_id})
+    if doc is None:
+        # Users created before the counters existed: build theirs once.
+        await rebuild_stats(photos, user_id)
+        doc = await get_stats_collection().find_one({"_id": user_id})
+    return serialize_stats(user_id, doc)
+
+
+async def rebuild_stats(photos, user_id: str | None = None) -> int:
+    match: dict = dict(COUNTED)
+    if user_id is not None:
+        match["user_id"] = user_id
+    pipeline = [{"$match": match}]
+    pipeline.append({
+        "$group": {
+            "_id": "$user_id",
+            "photo_count": {"$sum": 1},
+            "total_bytes": {"$sum": "$size"},
+            "first_upload": {"$min": "$upload_date"},
+            "last_upload": {"$max": "$upload_date"},
+        }
+    })
+
+    stats = get_stats_collection()
+    seen: list[str] = []
+    async for doc in photos.aggregate(pipeline, allowDiskUse=True):
+        await stats.replace_one({"_id": doc["_id"]}, doc, upsert=True)
+        seen.append(doc["_id"])
+
+    # Users without photos any more keep an explicit zeroed document.
+    stale = {"_id": user_id} if user_id is not None else {"_id": {"$nin": seen}}
+    if user_id is None or not seen:
+        await stats.update_many(
+            stale,
+            {
+                "$set": {"photo_count": 0, "total_bytes": 0},
+                "$unset": {"first_upload": "", "last_upload": ""},
+            },
+            upsert=user_id is not None,
+        )
+    logger.info("Rebuilt stats for %d users", len(seen))
+    return len(seen)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain per-user photo statistics.")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--user", dest="user_id", default=None, help="Only rebuild this user's stats")
+    args = parser.parse_args()
+
+    async def run() -> None:
+        try:
+            await rebuild_stats(get_database().photos, args.user_id)
+        finally:
+            get_client().close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+"""Where media-service keeps object bytes.
+
+`STORAGE_BACKEND=local` (default) stores objects on the upload volume;
+`STORAGE_BACKEND=s3` stores them in an S3-compatible bucket (AWS, MinIO, ...),
+which lets several media-service replicas run without a shared volume. Either
+way uploads are staged and variants cached under the local upload dir.
+"""
+
+import asyncio
+import math
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from stat import S_ISREG
+from typing import AsyncIterable, AsyncIterator
+
+import aiofiles
+
+from services.common.config import Settings
+from services.common.logging import configure_logger
+
+
+logger = configure_logger("media-service.backends")
+
+CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class ObjectStat:
+    size: int
+    mtime: float
+
+
+class StorageBackend(ABC):
+    """Flat namespace of immutable objects addressed by `/`-separated names."""
+
+    async def prepare(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    def local_path(self, name: str) -> Path | None:
+        """Path of the object on a local filesystem, if it has one."""
+        return None
+
+    @abstractmethod
+    async def stat(self, name: str) -> ObjectStat | None: ...
+
+    @abstractmethod
+    async def put_stream(self, name: str, chunks: AsyncIterable[bytes]) -> int:
+        """Store `chunks` under `name` and return the number of bytes written."""
+
+    async def put_file(self, name: str, path: Path) -> None:
+        """Store a staged local file under `name`, consuming the file."""
+        async def chunks() -> AsyncIterator[bytes]:
+            async with aiofiles.open(path, "rb") as file:
+                while chunk := await file.read(CHUNK_SIZE):
+                    yield chunk
+
+        await self.put_stream(name, chunks())
+        await asyncio.to_thread(path.unlink, True)
+
+    @abstractmethod
+    def get_stream(self, name: str, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+        """Yield the bytes of `name` from `start` to `end` inclusive."""
+
+    @abstractmethod
+    async def move(self, source: str, destination: str) -> bool:
+        """Rename an object. Returns False if `source` does not exist."""
+
+    @abstractmethod
+    async def delete(self, name: str) -> None: ...
+
+
+class LocalBackend(StorageBackend):
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    async def prepare(self) -> None:
+        await asyncio.to_thread(self.root.mkdir, parents=True, exist_ok=True)
+
+    def local_path(self, name: str) -> Path:
+        return self.root / name
+
+    async def stat(self, name: str) -> ObjectStat | None:
+        # A single stat() on a local disk is cheaper than a thread hop.
+        try:
+            stat = (self.root / name).stat()
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        if not S_ISREG(stat.st_mode):
+            return None
+        return ObjectStat(size=stat.st_size, mtime=stat.st_mtime)
+
+    async def put_file(self, name: str, path: Path) -> None:
+        await asyncio.to_thread(self._replace, path, self.root / name)
+
+    async def put_stream(self, name: str, chunks: AsyncIterable[bytes]) -> int:
+        destination = self.root / name
+        await asyncio.to_thread(destination.parent.mkdir, parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=destination.parent, prefix=".put-")
+        os.fchmod(fd, 0o644)
+        written = 0
+        try:
+            async with aiofiles.open(fd, "wb") as file:
+                async for chunk in chunks:
+                    await file.write(chunk)
+                    written += len(chunk)
+            await asyncio.to_thread(os.replace, temp_name, destination)
+        except BaseException:
+            await asyncio.to_thread(Path(temp_name).unlink, True)
+            raise
+        return written
+
+    async def get_stream(self, name: str, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+        async with aiofiles.open(self.root / name, "rb") as file:
+            await file.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = await file.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    async def move(self, source: str, destination: str) -> bool:
+        try:
+            await asyncio.to_thread(self._replace, self.root / source, self.root / destination)
+        except FileNotFoundError:
+            return False
+        return True
+
+    async def delete(self, name: str) -> None:
+        await asyncio.to_thread((self.root / name).unlink, True)
+
+    @staticmethod
+    def _replace(source: Path, destination: Path) -> None:
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source, destination)
+
+
+class S3Backend(StorageBackend):
+    """S3-compatible object storage through boto3.
+
+    boto3 is blocking, so calls run on a dedicated thread pool sized to the
+    client's connection pool. Large objects go up as multipart uploads with up
+    to `max_concurrency` parts in flight at once.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        *,
+        prefix: str = "",
+        endpoint_url: str | None = None,
+        region: str | None = None,
+        access_key_id: str | None = None,
+        secret_access_key: str | None = None,
+        multipart_threshold: int = 8 * 1024 * 1024,
+        part_size: int = 8 * 1024 * 1024,
+        max_concurrency: int = 8,
+        max_pool_connections: int = 32,
+    ) -> None:
+        import boto3
+        from botocore.config import Config
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.multipart_threshold = multipart_threshold
+        # S3 rejects parts under 5 MiB (except the last one).
+        self.part_size = max(part_size, 5 * 1024 * 1024)
+        self.max_concurrency = max_concurrency
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+            config=Config(
+                max_pool_connections=max_pool_connections,
+                retries={"max_attempts": 5, "mode": "standard"},
+                tcp_keepalive=True,
+            ),
+        )
+        self.executor = ThreadPoolExecutor(max_workers=max_pool_connections, thread_name_prefix="s3")
+
+    def _key(self, name: str) -> str:
+        return self.prefix + name
+
+    async def _call(self, method: str, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, lambda: getattr(self.client, method)(**kwargs)
+        )
+
+    @staticmethod
+    def _is_missing(exc: Exception) -> bool:
+        error = getattr(exc, "response", {}).get("Error", {})
+        return error.get("Code") in ("404", "NoSuchKey", "NotFound", "NoSuchBucket")
+
+    async def prepare(self) -> None:
+        from botocore.exceptions import ClientError
+
+        try:
+            await self._call("head_bucket", Bucket=self.bucket)
+        except ClientError as exc:
+            if not self._is_missing(exc):
+                raise
+            logger.info("Creating bucket %s", self.bucket)
+            await self._call("create_bucket", Bucket=self.bucket)
+
+    async def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def stat(self, name: str) -> ObjectStat | None:
+        from botocore.exceptions import ClientError
+
+        try:
+            head = await self._call("head_object", Bucket=self.bucket, Key=self._key(name))
+        except ClientError as exc:
+            if self._is_missing(exc):
+                return None
+            raise
+        return ObjectStat(size=head["ContentLength"], mtime=head["LastModified"].timestamp())
+
+    async def put_file(self, name: str, path: Path) -> None:
+        size = (await asyncio.to_thread(path.stat)).st_size
+        if size < self.multipart_threshold:
+            body = await asyncio.to_thread(path.read_bytes)
+            await self._call("put_object", Bucket=self.bucket, Key=self._key(name), Body=body)
+        else:
+            fd = await asyncio.to_thread(os.open, path, os.O_RDONLY)
+            try:
+                # Each part reads its own slice with pread, so parts upload in parallel
+                # without holding the whole file in memory.
+                async def read_part(number: int) -> bytes:
+                    offset = (number - 1) * self.part_size
+                    return await asyncio.to_thread(os.pread, fd, self.part_size, offset)
+
+                await self._multipart(name, math.ceil(size / self.part_size), read_part)
+            finally:
+                os.close(fd)
+        await asyncio.to_thread(path.unlink, True)
+
+    async def put_stream(self, name: str, chunks: AsyncIterable[bytes]) -> int:
+        key = self._key(name)
+        buffer = bytearray()
+        written = 0
+        upload_id = None
+        slots = asyncio.Semaphore(self.max_concurrency)
+        tasks: list[asyncio.Task] = []
+
+        async def send(number: int, body: bytes) -> dict:
+            try:
+                return await self._upload_part(key, upload_id, number, body)
+            finally:
+                slots.release()
+
+        try:
+            async for chunk in chunks:
+                buffer += chunk
+                written += len(chunk)
+                while len(buffer) >= self.part_size:
+                    if upload_id is None:
+                        upload_id = await self._create_multipart(key)
+                    body, buffer = bytes(buffer[:self.part_size]), buffer[self.part_size:]
+                    # Bounds memory to max_concurrency parts while keeping the pipe full.
+                    await slots.acquire()
+                    tasks.append(asyncio.create_task(send(len(tasks) + 1, body)))
+
+            if upload_id is None:
+                await self._call("put_object", Bucket=self.bucket, Key=key, Body=bytes(buffer))
+                return written
+            if buffer:
+                await slots.acquire()
+                tasks.append(asyncio.create_task(send(len(tasks) + 1, bytes(buffer))))
+            parts = await asyncio.gather(*tasks)
+            await self._complete_multipart(key, upload_id, parts)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            if upload_id is not None:
+                await self._abort_multipart(key, upload_id)
+            raise
+        return written
+
+    async def _multipart(self, name: str, part_count: int, read_part) -> None:
+        key = self._key(name)
+        upload_id = await self._create_multipart(key)
+        slots = asyncio.Semaphore(self.max_concurrency)
+
+        async def send(number: int) -> dict:
+            async with slots:
+                return await self._upload_part(key, upload_id, number, await read_part(number))
+
+        try:
+            parts = await asyncio.gather(*(send(number) for number in range(1, part_count + 1)))
+            await self._complete_multipart(key, upload_id, list(parts))
+        except BaseException:
+            await self._abort_multipart(key, upload_id)
+            raise
+
+    async def _create_multipart(self, key: str) -> str:
+        response = await self._call("create_multipart_upload", Bucket=self.bucket, Key=key)
+        return response["UploadId"]
+
+    async def _upload_part(self, key: str, upload_id: str, number: int, body: bytes) -> dict:
+        response = await self._call(
+            "upload_part",
+            Bucket=self.bucket,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=number,
+            Body=body,
+        )
+        return {"PartNumber": number, "ETag": response["ETag"]}
+
+    async def _complete_multipart(self, key: str, upload_id: str, parts: list[dict]) -> None:
+        await self._call(
+            "complete_multipart_upload",
+            Bucket=self.bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+
+    async def _abort_multipart(self, key: str, upload_id: str) -> None:
+        try:
+            await asyncio.shield(
+                self._call("abort_multipart_upload", Bucket=self.bucket, Key=key, UploadId=upload_id)
+            )
+        except Exception:
+            logger.warning("Could not abort multipart upload %s for %s", upload_id, key, exc_info=True)
+
+    async def get_stream(self, name: str, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+        params = {"Bucket": self.bucket, "Key": self._key(name)}
+        if start or end is not None:
+            params["Range"] = f"bytes={start}-{'' if end is None else end}"
+        response = await self._call("get_object", **params)
+        body = response["Body"]
+        loop = asyncio.get_running_loop()
+        try:
+            while chunk := await loop.run_in_executor(self.executor, body.read, CHUNK_SIZE):
+                yield chunk
+        finally:
+            body.close()
+
+    async def move(self, source: str, destination: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            await self._call(
+                "copy_object",
+                Bucket=self.bucket,
+                Key=self._key(destination),
+                CopySource={"Bucket": self.bucket, "Key": self._key(source)},
+            )
+        except ClientError as exc:
+            if self._is_missing(exc):
+                return False
+            raise
+        await self.delete(source)
+        return True
+
+    async def delete(self, name: str) -> None:
+        await self._call("delete_object", Bucket=self.bucket, Key=self._key(name))
+
+
+def create_backend(settings: Settings) -> StorageBackend:
+    if settings.storage_backend == "local":
+        return LocalBackend(Path(settings.upload_dir))
+    if settings.storage_backend == "s3":
+        return S3Backend(
+            settings.s3_bucket,
+            prefix=settings.s3_prefix,
+            endpoint_url=settings.s3_endpoint_url,
+            region=settings.s3_region,
+            access_key_id=settings.s3_access_key_id,
+            secret_access_key=settings.s3_secret_access_key,
+            multipart_threshold=settings.s3_multipart_threshold,
+            part_size=settings.s3_part_size,
+            max_concurrency=settings.s3_max_concurrency,
+            max_pool_connections=settings.s3_max_pool_connections,
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND {settings.storage_backend!r}")
@@ -0,0 +1,319 @@
+import hashlib
+import mmap
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+from functools import partial
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from services.common.metrics import BYTES_SERVED
+
+
+# Storage keys are never reused, so a stored object's bytes never change.
+CACHE_CONTROL = "private, max-age=31536000, immutable"
+CHUNK_SIZE = 1024 * 1024
+# Requests asking for more ranges than this get the whole file instead (RFC 9110 §14.2).
+MAX_RANGES = 16
+
+
+def build_etag(storage_key: str, size: int) -> str:
+    digest = hashlib.sha1(storage_key.encode("utf-8")).hexdigest()[:16]
+    return f'"{digest}-{size:x}"'
+
+
+def content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def _parse_http_date(value: str) -> float | None:
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def is_not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        since = _parse_http_date(if_modified_since)
+        return since is not None and int(mtime) <= since
+    return False
+
+
+def _if_range_matches(request: Request, etag: str, mtime: float) -> bool:
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+    if if_range.strip().startswith(('"', "W/")):
+        return if_range.strip() == etag
+    since = _parse_http_date(if_range)
+    return since is not None and int(mtime) <= since
+
+
+def parse_range(header: str, size: int) -> list[tuple[int, int]] | None:
+    """Parse a `bytes=` Range header into inclusive (start, end) pairs.
+
+    Returns None when the header should be ignored and the full body served.
+    Raises a 416 when none of the requested ranges overlap the file.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges: list[tuple[int, int]] = []
+    for item in spec.split(","):
+        first, sep, last = item.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if not first:
+                suffix = int(last)
+                if suffix <= 0:
+                    continue
+                start, end = max(size - suffix, 0), size - 1
+            else:
+                start = int(first)
+                end = int(last) if last else size - 1
+        except ValueError:
+            return None
+        if last and start > end:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+
+    if not ranges:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+class RangedResponse(Response):
+    """Whole bodies, single ranges or multipart/byteranges; subclasses supply the bytes."""
+
+    source = "local"
+
+    def __init__(
+        self,
+        size: int,
+        *,
+        status_code: int = 200,
+        ranges: list[tuple[int, int]] | None = None,
+        media_type: str,
+        headers: dict[str, str],
+    ) -> None:
+        self.size = size
+        self.status_code = status_code
+        self.background = None
+        self.ranges = ranges or ([(0, size - 1)] if size else [])
+        self.part_headers: list[bytes] = []
+        self.trailer = b""
+
+        if status_code == 206 and len(self.ranges) > 1:
+            boundary = secrets.token_hex(12)
+            self.media_type = f"multipart/byteranges; boundary={boundary}"
+            self.part_headers = [
+                (
+                    f"--{boundary}\r\nContent-Type: {media_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+                ).encode("latin-1")
+                for start, end in self.ranges
+            ]
+            self.trailer = f"--{boundary}--\r\n".encode("latin-1")
+            length = sum(len(h) + (end - start + 1) + 2 for h, (start, end) in zip(self.part_headers, self.ranges))
+            length += len(self.trailer)
+        else:
+            self.media_type = media_type
+            length = sum(end - start + 1 for start, end in self.ranges)
+            if status_code == 206:
+                start, end = self.ranges[0]
+                headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+        headers["Content-Length"] = str(length)
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or not self.ranges:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        await self.send_body(scope, send)
+
+    async def send_body(self, scope: Scope, send: Send) -> None:
+        raise NotImplementedError
+
+    async def send_parts(self, send: Send, send_range: Callable[[int, int], Awaitable[None]]) -> None:
+        bytes_served = BYTES_SERVED.labels(self.source)
+        for index, (start, end) in enumerate(self.ranges):
+            if self.part_headers:
+                prefix = b"\r\n" if index else b""
+                await send({
+                    "type": "http.response.body",
+                    "body": prefix + self.part_headers[index],
+                    "more_body": True,
+                })
+            await send_range(start, end)
+            bytes_served.inc(end - start + 1)
+        closing = b"\r\n" + self.trailer if self.part_headers else b""
+        await send({"type": "http.response.body", "body": closing, "more_body": False})
+
+
+class MediaFileResponse(RangedResponse):
+    """Serves a local file without buffering.
+
+    Uses the ASGI `http.response.zerocopysend` extension (sendfile) when the server
+    offers it, and otherwise hands the server memoryviews over an mmap of the file
+    so bytes are never copied into Python-level chunks.
+    """
+
+    def __init__(self, path: Path, size: int, **kwargs) -> None:
+        self.path = path
+        super().__init__(size, **kwargs)
+
+    async def send_body(self, scope: Scope, send: Send) -> None:
+        zerocopy = "http.response.zerocopysend" in scope.get("extensions", {})
+        with open(self.path, "rb") as file:
+            mapped = None if zerocopy else mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+            async def send_range(start: int, end: int) -> None:
+                if zerocopy:
+                    await send({
+                        "type": "http.response.zerocopysend",
+                        "file": file,
+                        "offset": start,
+                        "count": end - start + 1,
+                        "more_body": True,
+                    })
+                else:
+                    await self._send_mapped(send, mapped, start, end)
+
+            try:
+                await self.send_parts(send, send_range)
+            finally:
+                if mapped is not None:
+                    try:
+                        mapped.close()
+                    except BufferError:
+                        # The server still holds a view on a pending write; the
+                        # mapping is released once that buffer is dropped.
+                        pass
+
+    @staticmethod
+    async def _send_mapped(send: Send, mapped: mmap.mmap, start: int, end: int) -> None:
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            aligned = start - start % mmap.PAGESIZE
+            mapped.madvise(mmap.MADV_SEQUENTIAL, aligned, end + 1 - aligned)
+        view = memoryview(mapped)
+        try:
+            for offset in range(start, end + 1, CHUNK_SIZE):
+                chunk = view[offset:min(offset + CHUNK_SIZE, end + 1)]
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        finally:
+            view.release()
+
+
+class MediaStreamResponse(RangedResponse):
+    """Serves an object from a storage backend, fetching each range as a stream."""
+
+    source = "backend"
+
+    def __init__(self, read_range: Callable[[int, int], AsyncIterator[bytes]], size: int, **kwargs) -> None:
+        self.read_range = read_range
+        super().__init__(size, **kwargs)
+
+    async def send_body(self, scope: Scope, send: Send) -> None:
+        async def send_range(start: int, end: int) -> None:
+            async for chunk in self.read_range(start, end):
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+        await self.send_parts(send, send_range)
+
+
+def ranged_response(
+    request: Request,
+    storage_key: str,
+    size: int,
+    mtime: float,
+    download_name: str,
+    build: Callable[..., RangedResponse],
+    media_type: str,
+) -> Response:
+    etag = build_etag(storage_key, size)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(mtime, usegmt=True),
+        "Cache-Control": CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+
+    if is_not_modified(request, etag, mtime):
+        return Response(status_code=304, headers=headers)
+
+    headers["Content-Disposition"] = content_disposition(download_name)
+
+    range_header = request.headers.get("range")
+    if range_header and size and _if_range_matches(request, etag, mtime):
+        ranges = parse_range(range_header, size)
+        if ranges is not None:
+            return build(size=size, status_code=206, ranges=ranges, media_type=media_type, headers=headers)
+
+    return build(size=size, media_type=media_type, headers=headers)
+
+
+def file_response(
+    request: Request,
+    path: Path,
+    storage_key: str,
+    media_type: str,
+    download_name: str,
+) -> Response:
+    stat = path.stat()
+    return ranged_response(
+        request,
+        storage_key,
+        stat.st_size,
+        stat.st_mtime,
+        download_name,
+        partial(MediaFileResponse, path),
+        media_type,
+    )
+
+
+def stream_response(
+    request: Request,
+    read_range: Callable[[int, int], AsyncIterator[bytes]],
+    storage_key: str,
+    size: int,
+    mtime: float,
+    media_type: str,
+    download_name: str,
+) -> Response:
+    return ranged_response(
+        request,
+        storage_key,
+        size,
+        mtime,
+        download_name,
+        partial(MediaStreamResponse, read_range),
+        media_type,
+    )
@@ -0,0 +1,118 @@
+"""Layout metadata read from an image when it is ingested.
+
+Dimensions, EXIF orientation and capture time come from the headers alone.
+The BlurHash placeholder comes from a decode of at most PLACEHOLDER_SIZE
+pixels a side; JPEGs get there through the decoder's DCT scaling (draft
+mode), so even large photos are never fully decoded. Everything here runs in
+the media process pool.
+"""
+
+import math
+from datetime import datetime
+
+
+PLACEHOLDER_SIZE = 32
+BLURHASH_COMPONENTS = (4, 3)
+
+ORIENTATION_TAG = 0x0112
+DATETIME_TAG = 0x0132
+EXIF_IFD = 0x8769
+DATETIME_ORIGINAL_TAG = 0x9003
+# Orientations 5-8 rotate by 90 degrees, swapping width and height on display.
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+SRGB_TO_LINEAR = [
+    value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+    for value in (channel / 255 for channel in range(256))
+]
+
+
+def read_image_info(source: str) -> dict:
+    """Width and height as displayed, orientation, capture time and BlurHash of `source`."""
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        width, height = image.size
+        exif = image.getexif()
+        orientation = exif.get(ORIENTATION_TAG)
+        if orientation in TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+        captured_at = parse_exif_datetime(exif.get_ifd(EXIF_IFD).get(DATETIME_ORIGINAL_TAG) or exif.get(DATETIME_TAG))
+
+        image.draft("RGB", (PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.Resampling.BILINEAR)
+        small = image.convert("RGB")
+
+    return {
+        "width": width,
+        "height": height,
+        "orientation": orientation,
+        "captured_at": captured_at,
+        "blurhash": blurhash(list(small.getdata()), small.width, small.height),
+    }
+
+
+def parse_exif_datetime(value) -> datetime | None:
+    if not isinstance(value, str):
+        return None
+    try:
+        # "YYYY:MM:DD HH:MM:SS", local time of the camera; some writers pad with NULs.
+        return datetime.strptime(value.strip("\x00 ")[:19], "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+
+
+def _base83(value: int, length: int) -> str:
+    return "".join(BASE83[(value // 83 ** (length - index - 1)) % 83] for index in range(length))
+
+
+def _linear_to_srgb(value: float) -> int:
+    value = min(max(value, 0.0), 1.0)
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash(pixels: list[tuple[int, int, int]], width: int, height: int) -> str:
+    """Encode RGB `pixels` (row-major) as a BlurHash string (https://blurha.sh)."""
+    x_components, y_components = BLURHASH_COMPONENTS
+    linear = [(SRGB_TO_LINEAR[r], SRGB_TO_LINEAR[g], SRGB_TO_LINEAR[b]) for r, g, b in pixels]
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(x_components)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(y_components)]
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            r = g = b = 0.0
+            for y in range(height):
+                row = y * width
+                basis_y = cos_y[j][y]
+                for x in range(width):
+                    basis = cos_x[i][x] * basis_y
+                    pr, pg, pb = linear[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = (1 if i == j == 0 else 2) / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    encoded = _base83((x_components - 1) + (y_components - 1) * 9, 1)
+    if ac:
+        quantised_max = max(0, min(82, int(max(abs(c) for factor in ac for c in factor) * 166 - 0.5)))
+        maximum = (quantised_max + 1) / 166
+        encoded += _base83(quantised_max, 1)
+    else:
+        maximum = 1.0
+        encoded += _base83(0, 1)
+    encoded += _base83((_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4)
+
+    def quantise(value: float) -> int:
+        scaled = math.copysign(abs(value / maximum) ** 0.5, value)
+        return max(0, min(18, int(math.floor(scaled * 9 + 9.5))))
+
+    for r, g, b in ac:
+        encoded += _base83(quantise(r) * 19 * 19 + quantise(g) * 19 + quantise(b), 2)
+    return encoded
@@ -1,26 +1,88 @@
-import os
-import uuid
+import asyncio
+import multiprocessing
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 
-import aiofiles
-from fastapi import FastAPI, File, HTTPException, Query, UploadFile
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from pymongo.errors import PyMongoError
 
 from services.common.config import get_settings
+from services.common.jobs import Worker, create_job_queue
 from services.common.logging import configure_logger
-from services.common.schemas import MediaUploadResponse, ServiceHealth
+from services.common.metrics import UPLOAD_SIZE, instrument_app
+from services.common.mongo import lifespan
+from services.common.schemas import (
+    MediaBatchUploadResponse,
+    MediaBatchUploadResult,
+    MediaDeleteRequest,
+    MediaDeleteResponse,
+    MediaLocation,
+    MediaUploadResponse,
+    ServiceHealth,
+)
+from services.common.tracing import trace_app
+
+from .backends import create_backend
+from .delivery import file_response, stream_response
+from .imageinfo import read_image_info
+from .storage import ContentStore, StoredObject
+from .tasks import PHASH_JOB, VARIANTS_JOB, create_handlers
+from .uploads import RejectedUpload, StagedUpload, iter_uploads, stage_upload
+from .variants import VARIANT_FORMATS, VariantStore, pick_size
 
 
 settings = get_settings()
 logger = configure_logger("media-service")
 
 
-def get_upload_dir() -> Path:
-    path = Path(settings.upload_dir)
-    path.mkdir(parents=True, exist_ok=True)
-    return path
+content_store = ContentStore(Path(settings.upload_dir), create_backend(settings))
+variant_store = VariantStore(
+    Path(settings.upload_dir),
+    sizes=settings.variant_sizes,
+    max_bytes=settings.variant_cache_bytes,
+)
+job_queue = create_job_queue(settings)
+
+
+@asynccontextmanager
+async def media_lifespan(app):
+    async with lifespan(app):
+        await content_store.prepare()
+        # Spawned workers keep the pool independent of the event loop's threads.
+        variant_store.executor = ProcessPoolExecutor(
+            max_workers=settings.variant_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        await variant_store.load_index()
+        await job_queue.ensure_indexes()
+        stop = asyncio.Event()
+        worker_task = None
+        app.state.worker = None
+        if settings.job_worker_embedded:
+            # Small deployments can skip the separate worker process.
+            app.state.worker = worker = Worker(
+                job_queue,
+                create_handlers(content_store, variant_store),
+                executor=variant_store.executor,
+                concurrency=settings.job_concurrency,
+                poll_interval=settings.job_poll_seconds,
+            )
+            worker_task = asyncio.create_task(worker.run(stop))
+        try:
+            yield
+        finally:
+            stop.set()
+            if worker_task is not None:
+                await worker_task
+            variant_store.executor.shutdown(wait=False, cancel_futures=True)
+            await content_store.backend.close()
 
-app = FastAPI(title="Photure Media Service", version="0.1.0")
+
+app = FastAPI(title="Photure Media Service", version="0.1.0", lifespan=media_lifespan)
+instrument_app(app)
+trace_app(app, "media-service")
 
 
 @app.get("/health", response_model=ServiceHealth)
@@ -32,56 +94,268 @@ async def health() -> ServiceHealth:
     )
 
 
+async def store_staged(staged: StagedUpload) -> MediaUploadResponse:
+    storage_key = staged.sha256
+    try:
+        info = await probe_image(staged.path)
+        deduplicated = await content_store.commit(staged.path, staged.sha256, staged.size)
+    finally:
+        staged.path.unlink(missing_ok=True)
+
+    UPLOAD_SIZE.observe(staged.size)
+    logger.info(
+        "Stored media %s (%s bytes%s)",
+        storage_key,
+        staged.size,
+        ", deduplicated" if deduplicated else "",
+    )
+    if not deduplicated:
+        await enqueue_processing(storage_key)
+
+    return MediaUploadResponse(
+        storage_key=storage_key,
+        filename=staged.filename or storage_key,
+        content_type=staged.content_type or "application/octet-stream",
+        size=staged.size,
+        checksum=staged.sha256,
+        **info,
+    )
+
+
+async def probe_image(path: Path) -> dict:
+    """Layout metadata for the gallery; headers plus a tiny draft decode, on the process pool."""
+    try:
+        return await asyncio.get_running_loop().run_in_executor(variant_store.executor, read_image_info, str(path))
+    except Exception as exc:
+        # Not an image, or one Pillow cannot read; it is still stored, just without layout hints.
+        logger.warning("Could not read image info from %s: %s", path.name, exc)
+        return {}
+
+
+async def enqueue_processing(storage_key: str) -> None:
+    jobs = [(PHASH_JOB, {"storage_key": storage_key})]
+    if settings.eager_variant_sizes:
+        jobs.append((VARIANTS_JOB, {"storage_key": storage_key, "sizes": settings.eager_variant_sizes}))
+    for kind, payload in jobs:
+        try:
+            await job_queue.enqueue(kind, payload, idempotency_key=f"{kind}:{storage_key}")
+        except PyMongoError:
+            # Variants are also rendered on first request and missing hashes can be
+            # backfilled (see tasks.py), so the upload still succeeds.
+            logger.warning("Could not queue %s job for %s", kind, storage_key, exc_info=True)
+
+
 @app.post("/media/upload", response_model=MediaUploadResponse)
-async def upload_media(file: UploadFile = File(...)) -> MediaUploadResponse:
-    if not file.content_type or not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="Only image files are allowed")
+async def upload_media(request: Request) -> MediaUploadResponse:
+    staged = await stage_upload(request, content_store.staging_dir, settings.max_upload_bytes)
+    return await store_staged(staged)
 
-    contents = await file.read()
-    if len(contents) > settings.max_upload_bytes:
-        raise HTTPException(status_code=413, detail="File exceeds max upload size")
 
-    extension = Path(file.filename).suffix if file.filename else ""
-    storage_key = f"{uuid.uuid4()}{extension}"
-    destination = get_upload_dir() / storage_key
+@app.post("/media/upload/batch", response_model=MediaBatchUploadResponse)
+async def upload_media_batch(request: Request) -> MediaBatchUploadResponse:
+    """Store every `files` part of a multipart request, with per-file results.
 
-    async with aiofiles.open(destination, "wb") as buffer:
-        await buffer.write(contents)
+    Files are committed concurrently (up to UPLOAD_BATCH_CONCURRENCY at a time)
+    while later parts are still being received.
+    """
+    slots = asyncio.Semaphore(settings.upload_batch_concurrency)
 
-    logger.info("Stored media %s (%s bytes)", storage_key, len(contents))
+    async def store(staged: StagedUpload) -> MediaUploadResponse:
+        async with slots:
+            return await store_staged(staged)
 
-    return MediaUploadResponse(
-        storage_key=storage_key,
-        filename=file.filename or storage_key,
-        content_type=file.content_type or "application/octet-stream",
-        size=len(contents),
+    uploads = iter_uploads(
+        request,
+        content_store.staging_dir,
+        settings.max_upload_bytes,
+        field_name="files",
+        max_files=settings.max_batch_files,
     )
+    entries: list[RejectedUpload | tuple[StagedUpload, asyncio.Task]] = []
+    try:
+        async for upload in uploads:
+            if isinstance(upload, RejectedUpload):
+                entries.append(upload)
+            else:
+                entries.append((upload, asyncio.create_task(store(upload))))
+    except BaseException:
+        # The caller never learns these keys, so release whatever was stored.
+        tasks = [entry[1] for entry in entries if isinstance(entry, tuple)]
+        for stored in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(stored, MediaUploadResponse):
+                await content_store.release(stored.storage_key)
+        raise
+    finally:
+        await uploads.aclose()
+
+    results = []
+    for entry in entries:
+        if isinstance(entry, RejectedUpload):
+            results.append(MediaBatchUploadResult(
+                filename=entry.filename,
+                status_code=entry.status_code,
+                detail=entry.detail,
+            ))
+            continue
+        staged, task = entry
+        try:
+            media = await task
+        except Exception:
+            logger.exception("Failed to store %s", staged.filename)
+            results.append(MediaBatchUploadResult(
+                filename=staged.filename,
+                status_code=500,
+                detail="Failed to store file",
+            ))
+        else:
+            results.append(MediaBatchUploadResult(filename=staged.filename, status_code=200, media=media))
+
+    if not results:
+        raise HTTPException(status_code=400, detail="Missing 'files' file parts")
+    return MediaBatchUploadResponse(results=results)
+
+
+async def resolve_media(storage_key: str) -> StoredObject:
+    stored = await content_store.resolve(storage_key)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Media not found")
+    return stored
+
+
+@app.get("/internal/jobs")
+async def job_stats() -> dict:
+    stats = await job_queue.stats()
+    if app.state.worker is not None:
+        stats["worker"] = app.state.worker.stats()
+    return stats
 
 
 @app.get("/media/{storage_key}")
 async def fetch_media(
     storage_key: str,
+    request: Request,
     download_name: str | None = Query(default=None),
     content_type: str | None = Query(default=None),
+    size: int | None = Query(default=None, ge=1),
+    variant_format: str = Query(default="jpeg", alias="format", pattern="^(webp|jpeg)$"),
 ):
-    file_path = get_upload_dir() / storage_key
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="Media not found")
+    stored = await resolve_media(storage_key)
+
+    variant_size = pick_size(size, settings.variant_sizes) if size else None
+    if variant_size is not None:
+        try:
+            variant_path = await variant_store.get(
+                stored.object_id,
+                partial(content_store.local_copy, stored),
+                variant_size,
+                variant_format,
+            )
+        except Exception:
+            # Formats Pillow cannot decode are served as the original.
+            logger.warning("Falling back to original for %s", storage_key, exc_info=True)
+        else:
+            return file_response(
+                request,
+                variant_path,
+                f"{stored.object_id}/{variant_size}.{variant_format}",
+                media_type=VARIANT_FORMATS[variant_format],
+                download_name=download_name or storage_key,
+            )
+
+    media_type = content_type or "application/octet-stream"
+    path = content_store.backend.local_path(stored.name)
+    if path is not None:
+        return file_response(request, path, stored.object_id, media_type, download_name or storage_key)
+    return stream_response(
+        request,
+        partial(content_store.backend.get_stream, stored.name),
+        stored.object_id,
+        stored.stat.size,
+        stored.stat.mtime,
+        media_type,
+        download_name or storage_key,
+    )
+
+
+@app.get("/media/{storage_key}/locate", response_model=MediaLocation)
+async def locate_media(
+    storage_key: str,
+    content_type: str | None = Query(default=None),
+    size: int | None = Query(default=None, ge=1),
+    variant_format: str = Query(default="jpeg", alias="format", pattern="^(webp|jpeg)$"),
+) -> MediaLocation:
+    """Return where an object (or a variant of it, rendered if needed) lives,
+    relative to the upload dir.
+
+    Used when nginx serves files straight from the volume (X-Accel-Redirect).
+    """
+    stored = await resolve_media(storage_key)
+    upload_dir = content_store.root
+    path = content_store.backend.local_path(stored.name)
+    if path is None:
+        raise HTTPException(status_code=409, detail="Media is not stored on a shared volume")
 
-    return FileResponse(
-        file_path,
-        media_type=content_type or "application/octet-stream",
-        filename=download_name or storage_key,
+    variant_size = pick_size(size, settings.variant_sizes) if size else None
+    if variant_size is not None:
+        try:
+            variant_path = await variant_store.get(
+                stored.object_id,
+                partial(content_store.local_copy, stored),
+                variant_size,
+                variant_format,
+            )
+        except Exception:
+            logger.warning("Falling back to original for %s", storage_key, exc_info=True)
+        else:
+            return MediaLocation(
+                path=variant_path.relative_to(upload_dir).as_posix(),
+                content_type=VARIANT_FORMATS[variant_format],
+                size=variant_path.stat().st_size,
+            )
+
+    return MediaLocation(
+        path=path.relative_to(upload_dir).as_posix(),
+        content_type=content_type,
+        size=stored.stat.size,
     )
 
 
+async def release_media(storage_key: str) -> StoredObject | None:
+    stored = await content_store.release(storage_key)
+    if stored is not None:
+        if stored.removed:
+            await variant_store.remove(stored.object_id)
+        logger.info("Released media %s%s", storage_key, " (object removed)" if stored.removed else "")
+    return stored
+
+
 @app.delete("/media/{storage_key}")
 async def delete_media(storage_key: str):
-    file_path = get_upload_dir() / storage_key
-    if file_path.exists():
-        os.remove(file_path)
-        logger.info("Deleted media %s", storage_key)
-        return {"deleted": True}
+    if await release_media(storage_key) is None:
+        raise HTTPException(status_code=404, detail="Media not found")
+    return {"deleted": True}
+
 
-    raise HTTPException(status_code=404, detail="Media not found")
+@app.post("/media/delete", response_model=MediaDeleteResponse)
+async def delete_media_batch(payload: MediaDeleteRequest) -> MediaDeleteResponse:
+    """Release many storage keys, up to MEDIA_DELETE_CONCURRENCY at a time."""
+    slots = asyncio.Semaphore(settings.media_delete_concurrency)
 
+    async def release(storage_key: str) -> StoredObject | None:
+        async with slots:
+            return await release_media(storage_key)
+
+    outcomes = await asyncio.gather(
+        *(release(storage_key) for storage_key in payload.storage_keys),
+        return_exceptions=True,
+    )
+    response = MediaDeleteResponse(deleted=0, not_found=0)
+    for storage_key, outcome in zip(payload.storage_keys, outcomes):
+        if isinstance(outcome, BaseException):
+            logger.error("Failed to release media %s", storage_key, exc_info=outcome)
+            response.failed.append(storage_key)
+        elif outcome is None:
+            response.not_found += 1
+        else:
+            response.deleted += 1
+    return response
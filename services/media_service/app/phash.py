@@ -0,0 +1,53 @@
+"""Perceptual hashes of stored images, for near-duplicate detection.
+
+A 64-bit difference hash (dHash) changes little under re-encoding, resizing
+and small edits, so near-duplicates sit within a few bits of each other in
+Hamming distance. Hashes are computed by the "phash" job and kept per storage
+key in `media_hashes`; the same bytes always hash the same, so entries outlive
+the objects they were computed from. Each is also copied onto the photos that
+reference the key, where gallery-service indexes them.
+"""
+
+from datetime import datetime
+
+from services.common.mongo import get_database
+
+
+HASH_SIZE = 8
+# Stored for content that is not a decodable image, so nobody waits for it.
+UNHASHABLE = ""
+
+
+def dhash(source: str) -> str:
+    """Hex dHash of the image at `source`; runs in the job pool."""
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        image.draft("L", (HASH_SIZE * 4, HASH_SIZE * 4))
+        image = ImageOps.exif_transpose(image)
+        pixels = list(image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS).getdata())
+
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for column in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return f"{value:016x}"
+
+
+def get_hashes_collection():
+    return get_database().media_hashes
+
+
+async def record_phash(storage_key: str, phash: str) -> None:
+    await get_hashes_collection().update_one(
+        {"_id": storage_key},
+        {"$set": {"phash": phash, "hashed_at": datetime.utcnow()}},
+        upsert=True,
+    )
+    # Photos created before the hash existed; gallery-service looks the hash up
+    # itself for photos created after this point.
+    await get_database().photos.update_many(
+        {"storage_key": storage_key, "phash": None},
+        {"$set": {"phash": phash}},
+    )
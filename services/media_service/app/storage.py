@@ -0,0 +1,238 @@
+"""Content-addressed media storage with reference counting.
+
+Objects live at `objects/<h[0:2]>/<h[2:4]>/<sha256>` in the storage backend and
+their reference counts in the `media_objects` collection, so identical bytes
+are stored once. Storage keys handed out before this layout existed (UUID file
+names in the flat upload dir) resolve through the `media_aliases` collection
+once migrated:
+
+    python -m services.media_service.app.storage migrate [--batch N]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import re
+import secrets
+import tempfile
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator
+
+import aiofiles
+from pymongo import ReturnDocument
+
+from services.common.config import get_settings
+from services.common.logging import configure_logger
+from services.common.mongo import get_client, get_database
+
+from .backends import ObjectStat, StorageBackend, create_backend
+
+
+logger = configure_logger("media-service.storage")
+
+OBJECTS_DIR = "objects"
+STAGING_DIR = ".staging"
+DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+ALIAS_CACHE_SIZE = 10_000
+
+
+@dataclass
+class StoredObject:
+    name: str
+    object_id: str
+    digest: str | None
+    stat: ObjectStat
+    removed: bool = False
+
+
+def is_digest(storage_key: str) -> bool:
+    return DIGEST_RE.match(storage_key) is not None
+
+
+def object_name(digest: str) -> str:
+    return f"{OBJECTS_DIR}/{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+class ContentStore:
+    def __init__(self, root: Path, backend: StorageBackend) -> None:
+        self.root = root
+        self.backend = backend
+        self.staging_dir = root / STAGING_DIR
+        self._aliases: OrderedDict[str, str] = OrderedDict()
+
+    @property
+    def objects(self):
+        return get_database().media_objects
+
+    @property
+    def aliases(self):
+        return get_database().media_aliases
+
+    async def prepare(self) -> None:
+        await asyncio.to_thread(self.staging_dir.mkdir, parents=True, exist_ok=True)
+        await self.backend.prepare()
+
+    async def commit(self, staged_path: Path, digest: str, size: int) -> bool:
+        """Take a reference on `digest`, moving the staged file in if the object is missing.
+
+        Returns True when the bytes were already stored and the upload was deduplicated.
+        """
+        await self.objects.update_one(
+            {"_id": digest},
+            {"$inc": {"refs": 1}, "$setOnInsert": {"size": size}},
+            upsert=True,
+        )
+        # Check the object rather than the previous refcount: a concurrent release
+        # may have moved it aside even though the document survived.
+        name = object_name(digest)
+        if await self.backend.stat(name) is not None:
+            await asyncio.to_thread(staged_path.unlink, True)
+            return True
+        await self.backend.put_file(name, staged_path)
+        return False
+
+    async def resolve(self, storage_key: str) -> StoredObject | None:
+        if is_digest(storage_key):
+            digest = storage_key
+        else:
+            digest = await self._alias(storage_key)
+
+        if digest is not None:
+            name = object_name(digest)
+            stat = await self.backend.stat(name)
+            return StoredObject(name, digest, digest, stat) if stat is not None else None
+
+        # Not migrated yet: still a flat file at the top of the store.
+        if Path(storage_key).name != storage_key or storage_key.startswith("."):
+            return None
+        stat = await self.backend.stat(storage_key)
+        return StoredObject(storage_key, storage_key, None, stat) if stat is not None else None
+
+    @asynccontextmanager
+    async def local_copy(self, stored: StoredObject) -> AsyncIterator[Path]:
+        """Yield a local path with the object's bytes, downloading it if needed."""
+        path = self.backend.local_path(stored.name)
+        if path is not None:
+            yield path
+            return
+
+        fd, temp_name = tempfile.mkstemp(dir=self.staging_dir, prefix=".copy-")
+        try:
+            async with aiofiles.open(fd, "wb") as file:
+                async for chunk in self.backend.get_stream(stored.name):
+                    await file.write(chunk)
+            yield Path(temp_name)
+        finally:
+            await asyncio.to_thread(Path(temp_name).unlink, True)
+
+    async def release(self, storage_key: str) -> StoredObject | None:
+        """Drop one reference; delete the object when it was the last one.
+
+        Returns the released object (with `removed` set if its bytes are gone),
+        or None if the key did not resolve.
+        """
+        stored = await self.resolve(storage_key)
+        if stored is None:
+            return None
+
+        if stored.digest is None:
+            await self.backend.delete(stored.name)
+            stored.removed = True
+            return stored
+
+        if not is_digest(storage_key):
+            await self.aliases.delete_one({"_id": storage_key})
+            self._aliases.pop(storage_key, None)
+
+        doc = await self.objects.find_one_and_update(
+            {"_id": stored.digest},
+            {"$inc": {"refs": -1}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is None or doc["refs"] > 0:
+            return stored
+
+        # Move the object aside before dropping its document so an upload that
+        # revives it in between re-creates the object instead of losing it.
+        directory, _, filename = stored.name.rpartition("/")
+        tombstone = f"{directory}/.{filename}.{secrets.token_hex(4)}"
+        if not await self.backend.move(stored.name, tombstone):
+            return stored
+        result = await self.objects.delete_one({"_id": stored.digest, "refs": {"$lte": 0}})
+        if result.deleted_count == 0:
+            if await self.backend.stat(stored.name) is None:
+                await self.backend.move(tombstone, stored.name)
+                return stored
+        else:
+            stored.removed = True
+        await self.backend.delete(tombstone)
+        return stored
+
+    async def _alias(self, storage_key: str) -> str | None:
+        digest = self._aliases.get(storage_key)
+        if digest is not None:
+            self._aliases.move_to_end(storage_key)
+            return digest
+
+        doc = await self.aliases.find_one({"_id": storage_key})
+        if doc is None:
+            return None
+        self._aliases[storage_key] = doc["digest"]
+        if len(self._aliases) > ALIAS_CACHE_SIZE:
+            self._aliases.popitem(last=False)
+        return doc["digest"]
+
+    async def migrate_legacy(self, batch: int = 100) -> int:
+        """Move flat UUID-named files from the upload dir into the content store,
+        keeping their keys as aliases. Also copies them into S3 when that backend is active.
+        """
+        await self.prepare()
+        legacy = [path for path in self.root.iterdir() if path.is_file() and not path.name.startswith(".")]
+        migrated = 0
+        for start in range(0, len(legacy), batch):
+            for path in legacy[start:start + batch]:
+                digest, size = await asyncio.to_thread(_hash_file, path)
+                await self.aliases.update_one(
+                    {"_id": path.name},
+                    {"$setOnInsert": {"digest": digest}},
+                    upsert=True,
+                )
+                await self.commit(path, digest, size)
+                migrated += 1
+            logger.info("Migrated %d/%d legacy media files", migrated, len(legacy))
+        return migrated
+
+
+def _hash_file(path: Path) -> tuple[str, int]:
+    hasher = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as file:
+        while chunk := file.read(1024 * 1024):
+            hasher.update(chunk)
+            size += len(chunk)
+    return hasher.hexdigest(), size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain the content-addressed media store.")
+    parser.add_argument("command", choices=["migrate"])
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args()
+
+    async def run() -> None:
+        settings = get_settings()
+        store = ContentStore(Path(settings.upload_dir), create_backend(settings))
+        try:
+            await store.migrate_legacy(args.batch)
+        finally:
+            await store.backend.close()
+            get_client().close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Background jobs for media-service.
+
+Uploads enqueue these instead of doing the work on the request path; they run
+in `python -m services.media_service.app.worker` or, with
+JOB_WORKER_EMBEDDED=true, inside media-service itself. Photos stored before
+perceptual hashing existed can be queued with:
+
+    python -m services.media_service.app.tasks backfill-phash
+
+and photos stored before dimensions and placeholders were recorded with
+`backfill-image-info`.
+"""
+
+import argparse
+import asyncio
+from functools import partial
+
+from services.common.jobs import Handler, create_job_queue
+from services.common.logging import configure_logger
+from services.common.mongo import get_client, get_database
+from services.common.schemas import ImageInfo
+
+from .imageinfo import read_image_info
+from .phash import UNHASHABLE, dhash, get_hashes_collection, record_phash
+from .storage import ContentStore
+from .variants import VariantStore
+
+
+logger = configure_logger("media-service.tasks")
+
+VARIANTS_JOB = "variants"
+PHASH_JOB = "phash"
+IMAGE_INFO_JOB = "image_info"
+
+
+def create_handlers(content_store: ContentStore, variant_store: VariantStore) -> dict[str, Handler]:
+    async def render_variants(payload: dict) -> None:
+        stored = await content_store.resolve(payload["storage_key"])
+        if stored is None:
+            # Deleted before the job ran.
+            return
+        # Rendering itself runs on variant_store.executor.
+        await variant_store.generate(
+            stored.object_id,
+            partial(content_store.local_copy, stored),
+            payload["sizes"],
+        )
+
+    async def compute_phash(payload: dict) -> None:
+        stored = await content_store.resolve(payload["storage_key"])
+        if stored is None:
+            return
+        async with content_store.local_copy(stored) as source:
+            try:
+                phash = await asyncio.get_running_loop().run_in_executor(variant_store.executor, dhash, str(source))
+            except OSError:
+                # Not an image Pillow can decode (UnidentifiedImageError is an OSError).
+                phash = UNHASHABLE
+        await record_phash(payload["storage_key"], phash)
+
+    async def record_image_info(payload: dict) -> None:
+        stored = await content_store.resolve(payload["storage_key"])
+        if stored is None:
+            return
+        async with content_store.local_copy(stored) as source:
+            try:
+                info = await asyncio.get_running_loop().run_in_executor(
+                    variant_store.executor, read_image_info, str(source)
+                )
+            except OSError:
+                info = {}
+        # Explicit nulls for undecodable content, so the backfill does not pick it up again.
+        fields = ImageInfo(**info).model_dump()
+        await get_database().photos.update_many(
+            {"storage_key": payload["storage_key"], "width": {"$exists": False}},
+            {"$set": fields},
+        )
+
+    return {VARIANTS_JOB: render_variants, PHASH_JOB: compute_phash, IMAGE_INFO_JOB: record_image_info}
+
+
+async def backfill_phash(batch: int = 1000) -> int:
+    """Hash every storage key that photos reference without a hash.
+
+    Keys hashed already just have the hash copied onto their photos.
+    """
+    queue = create_job_queue()
+    await queue.ensure_indexes()
+    queued = 0
+    keys: list[str] = []
+
+    async def flush() -> None:
+        nonlocal queued
+        known = {doc["_id"]: doc["phash"] async for doc in get_hashes_collection().find({"_id": {"$in": keys}})}
+        for storage_key in keys:
+            if storage_key in known:
+                await record_phash(storage_key, known[storage_key])
+                continue
+            await queue.enqueue(PHASH_JOB, {"storage_key": storage_key}, idempotency_key=f"{PHASH_JOB}:{storage_key}")
+            queued += 1
+        keys.clear()
+
+    async for doc in get_database().photos.aggregate([
+        {"$match": {"phash": None}},
+        {"$group": {"_id": "$storage_key"}},
+    ], allowDiskUse=True):
+        keys.append(doc["_id"])
+        if len(keys) >= batch:
+            await flush()
+    if keys:
+        await flush()
+    logger.info("Queued %d phash jobs", queued)
+    return queued
+
+
+async def backfill_image_info() -> int:
+    """Queue an image_info job for every storage key whose photos predate image info."""
+    queue = create_job_queue()
+    await queue.ensure_indexes()
+    queued = 0
+    async for doc in get_database().photos.aggregate([
+        {"$match": {"width": {"$exists": False}}},
+        {"$group": {"_id": "$storage_key"}},
+    ], allowDiskUse=True):
+        storage_key = doc["_id"]
+        await queue.enqueue(
+            IMAGE_INFO_JOB,
+            {"storage_key": storage_key},
+            idempotency_key=f"{IMAGE_INFO_JOB}:{storage_key}",
+        )
+        queued += 1
+    logger.info("Queued %d image_info jobs", queued)
+    return queued
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain media-service background jobs.")
+    parser.add_argument("command", choices=["backfill-phash", "backfill-image-info"])
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+
+    async def run() -> None:
+        try:
+            if args.command == "backfill-phash":
+                await backfill_phash(args.batch)
+            else:
+                await backfill_image_info()
+        finally:
+            get_client().close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator
+
+import aiofiles
+from fastapi import HTTPException, Request
+from multipart.multipart import MultipartParser, parse_options_header
+
+
+# Headroom for multipart boundaries and part headers when pre-checking Content-Length.
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+@dataclass
+class StagedUpload:
+    path: Path
+    filename: str | None
+    content_type: str | None
+    size: int
+    sha256: str
+
+
+@dataclass
+class _Part:
+    headers: dict[bytes, bytes] = field(default_factory=dict)
+    name: str | None = None
+    filename: str | None = None
+    content_type: str | None = None
+
+
+class _Events:
+    """Collects parser callbacks so they can be handled with `await` between chunks."""
+
+    def __init__(self) -> None:
+        self.items: list[tuple[str, bytes]] = []
+        self._header_field = b""
+        self._header_value = b""
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": lambda: self.items.append(("begin", b"")),
+            "on_part_data": lambda data, start, end: self.items.append(("data", bytes(data[start:end]))),
+            "on_part_end": lambda: self.items.append(("end", b"")),
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": lambda: self.items.append(("headers", b"")),
+        }
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self.items.append(("header", self._header_field.lower() + b"\0" + self._header_value))
+        self._header_field = b""
+        self._header_value = b""
+
+    def drain(self) -> list[tuple[str, bytes]]:
+        items, self.items = self.items, []
+        return items
+
+
+@dataclass
+class RejectedUpload:
+    filename: str | None
+    status_code: int
+    detail: str
+
+
+async def iter_uploads(
+    request: Request,
+    directory: Path,
+    max_bytes: int,
+    field_name: str = "file",
+    max_files: int = 1,
+) -> AsyncIterator[StagedUpload | RejectedUpload]:
+    """Stream each `field_name` part of a multipart request into a temp file in `directory`.
+
+    Parts are yielded as soon as they are complete, so callers can process one
+    file while the next is still arriving. The per-file size limit is enforced
+    while reading, so an oversized file is rejected without buffering it, and
+    the SHA-256 is computed on the way through. Files that are rejected are
+    yielded as RejectedUpload and the rest of the request is still read.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data upload")
+
+    content_length = request.headers.get("content-length")
+    if content_length and int(content_length) > max_files * (max_bytes + MULTIPART_OVERHEAD_BYTES):
+        raise HTTPException(status_code=413, detail="File exceeds max upload size")
+
+    events = _Events()
+    parser = MultipartParser(boundary, events.callbacks())
+
+    part: _Part | None = None
+    target = None
+    temp_path: Path | None = None
+    hasher = hashlib.sha256()
+    size = 0
+    files = 0
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for kind, data in events.drain():
+                if kind == "begin":
+                    part = _Part()
+                elif kind == "header":
+                    name, _, value = data.partition(b"\0")
+                    part.headers[name] = value
+                elif kind == "headers":
+                    _, disposition = parse_options_header(part.headers.get(b"content-disposition", b""))
+                    part.name = disposition.get(b"name", b"").decode("utf-8", "replace")
+                    if b"filename" in disposition:
+                        part.filename = disposition[b"filename"].decode("utf-8", "replace")
+                    part.content_type = part.headers.get(b"content-type", b"").decode("latin-1") or None
+
+                    if part.name != field_name:
+                        continue
+                    files += 1
+                    if files > max_files:
+                        yield RejectedUpload(part.filename, 413, f"At most {max_files} files per upload")
+                        continue
+                    if not part.content_type or not part.content_type.startswith("image/"):
+                        yield RejectedUpload(part.filename, 400, "Only image files are allowed")
+                        continue
+                    fd, name = tempfile.mkstemp(dir=directory, prefix=".upload-")
+                    # mkstemp creates 0600 files; stored media must stay world-readable.
+                    os.fchmod(fd, 0o644)
+                    os.close(fd)
+                    temp_path = Path(name)
+                    target = await aiofiles.open(temp_path, "wb")
+                    hasher = hashlib.sha256()
+                    size = 0
+                elif kind == "data" and target is not None:
+                    size += len(data)
+                    if size > max_bytes:
+                        await target.close()
+                        target = None
+                        temp_path.unlink(missing_ok=True)
+                        temp_path = None
+                        yield RejectedUpload(part.filename, 413, "File exceeds max upload size")
+                        continue
+                    hasher.update(data)
+                    await target.write(data)
+                elif kind == "end" and target is not None:
+                    await target.close()
+                    target = None
+                    staged = StagedUpload(
+                        path=temp_path,
+                        filename=part.filename,
+                        content_type=part.content_type,
+                        size=size,
+                        sha256=hasher.hexdigest(),
+                    )
+                    # From here on the caller owns the file.
+                    temp_path = None
+                    yield staged
+        parser.finalize()
+    finally:
+        if target is not None:
+            await target.close()
+        if temp_path is not None:
+            temp_path.unlink(missing_ok=True)
+
+
+async def stage_upload(
+    request: Request,
+    directory: Path,
+    max_bytes: int,
+    field_name: str = "file",
+) -> StagedUpload:
+    """Stage the single `field_name` file of a multipart request; see iter_uploads."""
+    uploads = iter_uploads(request, directory, max_bytes, field_name)
+    try:
+        async for upload in uploads:
+            if isinstance(upload, RejectedUpload):
+                raise HTTPException(status_code=upload.status_code, detail=upload.detail)
+            return upload
+    finally:
+        await uploads.aclose()
+    raise HTTPException(status_code=400, detail=f"Missing '{field_name}' file part")
@@ -0,0 +1,177 @@
+import asyncio
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import Executor
+from contextlib import AbstractAsyncContextManager, nullcontext
+from functools import partial
+from pathlib import Path
+from typing import Callable
+
+from services.common.logging import configure_logger
+
+
+logger = configure_logger("media-service.variants")
+
+VARIANT_DIR = ".variants"
+VARIANT_FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg"}
+VARIANT_QUALITY = 82
+
+SourceOpener = Callable[[], AbstractAsyncContextManager[Path]]
+
+
+def pick_size(requested: int, sizes: list[int]) -> int | None:
+    """Snap a requested width to the smallest configured variant that covers it."""
+    for size in sorted(sizes):
+        if size >= requested:
+            return size
+    return None
+
+
+def render_variant(source: str, destination: str, size: int, fmt: str, quality: int) -> int:
+    """Downscale `source` to fit a `size` box and write it to `destination`.
+
+    Runs inside the process pool, so it imports Pillow lazily and only touches
+    the filesystem. Returns the number of bytes written.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        # Let the JPEG decoder skip DCT work for scales we are going to throw away.
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        if fmt == "jpeg" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        directory = os.path.dirname(destination)
+        fd, temp_name = tempfile.mkstemp(dir=directory, prefix=".render-")
+        os.fchmod(fd, 0o644)
+        try:
+            with os.fdopen(fd, "wb") as output:
+                image.save(output, format=fmt.upper(), quality=quality, optimize=fmt == "jpeg")
+            os.replace(temp_name, destination)
+        except BaseException:
+            os.unlink(temp_name)
+            raise
+    return os.path.getsize(destination)
+
+
+class VariantStore:
+    """Resized copies of originals, cached on disk under a size budget with LRU eviction.
+
+    The index and the budget belong to this process: other processes sharing the
+    volume (replicas, the job worker) keep their own and may evict files this
+    one still lists, so a hit is checked against the disk.
+    """
+
+    def __init__(self, upload_dir: Path, sizes: list[int], max_bytes: int) -> None:
+        self.root = upload_dir / VARIANT_DIR
+        self.sizes = sizes
+        self.max_bytes = max_bytes
+        self.executor: Executor | None = None
+        self._index: OrderedDict[Path, int] = OrderedDict()
+        self._total_bytes = 0
+        self._inflight: dict[Path, asyncio.Future] = {}
+
+    def path_for(self, storage_key: str, size: int, fmt: str) -> Path:
+        return self.root / storage_key / f"{size}.{fmt}"
+
+    async def load_index(self) -> None:
+        entries = await asyncio.to_thread(self._scan)
+        for path, size, _ in sorted(entries, key=lambda item: item[2]):
+            self._index[path] = size
+            self._total_bytes += size
+        logger.info("Indexed %d variants (%d bytes)", len(self._index), self._total_bytes)
+
+    def _scan(self) -> list[tuple[Path, int, float]]:
+        self.root.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for path in self.root.glob("*/*"):
+            if path.name.startswith("."):
+                continue
+            stat = path.stat()
+            entries.append((path, stat.st_size, stat.st_atime))
+        return entries
+
+    async def get(self, storage_key: str, open_source: SourceOpener, size: int, fmt: str) -> Path:
+        """Return the variant's path, rendering it from the original on a miss.
+
+        `open_source` yields a local path to the original; it is only entered on a
+        miss, since fetching the original may mean a download from object storage.
+        """
+        path = self.path_for(storage_key, size, fmt)
+        if path in self._index:
+            if path.exists():
+                self._index.move_to_end(path)
+                return path
+            self._total_bytes -= self._index.pop(path)
+
+        pending = self._inflight.get(path)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[path] = future
+        try:
+            # Another worker process sharing the volume may already have rendered it.
+            written = await asyncio.to_thread(self._prepare, path)
+            if written is None:
+                async with open_source() as source:
+                    written = await asyncio.get_running_loop().run_in_executor(
+                        self.executor,
+                        render_variant,
+                        str(source),
+                        str(path),
+                        size,
+                        fmt,
+                        VARIANT_QUALITY,
+                    )
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # Nobody else may be waiting; don't warn about an unretrieved exception.
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(path, None)
+
+        self._record(path, written)
+        future.set_result(path)
+        return path
+
+    @staticmethod
+    def _prepare(path: Path) -> int | None:
+        try:
+            return path.stat().st_size
+        except FileNotFoundError:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            return None
+
+    async def generate(self, storage_key: str, open_source: SourceOpener, sizes: list[int]) -> None:
+        # Open the original once for all eager variants.
+        async with open_source() as source:
+            for size in sizes:
+                for fmt in VARIANT_FORMATS:
+                    try:
+                        await self.get(storage_key, partial(nullcontext, source), size, fmt)
+                    except Exception:
+                        logger.warning("Could not render %s variant %s/%s", storage_key, size, fmt, exc_info=True)
+                        return
+
+    async def remove(self, storage_key: str) -> None:
+        directory = self.root / storage_key
+        for path in [path for path in self._index if path.parent == directory]:
+            self._total_bytes -= self._index.pop(path)
+        await asyncio.to_thread(shutil.rmtree, directory, True)
+
+    def _record(self, path: Path, size: int) -> None:
+        self._total_bytes += size - self._index.pop(path, 0)
+        self._index[path] = size
+        while self._total_bytes > self.max_bytes and len(self._index) > 1:
+            victim, victim_size = self._index.popitem(last=False)
+            self._total_bytes -= victim_size
+            victim.unlink(missing_ok=True)
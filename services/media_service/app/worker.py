@@ -0,0 +1,72 @@
+"""Run media-service's background jobs outside the API process.
+
+    python -m services.media_service.app.worker
+
+Shares the upload volume (or bucket) and MongoDB with media-service. Metrics
+are served on JOB_METRICS_PORT; SIGTERM lets running jobs finish first.
+"""
+
+import asyncio
+import signal
+from pathlib import Path
+
+from prometheus_client import start_http_server
+
+from services.common.config import get_settings
+from services.common.jobs import Worker, create_executor, create_job_queue
+from services.common.logging import configure_logger
+from services.common.mongo import get_client
+
+from .backends import create_backend
+from .storage import ContentStore
+from .tasks import create_handlers
+from .variants import VariantStore
+
+
+logger = configure_logger("media-service.worker")
+
+
+async def run() -> None:
+    settings = get_settings()
+    content_store = ContentStore(Path(settings.upload_dir), create_backend(settings))
+    variant_store = VariantStore(
+        Path(settings.upload_dir),
+        sizes=settings.variant_sizes,
+        max_bytes=settings.variant_cache_bytes,
+    )
+    executor = create_executor(settings)
+    # CPU-bound rendering goes to the job pool.
+    variant_store.executor = executor
+    queue = create_job_queue(settings)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    try:
+        await content_store.prepare()
+        await variant_store.load_index()
+        await queue.ensure_indexes()
+        worker = Worker(
+            queue,
+            create_handlers(content_store, variant_store),
+            executor=executor,
+            concurrency=settings.job_concurrency,
+            poll_interval=settings.job_poll_seconds,
+        )
+        await worker.run(stop)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        await content_store.backend.close()
+        get_client().close()
+    logger.info("Worker stopped")
+
+
+def main() -> None:
+    start_http_server(get_settings().job_metrics_port)
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import pytest
+
+
+@pytest.fixture
+def memory_mongo():
+    """Point the shared Motor client at an in-memory mongomock database."""
+    from mongomock_motor import AsyncMongoMockClient
+
+    import services.common.mongo as mongo
+
+    previous = mongo._client
+    mongo._client = AsyncMongoMockClient()
+    yield mongo._client
+    mongo._client = previous
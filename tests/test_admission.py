@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from services.api_gateway.app.admission import (
+    AdmissionController,
+    ConcurrencyLimiter,
+    MemoryBucketStore,
+    RateLimit,
+)
+
+
+def make_controller(burst: int = 10) -> AdmissionController:
+    return AdmissionController(
+        MemoryBucketStore(),
+        rate_limits={"upload": RateLimit(rate=0.01, burst=burst)},
+        limiters={"upload": ConcurrencyLimiter("upload", 0, 0, 0)},
+        max_wait=0,
+    )
+
+
+async def upload(admission: AdmissionController, files: int) -> None:
+    async with admission.admit("upload", "u1"):
+        await admission.charge("upload", "u1", files - 1)
+
+
+def uploads_admitted(admission: AdmissionController, files: int) -> int:
+    async def scenario() -> int:
+        admitted = 0
+        while True:
+            try:
+                await upload(admission, files)
+            except HTTPException as exc:
+                assert exc.status_code == 429
+                return admitted
+            admitted += 1
+
+    return asyncio.run(scenario())
+
+
+def test_single_uploads_use_one_token_each():
+    assert uploads_admitted(make_controller(), files=1) == 10
+
+
+def test_batch_uses_a_token_per_file():
+    assert uploads_admitted(make_controller(), files=5) == 2
+
+
+def test_charge_never_refuses_but_throttles_what_follows():
+    admission = make_controller()
+
+    async def scenario() -> None:
+        await upload(admission, files=50)
+        with pytest.raises(HTTPException) as refused:
+            await upload(admission, files=1)
+        assert int(refused.value.headers["Retry-After"]) > 1
+
+    asyncio.run(scenario())
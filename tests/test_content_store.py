@@ -0,0 +1,44 @@
+import asyncio
+import hashlib
+
+from services.media_service.app.backends import LocalBackend
+from services.media_service.app.storage import ContentStore, object_name
+
+
+def test_dedup_takes_a_reference_and_last_release_removes_the_object(memory_mongo, tmp_path):
+    data = b"same bytes"
+    digest = hashlib.sha256(data).hexdigest()
+    store = ContentStore(tmp_path, LocalBackend(tmp_path))
+    stored_path = tmp_path / object_name(digest)
+
+    def staged(name: str):
+        path = store.staging_dir / name
+        path.write_bytes(data)
+        return path
+
+    async def refs() -> int | None:
+        doc = await store.objects.find_one({"_id": digest})
+        return doc["refs"] if doc else None
+
+    async def scenario() -> None:
+        await store.prepare()
+        assert await store.commit(staged("first"), digest, len(data)) is False
+        second = staged("second")
+        assert await store.commit(second, digest, len(data)) is True
+        assert not second.exists()
+        assert await refs() == 2
+
+        released = await store.release(digest)
+        assert not released.removed
+        assert await refs() == 1
+        assert stored_path.read_bytes() == data
+
+        released = await store.release(digest)
+        assert released.removed
+        assert await refs() is None
+        assert not stored_path.exists()
+        # The tombstone it was moved aside to is gone too.
+        assert list(stored_path.parent.iterdir()) == []
+        assert await store.resolve(digest) is None
+
+    asyncio.run(scenario())
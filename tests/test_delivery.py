@@ -0,0 +1,76 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+
+from services.media_service.app.delivery import file_response
+
+
+DATA = b"0123456789"
+
+
+@pytest.fixture
+def app(tmp_path):
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(DATA)
+    app = FastAPI()
+
+    @app.get("/media")
+    async def media(request: Request):
+        return file_response(request, path, "key", "image/jpeg", "photo.jpg")
+
+    return app
+
+
+def get(app, **headers) -> httpx.Response:
+    async def send() -> httpx.Response:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://media") as http:
+            return await http.get("/media", headers=headers)
+
+    return asyncio.run(send())
+
+
+def test_suffix_ranges(app):
+    response = get(app, range="bytes=-4")
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 6-9/10"
+    assert response.content == b"6789"
+
+    # A suffix longer than the file is the whole file.
+    response = get(app, range="bytes=-100")
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 0-9/10"
+    assert response.content == DATA
+
+
+def test_overlapping_ranges_are_served_as_parts(app):
+    response = get(app, range="bytes=0-4,3-6")
+    assert response.status_code == 206
+    assert response.headers["content-type"].startswith("multipart/byteranges; boundary=")
+    assert int(response.headers["content-length"]) == len(response.content)
+    body = response.content.decode("latin-1")
+    assert "Content-Range: bytes 0-4/10\r\n\r\n01234\r\n" in body
+    assert "Content-Range: bytes 3-6/10\r\n\r\n3456\r\n" in body
+
+
+def test_unsatisfiable_range(app):
+    response = get(app, range="bytes=20-30,-0")
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */10"
+
+
+def test_conditional_requests(app):
+    etag = get(app).headers["etag"]
+
+    response = get(app, range="bytes=0-1", **{"if-none-match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    # A stale If-Range gets the whole, current file.
+    response = get(app, range="bytes=0-1", **{"if-range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == DATA
+    response = get(app, range="bytes=0-1", **{"if-range": etag})
+    assert response.status_code == 206
+    assert response.content == b"01"
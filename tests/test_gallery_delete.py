@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from services.common.schemas import CreatePhotoRequest, DeletePhotosRequest
+from services.gallery_service.app import main as gallery
+
+
+def create(name: str) -> str:
+    payload = CreatePhotoRequest(
+        storage_key=name,
+        filename=name,
+        original_name=name,
+        content_type="image/jpeg",
+        size=100,
+        user_id="u1",
+    )
+    return asyncio.run(gallery.create_photo(payload)).id
+
+
+def listed() -> set[str]:
+    page = asyncio.run(gallery.list_photos(skip=0, limit=100, cursor=None, user_id="u1"))
+    return {photo.id for photo in page.photos}
+
+
+def claim(photo_id: str, age: timedelta) -> None:
+    # A bulk delete that claimed the photo and stopped before uncounting it.
+    asyncio.run(gallery.get_collection().update_one(
+        {"_id": photo_id},
+        {"$set": {"deleting": "other-request", "deleting_at": datetime.utcnow() - age}},
+    ))
+
+
+def photo_count() -> int:
+    return asyncio.run(gallery.user_stats(user_id="u1")).photo_count
+
+
+def test_abandoned_claims_are_taken_over_and_claimed_photos_hidden(memory_mongo):
+    abandoned, live, free = create("a.jpg"), create("b.jpg"), create("c.jpg")
+    claim(abandoned, gallery.DELETE_CLAIM_TIMEOUT + timedelta(minutes=1))
+    claim(live, timedelta(seconds=1))
+
+    assert listed() == {free}
+
+    result = asyncio.run(gallery.delete_photos(
+        DeletePhotosRequest(ids=[abandoned, live, free]),
+        user_id="u1",
+    ))
+    assert {photo.id for photo in result.deleted} == {abandoned, free}
+    assert result.not_found == [live]
+    # The abandoned claim never got to uncount its photo, so the take-over did.
+    assert photo_count() == 1
+
+    # Once the live claim expires too, a retry finishes it.
+    claim(live, gallery.DELETE_CLAIM_TIMEOUT + timedelta(minutes=1))
+    result = asyncio.run(gallery.delete_photos(DeletePhotosRequest(ids=[live]), user_id="u1"))
+    assert [photo.id for photo in result.deleted] == [live]
+    assert asyncio.run(gallery.get_collection().count_documents({})) == 0
+    assert photo_count() == 0
+
+
+def test_taken_over_photos_already_uncounted_are_not_uncounted_again(memory_mongo):
+    abandoned, kept = create("a.jpg"), create("b.jpg")
+    claim(abandoned, gallery.DELETE_CLAIM_TIMEOUT + timedelta(minutes=1))
+    # The claiming request uncounted the photo, then died before deleting it.
+    photo = asyncio.run(gallery.get_collection().find_one_and_update(
+        {"_id": abandoned},
+        {"$set": {"uncounted": True}},
+    ))
+    asyncio.run(gallery.record_delete(gallery.get_collection(), "u1", photo["size"], photo["upload_date"]))
+    assert photo_count() == 1
+
+    result = asyncio.run(gallery.delete_photos(DeletePhotosRequest(ids=[abandoned]), user_id="u1"))
+    assert [photo.id for photo in result.deleted] == [abandoned]
+    assert photo_count() == 1
+    assert listed() == {kept}
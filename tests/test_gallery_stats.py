@@ -0,0 +1,26 @@
+import asyncio
+from datetime import datetime
+
+from services.common.schemas import CreatePhotoRequest
+from services.gallery_service.app import main as gallery
+
+
+def test_first_upload_counts_photos_from_before_the_counters(memory_mongo):
+    asyncio.run(gallery.get_collection().insert_many([
+        {"_id": f"legacy-{n}", "user_id": "u1", "size": 100, "upload_date": datetime(2020, 1, n + 1)}
+        for n in range(3)
+    ]))
+
+    asyncio.run(gallery.create_photo(CreatePhotoRequest(
+        storage_key="new.jpg",
+        filename="new.jpg",
+        original_name="new.jpg",
+        content_type="image/jpeg",
+        size=50,
+        user_id="u1",
+    )))
+
+    stats = asyncio.run(gallery.user_stats(user_id="u1"))
+    assert stats.photo_count == 4
+    assert stats.total_bytes == 350
+    assert stats.first_upload == datetime(2020, 1, 1)
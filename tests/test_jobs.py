@@ -0,0 +1,33 @@
+import asyncio
+
+from services.common.jobs import DONE, FAILED, QUEUED, JobQueue
+
+
+def test_failed_job_expires_and_is_requeued_by_its_idempotency_key(memory_mongo):
+    queue = JobQueue(max_attempts=1)
+
+    async def scenario() -> None:
+        await queue.ensure_indexes()
+        job_id = await queue.enqueue("phash", {"storage_key": "k"}, idempotency_key="phash:k")
+        job = await queue.claim(["phash"], "worker")
+        assert not await queue.fail(job, "boom")
+
+        failed = await queue.collection.find_one({"_id": job_id})
+        assert failed["status"] == FAILED
+        assert failed["expire_at"] > failed["finished_at"]
+
+        # A backfill queues the same key again: the failed job runs again.
+        assert await queue.enqueue("phash", {"storage_key": "k"}, idempotency_key="phash:k") == job_id
+        requeued = await queue.collection.find_one({"_id": job_id})
+        assert requeued["status"] == QUEUED
+        assert requeued["attempts_left"] == 1
+        assert "expire_at" not in requeued and "error" not in requeued
+
+        job = await queue.claim(["phash"], "worker")
+        assert job.id == job_id
+        assert await queue.complete(job)
+        # Done jobs keep deduplicating.
+        assert await queue.enqueue("phash", {"storage_key": "k"}, idempotency_key="phash:k") == job_id
+        assert (await queue.collection.find_one({"_id": job_id}))["status"] == DONE
+
+    asyncio.run(scenario())
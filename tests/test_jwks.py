@@ -0,0 +1,42 @@
+import asyncio
+import json
+
+import httpx
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from services.auth_service.app.jwks import JWKSStore
+from services.common.config import Settings
+
+
+def rotated_jwks(kid: str) -> dict:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048).public_key()
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(key))
+    return {"keys": [{**jwk, "kid": kid, "use": "sig", "alg": "RS256"}]}
+
+
+def burst(jwks: dict, tokens: int = 20) -> int:
+    fetches = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal fetches
+        fetches += 1
+        await asyncio.sleep(0.02)
+        return httpx.Response(200, json=jwks)
+
+    async def scenario() -> None:
+        store = JWKSStore(Settings(clerk_secret_key="sk_test", clerk_jwks_url="http://clerk/jwks"))
+        token = jwt.encode({"sub": "user"}, "test-only-hmac-secret-of-32-bytes!", algorithm="HS256", headers={"kid": "rotated"})
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            await asyncio.gather(*(store.ensure_key(token, client) for _ in range(tokens)))
+
+    asyncio.run(scenario())
+    return fetches
+
+
+def test_unknown_kid_burst_fetches_once_when_key_appears():
+    assert burst(rotated_jwks("rotated")) == 1
+
+
+def test_unknown_kid_burst_fetches_once_when_key_stays_unknown():
+    assert burst(rotated_jwks("previous")) == 1
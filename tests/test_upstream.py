@@ -0,0 +1,93 @@
+import asyncio
+
+import httpx
+import pytest
+
+from services.common.upstream import CircuitBreaker, CircuitOpenError, UpstreamClient
+
+
+def make_client(handler, reset_timeout: float = 0.05) -> UpstreamClient:
+    return UpstreamClient(
+        "test",
+        "http://upstream",
+        limits=httpx.Limits(max_connections=10),
+        timeout=httpx.Timeout(5),
+        retries=0,
+        breaker=CircuitBreaker(failure_threshold=1, reset_timeout=reset_timeout),
+        transport=httpx.MockTransport(handler),
+    )
+
+
+def test_cancelled_half_open_probe_does_not_wedge_breaker():
+    mode = {"value": "fail"}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if mode["value"] == "fail":
+            raise httpx.ConnectError("down", request=request)
+        if mode["value"] == "hang":
+            await asyncio.sleep(60)
+        return httpx.Response(200)
+
+    async def scenario() -> None:
+        client = make_client(handler)
+        with pytest.raises(httpx.ConnectError):
+            await client.get("/")
+        assert client.breaker.state == CircuitBreaker.OPEN
+
+        await asyncio.sleep(0.06)
+        mode["value"] = "hang"
+        probe = asyncio.create_task(client.get("/"))
+        await asyncio.sleep(0.01)
+        assert client.breaker.state == CircuitBreaker.HALF_OPEN
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        mode["value"] = "ok"
+        response = await client.get("/")
+        assert response.status_code == 200
+        assert client.breaker.state == CircuitBreaker.CLOSED
+        await client.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_lost_probe_is_rearmed_after_reset_timeout():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker._opened_at -= 1
+    assert breaker.allow()
+    # The probe never reports back; others are rejected until the timeout passes again.
+    assert not breaker.allow()
+    breaker._probed_at -= 1
+    assert breaker.allow()
+
+
+def test_failing_request_body_does_not_count_against_upstream():
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        return httpx.Response(200)
+
+    async def body():
+        yield b"partial"
+        # What a relayed request.stream() raises when the client disconnects.
+        raise RuntimeError("client disconnected")
+
+    async def scenario() -> None:
+        client = make_client(handler, reset_timeout=60)
+        with pytest.raises(RuntimeError):
+            await client.post("/", content=body())
+        assert client.breaker.state == CircuitBreaker.CLOSED
+
+        # A probe that fails the same way hands its slot to the next caller.
+        client.breaker.record_failure()
+        client.breaker._opened_at -= 120
+        with pytest.raises(RuntimeError):
+            await client.post("/", content=body())
+        assert client.breaker.state == CircuitBreaker.HALF_OPEN
+        response = await client.get("/")
+        assert response.status_code == 200
+        assert client.breaker.state == CircuitBreaker.CLOSED
+        await client.aclose()
+
+    asyncio.run(scenario())
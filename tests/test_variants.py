@@ -0,0 +1,48 @@
+import asyncio
+from contextlib import nullcontext
+from functools import partial
+
+from PIL import Image
+
+from services.media_service.app.variants import VariantStore
+
+
+def test_load_index_over_existing_variants(tmp_path):
+    source = tmp_path / "original.jpg"
+    Image.new("RGB", (800, 600), (40, 120, 200)).save(source)
+
+    async def scenario() -> None:
+        first = VariantStore(tmp_path, [256], max_bytes=10 * 1024 * 1024)
+        await first.load_index()
+        rendered = await first.get("key", partial(nullcontext, source), 256, "jpeg")
+        assert rendered.exists()
+
+        # A restarted media-service indexes what is already on disk.
+        restarted = VariantStore(tmp_path, [256], max_bytes=10 * 1024 * 1024)
+        await restarted.load_index()
+        assert restarted._total_bytes == rendered.stat().st_size
+
+        def unused_source():
+            raise AssertionError("cached variant was rendered again")
+
+        assert await restarted.get("key", unused_source, 256, "jpeg") == rendered
+
+    asyncio.run(scenario())
+
+
+def test_variant_evicted_by_another_process_is_rendered_again(tmp_path):
+    source = tmp_path / "original.jpg"
+    Image.new("RGB", (800, 600), (40, 120, 200)).save(source)
+
+    async def scenario() -> None:
+        store = VariantStore(tmp_path, [256], max_bytes=10 * 1024 * 1024)
+        await store.load_index()
+        rendered = await store.get("key", partial(nullcontext, source), 256, "jpeg")
+
+        # Another process sharing the volume evicted it; this index still lists it.
+        rendered.unlink()
+        assert await store.get("key", partial(nullcontext, source), 256, "jpeg") == rendered
+        assert rendered.exists()
+        assert store._total_bytes == rendered.stat().st_size
+
+    asyncio.run(scenario())